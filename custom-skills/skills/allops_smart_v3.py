@@ -8,18 +8,72 @@ allops_smart_v3.py - 二模型协作的智能决策编排器（简化加速版
 - Qwen3-Max 直接看截图 + 结合任务目标和历史步骤做决策
 - GUI-plus 只负责把 target_description 精确变成坐标，然后用 cliclick 执行
 - 保留中文输入支持（剪贴板 + Cmd+V）
+- 截图与输入走可插拔后端（GUI_BACKEND=macos | x11 | sim），可在 Linux/Xvfb 或模拟桌面上运行
+- 输入成批下发（移动+点击、粘贴+回车一次调用），macOS 下进程内直接注入事件，不再每个动作起一个子进程
+- 设置 TRAJECTORY_RECORD 可把整次运行录制成轨迹包，用 trajectory.py 离线回放
+- 每一步按阶段埋点（截图 / 编码 / 大脑 / 定位 / 输入 / 等待），输出 JSON lines 并汇总 p50/p95
+- 引用了可见文字的目标先用本地 OCR 定位，匹配明确时不请求 GUI-plus
+- GUI-plus 两段式定位：低分辨率整帧找大致区域，再用高分辨率裁剪图精确定位（大脑可直接提示区域）
+- 模型输出流式增量解析：action + parameters（或 x / y）一完整就执行，不等 thought；格式错误提前重试
+- 截图只编码一次（窗口裁剪 + 缩放 + JPEG/WebP），大脑和定位共用
+- 截图直接进内存（Frame），缩略图 / 指纹 / 各种编码按需计算一次，不再写临时文件读回
+- 用帧差检测页面稳定，代替固定 sleep
+- 定位结果按画面指纹缓存，重复定位同一元素时跳过 GUI-plus
+- 多步计划里的多个目标在同一帧上一次 GUI-plus 请求批量定位，结果写入定位缓存
+- 模型调用走共享的长连接网关（model_gateway），带超时、重试与耗时统计
+- 历史步骤按 token 预算压缩（最近几步原文 + 更早步骤摘要）
+- 大脑可一次返回多步计划，执行器按检查点验证后连续执行，偏离时才重新规划
+- 决策分层路由：明显的后续步骤走规则，其余先问小模型，置信度不够或验证失败才升级到 qwen3-max
+- 成功的轨迹按目标模板保存成宏，再次执行同类目标时画面对得上就直接重放，偏离时才调用大脑
 """
 
 import os
 import sys
 import time
 import json
-import base64
-import subprocess
-from openai import OpenAI
-
-# DashScope 兼容模式 API Key
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "sk-xxxxxxxxxx")
+from collections.abc import Callable
+
+from decision_router import CASCADE, DecisionRouter
+from gui_backend import get_backend
+from history_manager import HistoryManager, estimate_tokens
+from location_cache import LocationCache
+from macro_cache import MACRO_CACHE, MacroRecorder, MacroStore
+from model_gateway import get_gateway
+from multi_locator import batch_messages, batch_ready, parse_batch_result
+from ocr_locator import OCR_LOCATOR, OcrLocator
+from screen_encoding import (
+    EncodedImage,
+    EncodeOptions,
+    Frame,
+    area_region,
+    capture_frame,
+    crop_image,
+    region_around,
+)
+from settle_detector import SettleDetector, frame_diff
+from step_tracer import get_tracer
+from stream_json import stream_json_object
+from trajectory import TRAJECTORY_RECORD, TrajectoryRecorder
+
+# 一次计划最多执行的动作数
+PLAN_MAX_ACTIONS = int(os.getenv("PLAN_MAX_ACTIONS", "4"))
+
+# 两段式定位：粗定位整帧的长边像素、第二段裁剪区域占整帧的比例
+LOCATOR_ROI = os.getenv("LOCATOR_ROI", "1") == "1"
+LOCATOR_COARSE_EDGE = int(os.getenv("LOCATOR_COARSE_EDGE", "800"))
+LOCATOR_ROI_FRACTION = float(os.getenv("LOCATOR_ROI_FRACTION", "0.4"))
+
+# 页面稳定检测（按动作类型记录等待时长）
+settle_detector = SettleDetector()
+
+# GUI-plus 定位缓存（LOCATION_CACHE_PATH 设置后持久化到磁盘）
+location_cache = LocationCache()
+
+# 文字类目标的本地 OCR 定位（OCR_LOCATOR=0 关闭）
+ocr_locator = OcrLocator() if OCR_LOCATOR else None
+
+# 轨迹宏（MACRO_CACHE=0 关闭）
+macro_store = MacroStore() if MACRO_CACHE else None
 
 
 # Qwen3-Max 提示词（负责看图 + 理解 + 决策）
@@ -35,14 +89,15 @@ QWEN3_MAX_PROMPT = """你是一个全模态的高级 GUI 任务助手（Qwen3-Ma
 - 输出的动作会被直接执行，所以必须谨慎、稳定
 - 点击类/输入类操作会交给 GUI-plus 根据 target_description 做精确坐标定位
 
-你的输出必须是一个 JSON 对象，格式如下：
+你的输出必须是一个 JSON 对象，字段按下面的顺序输出（thought 放在最后）：
 {
-  "thought": "你如何理解当前页面与任务目标，并做出决策的思考过程",
   "action": "CLICK" | "TYPE" | "SCROLL" | "KEY_PRESS" | "FINISH" | "FAIL",
   "target_description": "当 action 是 CLICK 或 TYPE 且需要依赖画面元素时，精确描述要操作的元素",
+  "target_area": "可选，目标在截图中的大致区域",
   "parameters": {
     // 根据 action 类型填充，字段含义与下面说明一致
-  }
+  },
+  "thought": "你如何理解当前页面与任务目标，并做出决策的思考过程（简短）"
 }
 
 动作语义与参数规范：
@@ -52,6 +107,8 @@ QWEN3_MAX_PROMPT = """你是一个全模态的高级 GUI 任务助手（Qwen3-Ma
 - 要求：
   - target_description 必须是可在截图中定位的完整可见文本或清晰描述
   - 禁止模糊说法，例如“那个按钮”、“左边的东西”
+  - 有把握时可以给出 target_area：top / middle / bottom 与 left / center / right 的组合，
+    例如 "top-right"、"middle-center"、"bottom"；不确定就不要填
 - 示例：
 {
   "action": "CLICK",
@@ -108,85 +165,128 @@ QWEN3_MAX_PROMPT = """你是一个全模态的高级 GUI 任务助手（Qwen3-Ma
   }
 }
 
+7）多步计划（可选）
+- 当接下来几步非常确定、不需要看中间画面时（例如：点击搜索框 → 输入 → 回车），可以一次返回有序计划
+- 计划会被连续执行，不再询问你；任何检查点不满足时才会停下来让你重新决策
+- 格式：
+{
+  "plan": [
+    {"action": "CLICK", "target_description": "页面中央的搜索框", "parameters": {}},
+    {"action": "TYPE", "parameters": {"text": "天气预报", "needs_enter": false, "click_first": false}},
+    {
+      "action": "KEY_PRESS",
+      "parameters": {"key": "enter"},
+      "checkpoint": {"expect_change": true, "expect_text": "天气预报 的搜索结果"}
+    }
+  ],
+  "thought": "..."
+}
+- plan 最多 {max_actions} 个动作，不能包含 FINISH / FAIL
+- checkpoint 可选：
+  - expect_change: 执行后画面应发生变化
+  - expect_text: 执行后画面上应能看到的文字或元素描述
+
 严格要求：
 1. 只输出 JSON，不要有任何额外文字
 2. action / parameters 结构必须合法、可被直接执行
 3. target_description 必须足够具体，便于后续 GUI-plus 精确定位
-"""
+4. 没有把握时只返回单个动作，不要返回 plan
+5. 字段顺序固定：action / target_description / target_area / parameters（或 plan）在前，thought 在最后
+""".replace("{max_actions}", str(PLAN_MAX_ACTIONS))
 
 
 # GUI-plus 提示词（负责精确定位）
 GUI_PLUS_PROMPT = """你是一个精确的坐标定位器。
 用户会告诉你要点击的目标元素描述，你需要在截图中找到它并返回精确坐标。
 
-你必须返回严格的 JSON 格式：
+你必须返回严格的 JSON 格式（thought 放在最后）：
 {
-  "thought": "我在截图中看到了...",
   "found": true/false,
   "x": 坐标x,
-  "y": 坐标y
+  "y": 坐标y,
+  "thought": "我在截图中看到了..."
 }
 
 如果找不到目标，返回：
 {
-  "thought": "我在截图中没有找到...",
-  "found": false
+  "found": false,
+  "thought": "我在截图中没有找到..."
 }
 
 重要：
 1. 只输出 JSON
 2. 坐标必须精确
 3. 如果不确定，found 返回 false
+4. 字段顺序固定：found / x / y 在前，thought 在最后
 """
 
 
-def take_screenshot(output: str = "/tmp/allops_smart_v3.png") -> str | None:
-    """截取屏幕（强制浏览器在前台）"""
-    # 方法1: 激活 Chrome
-    subprocess.run(
-        ["osascript", "-e", 'tell application "Google Chrome" to activate'],
-        capture_output=True,
-        check=False,
-    )
-
-    # 方法2: 强制设置为最前面的进程
-    subprocess.run(
-        [
-            "osascript",
-            "-e",
-            'tell application "System Events" to set frontmost of process "Google Chrome" to true',
-        ],
-        check=False,
+def brain_ready(fields: dict) -> bool:
+    """大脑决策可以执行了：整个 plan 已完整，或单个动作的 action + parameters 已完整
+
+    需要定位的动作（CLICK、click_first 的 TYPE）还要等 target_description；
+    描述出现在 parameters 之后说明模型没按约定顺序输出，target_area 可能还在后面，等到它或 thought 为止。
+    """
+    if "plan" in fields:
+        return True
+    if "action" not in fields or "parameters" not in fields:
+        return False
+    params = fields["parameters"] if isinstance(fields["parameters"], dict) else {}
+    if not (fields["action"] == "CLICK" or (fields["action"] == "TYPE" and params.get("click_first"))):
+        return True
+    if "target_description" not in fields:
+        return False
+    keys = list(fields)
+    return (
+        "target_area" in fields
+        or "thought" in fields
+        or keys.index("target_description") < keys.index("parameters")
     )
 
-    # 方法3: 确保窗口可见
-    subprocess.run(
-        [
-            "osascript",
-            "-e",
-            'tell application "Google Chrome" to set index of window 1 to 1',
-        ],
-        check=False,
-    )
 
-    # 等待窗口切换完成（v3 略快一点）
-    time.sleep(0.7)
+def locator_ready(fields: dict) -> bool:
+    """定位结果可以使用了：明确未找到，或 x / y 都已完整"""
+    return fields.get("found") is False or ("x" in fields and "y" in fields)
 
-    # 截图
-    subprocess.run(["screencapture", "-x", output], check=False)
-    return output if os.path.exists(output) else None
 
+def take_screenshot(options: EncodeOptions | None = None) -> EncodedImage | None:
+    """截取屏幕（强制浏览器在前台），并编码成发给模型的图片"""
+    tracer = get_tracer()
 
-def image_to_base64_url(image_path: str) -> str:
-    """图片转 base64 data URL"""
-    with open(image_path, "rb") as f:
-        return "data:image/png;base64," + base64.b64encode(f.read()).decode("utf-8")
+    # 激活浏览器并置于最前，等待窗口切换完成（画面稳定即继续）
+    with tracer.span("activate"):
+        get_backend().activate_browser()
+        settle_detector.wait("ACTIVATE")
 
+    # 截图（默认只截浏览器窗口）
+    with tracer.span("capture"):
+        frame = capture_frame(options)
+    if not frame:
+        return None
 
-def ask_qwen3_brain(screenshot_path: str, goal: str, history: str) -> dict | None:
-    """使用 Qwen3-Max 看图 + 理解 + 决策（单模型大脑）"""
+    with tracer.span("encode") as span:
+        screen = frame.encoded(options)
+        span.update(raw_bytes=screen.raw_bytes, payload_bytes=screen.payload_bytes)
+    return screen
+
+
+def ask_qwen3_brain(
+    screen: EncodedImage,
+    goal: str,
+    history: str,
+    on_partial: Callable[[str], None] | None = None,
+    model: str = "qwen3-max",
+    system_prompt: str = QWEN3_MAX_PROMPT,
+    ready: Callable[[dict], bool] = brain_ready,
+) -> dict | None:
+    """使用 Qwen3-Max 看图 + 理解 + 决策（单模型大脑）
+
+    始终走流式调用并增量解析，ready（默认 action + parameters 完整）满足就返回；
+    传入 on_partial 时每收到一段输出就用已累积的文本回调一次。
+    model / system_prompt 供分层路由换成小模型时使用。
+    """
     print("\n" + "=" * 60)
-    print("🧠 Qwen3-Max 分析屏幕并规划下一步...")
+    print(f"🧠 {model} 分析屏幕并规划下一步...")
     print("=" * 60)
 
     context = {
@@ -194,98 +294,83 @@ def ask_qwen3_brain(screenshot_path: str, goal: str, history: str) -> dict | Non
         "history": history or "（还没有执行任何步骤）",
         "note": "你可以直接基于截图和这些信息做下一步决策，不需要其他模型。",
     }
+    context_text = json.dumps(context, ensure_ascii=False)
+    print(f"📝 文本上下文: {len(context_text)} 字符 ≈ {estimate_tokens(context_text)} tokens")
 
-    client = OpenAI(
-        api_key=DASHSCOPE_API_KEY,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
-
-    image_url = image_to_base64_url(screenshot_path)
+    image_url = screen.data_url
 
     try:
-        completion = client.chat.completions.create(
-            model="qwen3-max",
-            messages=[
-                {"role": "system", "content": QWEN3_MAX_PROMPT},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": image_url}},
-                        {"type": "text", "text": json.dumps(context, ensure_ascii=False)},
-                    ],
-                },
-            ],
-        )
-
-        result_text = completion.choices[0].message.content
-
-        # 解析 JSON（兼容 ```json 包裹的情况）
-        if "```json" in result_text:
-            result_text = result_text.split("```json", 1)[1].split("```", 1)[0].strip()
-        elif "```" in result_text:
-            result_text = result_text.split("```", 1)[1].split("```", 1)[0].strip()
-
-        result = json.loads(result_text)
+        with get_tracer().span(
+            "brain", payload_bytes=screen.payload_bytes, context_chars=len(context_text)
+        ):
+            result = stream_json_object(
+                get_gateway().chat_stream,
+                ready,
+                on_partial,
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "image_url", "image_url": {"url": image_url}},
+                            {"type": "text", "text": context_text},
+                        ],
+                    },
+                ],
+            )
 
-        print(f"\n💭 Qwen3-Max 思考: {result.get('thought', '')}")
-        print(f"🎬 决定动作: {result.get('action')}")
-        if result.get("action") in ["CLICK", "TYPE"]:
-            print(f"🎯 目标描述: {result.get('target_description', '')}")
+        print(f"\n💭 {model} 思考: {result.get('thought', '（已跳过）')}")
+        for index, item in enumerate(normalize_plan(result), 1):
+            prefix = f"[{index}] " if "plan" in result else ""
+            print(f"🎬 {prefix}决定动作: {item.get('action')}")
+            if item.get("action") in ["CLICK", "TYPE"]:
+                print(f"🎯 {prefix}目标描述: {item.get('target_description', '')}")
 
         return result
 
     except Exception as e:  # noqa: BLE001
-        print(f"❌ Qwen3-Max 调用失败: {e}")
+        print(f"❌ {model} 调用失败: {e}")
         import traceback
 
         traceback.print_exc()
         return None
 
 
-def ask_gui_plus(screenshot_path: str, target_description: str) -> dict:
-    """使用 GUI-plus 精确定位坐标"""
+def ask_gui_plus(
+    screen: EncodedImage, target_description: str, high_res: bool = True
+) -> dict:
+    """使用 GUI-plus 精确定位坐标（返回屏幕坐标）"""
     print("\n" + "=" * 60)
     print("🎯 GUI-plus 定位坐标...")
     print("=" * 60)
     print(f"目标: {target_description}")
 
-    client = OpenAI(
-        api_key=DASHSCOPE_API_KEY,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
-
-    image_url = image_to_base64_url(screenshot_path)
+    image_url = screen.data_url
 
     try:
-        completion = client.chat.completions.create(
-            model="gui-plus",
-            messages=[
-                {"role": "system", "content": GUI_PLUS_PROMPT},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": image_url}},
-                        {
-                            "type": "text",
-                            "text": f"请在截图中找到：{target_description}\n返回它的坐标。",
-                        },
-                    ],
-                },
-            ],
-            extra_body={"vl_high_resolution_images": True},
-        )
-
-        result_text = completion.choices[0].message.content
-
-        # 解析 JSON
-        if "```json" in result_text:
-            result_text = result_text.split("```json", 1)[1].split("```", 1)[0].strip()
-        elif "```" in result_text:
-            result_text = result_text.split("```", 1)[1].split("```", 1)[0].strip()
-
-        result = json.loads(result_text)
+        with get_tracer().span("locator", payload_bytes=screen.payload_bytes):
+            result = stream_json_object(
+                get_gateway().chat_stream,
+                locator_ready,
+                model="gui-plus",
+                messages=[
+                    {"role": "system", "content": GUI_PLUS_PROMPT},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "image_url", "image_url": {"url": image_url}},
+                            {
+                                "type": "text",
+                                "text": f"请在截图中找到：{target_description}\n返回它的坐标。",
+                            },
+                        ],
+                    },
+                ],
+                extra_body={"vl_high_resolution_images": high_res},
+            )
 
-        print(f"\n💭 GUI-plus: {result.get('thought', '')}")
+        print(f"\n💭 GUI-plus: {result.get('thought', '（已跳过）')}")
 
         if result.get("found"):
             x = result.get("x")
@@ -302,8 +387,10 @@ def ask_gui_plus(screenshot_path: str, target_description: str) -> dict:
             else:
                 y = int(y) if y is not None else 0
 
-            print(f"✅ 找到了！坐标: ({x}, {y})")
-            return {"found": True, "x": x, "y": y}
+            # 图片坐标 → 屏幕坐标
+            sx, sy = screen.to_screen(x, y)
+            print(f"✅ 找到了！图片坐标: ({x}, {y}) → 屏幕坐标: ({sx}, {sy})")
+            return {"found": True, "x": sx, "y": sy, "image_x": x, "image_y": y}
 
         print("❌ 未找到目标")
         return {"found": False}
@@ -316,13 +403,164 @@ def ask_gui_plus(screenshot_path: str, target_description: str) -> dict:
         return {"found": False}
 
 
-def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bool, str]:
-    """执行 Qwen3-Max 给出的动作"""
+def ask_gui_plus_roi(
+    screen: EncodedImage, target_description: str, area: str | None = None
+) -> dict:
+    """两段式定位：低分辨率整帧找大致区域 → 高分辨率裁剪图精确定位
+
+    大脑给了 target_area 时跳过第一段，直接裁剪该区域。
+    返回的 image_x / image_y 是 screen 整帧上的图片坐标（与 ask_gui_plus 一致）。
+    """
+    region = area_region(screen, area) if area else None
+    if region:
+        print(f"\n🧭 大脑提示区域: {area} → {region}")
+    else:
+        coarse = screen.frame.encoded(EncodeOptions(max_long_edge=LOCATOR_COARSE_EDGE))
+        print(f"\n🔭 粗定位: {coarse.describe()}")
+        hit = ask_gui_plus(coarse, target_description, high_res=False)
+        if not hit.get("found"):
+            print("↻ 粗定位未找到，改用整帧定位")
+            return ask_gui_plus(screen, target_description)
+        region = region_around(
+            screen,
+            hit["image_x"] * screen.width / coarse.width,
+            hit["image_y"] * screen.height / coarse.height,
+            LOCATOR_ROI_FRACTION,
+        )
+
+    crop = crop_image(screen, region)
+    print(f"🔬 精确定位区域 {region}: {crop.describe()}")
+    location = ask_gui_plus(crop, target_description)
+    if not location.get("found"):
+        print("↻ 裁剪区域内未找到，改用整帧定位")
+        return ask_gui_plus(screen, target_description)
+
+    # 裁剪图坐标 → 整帧图片坐标（定位缓存按整帧记录）
+    x1, y1, x2, y2 = region
+    location["image_x"] = x1 + location["image_x"] * (x2 - x1) / crop.width
+    location["image_y"] = y1 + location["image_y"] * (y2 - y1) / crop.height
+    return location
+
+
+def ask_gui_plus_many(
+    screen: EncodedImage, descriptions: list[str], high_res: bool = True
+) -> list[dict]:
+    """一次 GUI-plus 请求定位同一帧上的多个目标，返回与 descriptions 一一对应的结果（屏幕坐标）"""
+    print("\n" + "=" * 60)
+    print(f"🎯 GUI-plus 批量定位 {len(descriptions)} 个目标...")
+    print("=" * 60)
+    for index, desc in enumerate(descriptions, 1):
+        print(f"目标 {index}: {desc}")
+
+    try:
+        with get_tracer().span(
+            "locator", payload_bytes=screen.payload_bytes, targets=len(descriptions)
+        ):
+            result = stream_json_object(
+                get_gateway().chat_stream,
+                batch_ready,
+                model="gui-plus",
+                messages=batch_messages(screen.data_url, descriptions),
+                extra_body={"vl_high_resolution_images": high_res},
+            )
+    except Exception as e:  # noqa: BLE001
+        print(f"❌ GUI-plus 批量定位失败: {e}")
+        return [{"found": False} for _ in descriptions]
+
+    locations = parse_batch_result(result, len(descriptions))
+    for desc, location in zip(descriptions, locations):
+        if location["found"]:
+            location["x"], location["y"] = screen.to_screen(location["image_x"], location["image_y"])
+            print(f"✅ {desc} → ({location['x']}, {location['y']})")
+        else:
+            print(f"❌ 未找到: {desc}")
+    return locations
+
+
+def locate_locally(screen: EncodedImage, target_description: str) -> dict | None:
+    """不调用模型的定位：定位缓存（带像素校验）→ 本地 OCR；都未命中返回 None"""
+    frame = screen.frame
+    image = frame.image
+    with get_tracer().span("cache_lookup") as span:
+        cached = location_cache.lookup(image, target_description, frame.dhash)
+        span["hit"] = cached is not None
+
+    if cached:
+        nx, ny = cached
+        x, y = screen.to_screen(nx * screen.width, ny * screen.height)
+        print(f"\n⚡ 定位缓存命中: {target_description} → ({x}, {y})")
+        return {"found": True, "x": x, "y": y, "cached": True}
+
+    if ocr_locator:
+        with get_tracer().span("ocr") as span:
+            match = ocr_locator.locate(image, target_description, frame.digest)
+            span["hit"] = match is not None
+        if match:
+            x, y = screen.to_screen(
+                match.x / image.width * screen.width, match.y / image.height * screen.height
+            )
+            print(f"📍 本地定位: {target_description} → ({x}, {y})")
+            return {"found": True, "x": x, "y": y, "confidence": match.score * match.confidence}
+    return None
+
+
+def locate_target(
+    screen: EncodedImage, target_description: str, area: str | None = None
+) -> dict:
+    """先查定位缓存（带像素校验），再试本地 OCR，都未命中才调用 GUI-plus（默认两段式）"""
+    local = locate_locally(screen, target_description)
+    if local:
+        return local
+
+    frame = screen.frame
+    if LOCATOR_ROI:
+        location = ask_gui_plus_roi(screen, target_description, area)
+    else:
+        location = ask_gui_plus(screen, target_description)
+    if location.get("found"):
+        location_cache.store(
+            frame.image,
+            target_description,
+            location["image_x"] / screen.width,
+            location["image_y"] / screen.height,
+            frame.dhash,
+        )
+    return location
+
+
+def locate_targets(screen: EncodedImage, descriptions: list[str]) -> list[dict]:
+    """定位同一帧上的多个目标：本地能定位的先定位，其余合并成一次 GUI-plus 请求，结果写入定位缓存"""
+    results: list[dict | None] = [locate_locally(screen, desc) for desc in descriptions]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending:
+        frame = screen.frame
+        located = ask_gui_plus_many(screen, [descriptions[i] for i in pending])
+        for i, location in zip(pending, located):
+            results[i] = location
+            if location["found"]:
+                location_cache.store(
+                    frame.image,
+                    descriptions[i],
+                    location["image_x"] / screen.width,
+                    location["image_y"] / screen.height,
+                    frame.dhash,
+                )
+    return results
+
+
+def execute_action(
+    action_result: dict | None,
+    screen: EncodedImage,
+    locator: Callable[[EncodedImage, str, str | None], dict] | None = None,
+) -> tuple[bool, str]:
+    """执行 Qwen3-Max 给出的动作（locator 默认为 locate_target）"""
     if not action_result:
         return False, "决策失败"
 
     action = action_result.get("action")
     params = action_result.get("parameters", {}) or {}
+    locator = locator or locate_target
+    backend = get_backend()
 
     print("\n" + "=" * 60)
     print("▶️  执行操作")
@@ -331,8 +569,8 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
     if action == "CLICK":
         target_desc = action_result.get("target_description", "")
 
-        # 使用 GUI-plus 获取精确坐标
-        location = ask_gui_plus(screenshot_path, target_desc)
+        # 使用 GUI-plus 获取精确坐标（优先命中缓存）
+        location = locator(screen, target_desc, action_result.get("target_area"))
         if not location.get("found"):
             print("⚠️  无法定位目标元素")
             return False, f"无法找到：{target_desc}"
@@ -342,9 +580,8 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
         print(f"\n🖱️  点击: {target_desc}")
         print(f"📍 坐标: ({x}, {y})")
 
-        subprocess.run(["cliclick", f"m:{x},{y}"], check=False)
-        time.sleep(0.3)
-        subprocess.run(["cliclick", f"c:{x},{y}"], check=False)
+        with get_tracer().span("input", action="CLICK"):
+            backend.batch([("move", x, y), ("click", x, y)])
 
         print("✅ 已点击")
         return True, f"点击了 {target_desc} ({x}, {y})"
@@ -360,36 +597,19 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
         # 如果需要先点击输入框
         if click_first and target_desc:
             print(f"   先点击目标: {target_desc}")
-            location = ask_gui_plus(screenshot_path, target_desc)
+            location = locator(screen, target_desc, action_result.get("target_area"))
             if location.get("found"):
                 x, y = location["x"], location["y"]
                 print(f"   📍 输入框坐标: ({x}, {y})")
-                subprocess.run(["cliclick", f"c:{x},{y}"], check=False)
-                time.sleep(0.2)
+                with get_tracer().span("input", action="CLICK"):
+                    backend.batch([("click", x, y)])
+                    time.sleep(0.2)
             else:
                 print("   ⚠️  未找到输入框，尝试直接输入")
 
-        # 检测是否包含中文
-        has_chinese = any("\u4e00" <= ch <= "\u9fff" for ch in text)
-
-        if has_chinese:
-            print("   检测到中文，使用剪贴板方式输入...")
-            subprocess.run(["pbcopy"], input=text.encode("utf-8"), check=False)
-            time.sleep(0.15)
-            subprocess.run(
-                [
-                    "osascript",
-                    "-e",
-                    'tell application "System Events" to keystroke "v" using command down',
-                ],
-                check=False,
-            )
-            print("   ✅ 已通过剪贴板粘贴")
-        else:
-            subprocess.run(["cliclick", f"t:{text}"], check=False)
-
-        if needs_enter:
-            subprocess.run(["cliclick", "kp:return"], check=False)
+        # 中文由后端处理（macOS 走剪贴板 + 粘贴）
+        with get_tracer().span("input", action="TYPE"):
+            backend.batch([("type", text)] + ([("key", "return")] if needs_enter else []))
 
         print("✅ 已输入")
         return True, f"输入了 {text}"
@@ -403,7 +623,8 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
         scroll_value = -clicks if direction == "up" else clicks
 
         print(f"🔄 滚动: {direction} ({amount})")
-        subprocess.run(["cliclick", f"w:{scroll_value}"], check=False)
+        with get_tracer().span("input", action="SCROLL"):
+            backend.batch([("scroll", scroll_value)])
 
         print("✅ 已滚动")
         return True, f"向{direction}滚动了{amount}"
@@ -412,10 +633,8 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
         key = params.get("key", "")
 
         print(f"⌨️  按键: {key}")
-        if "+" in key:
-            subprocess.run(["cliclick", f"kp:{key}"], check=False)
-        else:
-            subprocess.run(["cliclick", f"kp:{key}"], check=False)
+        with get_tracer().span("input", action="KEY_PRESS"):
+            backend.batch([("key", key)])
 
         print("✅ 已按键")
         return True, f"按下了 {key}"
@@ -434,8 +653,141 @@ def execute_action(action_result: dict | None, screenshot_path: str) -> tuple[bo
     return False, f"未知动作: {action}"
 
 
-def smart_execute(goal: str, max_steps: int = 20) -> None:
-    """智能执行（二模型协作：Qwen3-Max + GUI-plus）"""
+def normalize_plan(decision: dict) -> list[dict]:
+    """把大脑的输出统一成动作列表（单个动作即长度为 1 的计划）"""
+    plan = decision.get("plan")
+    if isinstance(plan, list) and plan:
+        return [item for item in plan[:PLAN_MAX_ACTIONS] if isinstance(item, dict)]
+    return [decision]
+
+
+def needs_locator(item: dict) -> bool:
+    """该动作是否需要在当前画面上定位元素"""
+    params = item.get("parameters", {}) or {}
+    action = item.get("action")
+    return action == "CLICK" or (action == "TYPE" and bool(params.get("click_first")))
+
+
+def settled_screen() -> EncodedImage | None:
+    """页面稳定检测最后截到的那一帧（已在内存里，不激活浏览器也不重新截图）"""
+    if settle_detector.last_image is None:
+        return None
+    bounds = settle_detector.last_bounds
+    screen_size = None if bounds else get_backend().screen_size()
+    return Frame(settle_detector.last_image, bounds, screen_size).encoded()
+
+
+def expect_visible(screen: EncodedImage, text: str) -> bool:
+    """检查点用的廉价可见性判断：定位缓存 / OCR，未命中时最多一次低分辨率 GUI-plus 请求"""
+    if locate_locally(screen, text):
+        return True
+    coarse = screen.frame.encoded(EncodeOptions(max_long_edge=LOCATOR_COARSE_EDGE))
+    return bool(ask_gui_plus(coarse, text, high_res=False).get("found"))
+
+
+def check_checkpoint(
+    item: dict, reference, screen: EncodedImage | None = None
+) -> tuple[bool, str]:
+    """验证动作后的检查点：画面是否变化、预期文字是否可见
+
+    screen 为动作后已经截到的画面（一般是页面稳定检测的最后一帧）；没有时才重新截图。
+    """
+    checkpoint = item.get("checkpoint") or {}
+
+    if checkpoint.get("expect_change"):
+        last = settle_detector.last_frame
+        if last is None or frame_diff(reference, last) <= settle_detector.threshold:
+            return False, "画面没有变化"
+
+    expect_text = checkpoint.get("expect_text")
+    if expect_text:
+        screen = screen or take_screenshot()
+        if not screen or not expect_visible(screen, expect_text):
+            return False, f"没有看到 {expect_text}"
+
+    return True, ""
+
+
+def run_plan(
+    plan: list[dict],
+    screen: EncodedImage,
+    locator: Callable[[EncodedImage, str, str | None], dict] | None = None,
+) -> tuple[list[str], str | None]:
+    """按顺序执行计划，返回 (每个动作的描述, 偏离原因)；偏离原因为 None 表示计划全部完成"""
+    descriptions: list[str] = []
+    reference = screen.frame.thumbnail
+
+    # 计划里有多个要定位的目标时，先在当前帧上一次批量定位，后面的步骤从定位缓存取
+    # （画面变化后像素校验不通过的目标仍会单独定位；传入的 locator 自己负责第一步）
+    targets = list(
+        dict.fromkeys(
+            item["target_description"]
+            for item in (plan[1:] if locator else plan)
+            if needs_locator(item) and item.get("target_description")
+        )
+    )
+    if len(targets) > 1:
+        locate_targets(screen, targets)
+
+    for index, item in enumerate(plan):
+        action = item.get("action")
+        if index > 0:
+            print(f"\n📋 计划第 {index + 1}/{len(plan)} 步（不重新调用大脑）")
+            if action in ["FINISH", "FAIL"]:
+                return descriptions, f"计划中的 {action} 需要看到画面后再确认"
+            if needs_locator(item):
+                screen = take_screenshot()
+                if not screen:
+                    return descriptions, "截图失败"
+
+        # 记下命中定位缓存的目标：点击后没有效果时删除这条缓存，不再在相似画面上重复点错
+        item_locator = (locator if index == 0 else None) or locate_target
+        cached_targets: list[str] = []
+
+        def tracking_locator(s: EncodedImage, desc: str, area: str | None = None) -> dict:
+            location = item_locator(s, desc, area)
+            if location.get("cached"):
+                cached_targets.append(desc)
+            return location
+
+        success, description = execute_action(item, screen, tracking_locator)
+        descriptions.append(description)
+        if not success:
+            return descriptions, f"第 {index + 1} 步执行失败"
+
+        # 等待页面反应（画面不再变化即继续，最长 SETTLE_MAX_WAIT 秒）
+        settled = None
+        if action in ["CLICK", "TYPE", "KEY_PRESS", "SCROLL"]:
+            print("\n⏳ 等待页面稳定...")
+            with get_tracer().span("settle", action=action):
+                waited = settle_detector.wait(action, screen.bounds, reference=reference)
+            print(f"✅ 页面已稳定（等待 {waited:.2f}秒）")
+            if (item.get("checkpoint") or {}).get("expect_text"):
+                settled = settled_screen()
+
+        ok, reason = check_checkpoint(item, reference, settled)
+        if cached_targets:
+            last = settle_detector.last_frame
+            unchanged = action == "CLICK" and (
+                last is None or frame_diff(reference, last) <= settle_detector.threshold
+            )
+            if not ok or unchanged:
+                for desc in cached_targets:
+                    print(f"🗑️  缓存的位置点击后没有效果，删除定位缓存: {desc}")
+                    location_cache.invalidate(screen.frame.image, desc)
+        if not ok:
+            return descriptions, f"第 {index + 1} 步检查点未通过：{reason}"
+        if settle_detector.last_frame is not None:
+            reference = settle_detector.last_frame
+
+    return descriptions, None
+
+
+def smart_execute(goal: str, max_steps: int = 20) -> dict:
+    """智能执行（二模型协作：Qwen3-Max + GUI-plus）
+
+    返回执行结果摘要：status（finished / failed / max_steps / error）、steps、brain_calls。
+    """
     print("=" * 60)
     print("🧠 allops_smart_v3 - 二模型协作版（Qwen3-Max + GUI-plus）")
     print("=" * 60)
@@ -445,65 +797,118 @@ def smart_execute(goal: str, max_steps: int = 20) -> None:
     print("=" * 60)
 
     # 激活浏览器
-    print("\n🌐 准备工作环境...")
-    subprocess.run(
-        ["osascript", "-e", 'tell application "Google Chrome" to activate'],
-        check=False,
-    )
-    time.sleep(1)
+    print(f"\n🌐 准备工作环境（后端: {get_backend().name}）...")
+    get_backend().activate_browser()
+    get_gateway().warm_up()
     print("✅ 环境准备完成！\n")
 
-    history: list[str] = []
+    history = HistoryManager()
     step_num = 1
+    payload_total = 0
+    brain_calls = 0
+    status = "max_steps"
+
+    recorder = TrajectoryRecorder(TRAJECTORY_RECORD) if TRAJECTORY_RECORD else None
+    if recorder:
+        recorder.attach(get_gateway())
+
+    macro_player = macro_store.player(goal) if macro_store else None
+    macro_recorder = MacroRecorder(goal) if macro_store else None
+    if macro_recorder:
+        location_cache.touched.clear()
+    if macro_player:
+        location_cache.seed(macro_store.anchors(goal))
+
+    router = DecisionRouter(ask_qwen3_brain, QWEN3_MAX_PROMPT, brain_ready) if CASCADE else None
+    last_round: dict | None = None
 
     while step_num <= max_steps:
         print("\n\n" + "#" * 60)
         print(f"# 第 {step_num} 轮")
         print("#" * 60)
 
+        get_tracer().begin_step(step_num)
+
         # 1. 截图
         print("\n📸 截取当前屏幕...")
-        screenshot = take_screenshot()
-        if not screenshot:
+        t0 = time.monotonic()
+        screen = take_screenshot()
+        if not screen:
             print("❌ 截图失败")
+            status = "error"
             break
         print("✅ 截图成功")
-
-        # 2. Qwen3-Max 直接看图 + 做决策
-        history_text = "\n".join(f"{i + 1}. {h}" for i, h in enumerate(history))
-        decision = ask_qwen3_brain(screenshot, goal, history_text)
+        print(f"📦 图像负载: {screen.describe()}")
+        payload_total += screen.payload_bytes
+        if recorder:
+            recorder.begin_step(step_num, screen)
+
+        # 2. 画面对得上轨迹宏时直接重放，否则按 规则 → 小模型 → Qwen3-Max 做决策
+        t1 = time.monotonic()
+        tier = "macro"
+        actions = macro_player.match(screen.frame.dhash) if macro_player else None
+        if macro_store:
+            macro_store.count(actions is not None)
+        if actions:
+            decision = {"plan": actions}
+        else:
+            history_text = history.render()
+            if router:
+                decision, tier = router.decide(screen, goal, history_text, last_round)
+            else:
+                decision, tier = ask_qwen3_brain(screen, goal, history_text), "max"
+            brain_calls += tier == "max"
+        t2 = time.monotonic()
         if not decision:
             print("\n❌ Qwen3-Max 决策失败，终止")
+            if recorder:
+                recorder.end_step(None, [], {"capture": t1 - t0, "brain": t2 - t1})
+            status = "error"
             break
 
-        action = decision.get("action")
+        plan = normalize_plan(decision)
+        action = plan[0].get("action")
 
         # 3. 判断是否结束
+        if action in ["FINISH", "FAIL"] and recorder:
+            recorder.end_step(decision, [], {"capture": t1 - t0, "brain": t2 - t1})
+
         if action == "FINISH":
             print("\n" + "=" * 60)
             print("🎉 任务成功完成！")
             print("=" * 60)
+            status = "finished"
             break
 
         if action == "FAIL":
             print("\n" + "=" * 60)
             print("😔 任务失败")
             print("=" * 60)
+            status = "failed"
             break
 
-        # 4. 执行动作
-        success, description = execute_action(decision, screenshot)
+        # 4. 执行动作（多步计划连续执行，每步之后等待页面稳定并验证检查点）
+        descriptions, diverged = run_plan(plan, screen)
 
         # 5. 记录历史（不管成功失败都记一笔，方便下一轮判断）
-        history.append(description)
-
-        # 6. 等待页面反应（比 v2 更快）
-        if action in ["CLICK", "TYPE", "KEY_PRESS"]:
-            print("\n⏳ 等待页面响应 (1.5秒)...")
-            time.sleep(1.5)
-        elif action == "SCROLL":
-            print("\n⏳ 等待滚动完成 (1秒)...")
-            time.sleep(1)
+        for description in descriptions:
+            history.append(description)
+        if diverged and len(plan) > 1:
+            print(f"\n↩️  计划偏离：{diverged}，重新规划")
+            history.append(f"（计划中断：{diverged}）")
+        if macro_recorder and not diverged:
+            # 只有完整执行的轮次进入宏；偏离的轮次重放时也会偏离
+            macro_recorder.add_step(screen.frame.dhash, plan)
+        if router:
+            router.verify(tier, diverged is None)
+        last_round = {"actions": plan, "descriptions": descriptions, "diverged": diverged}
+
+        if recorder:
+            recorder.end_step(
+                decision,
+                descriptions,
+                {"capture": t1 - t0, "brain": t2 - t1, "act": time.monotonic() - t2},
+            )
 
         step_num += 1
 
@@ -517,11 +922,31 @@ def smart_execute(goal: str, max_steps: int = 20) -> None:
     print("📊 执行总结")
     print("=" * 60)
     print(f"总步骤数: {len(history)}")
+    print(f"大脑（qwen3-max）调用次数: {brain_calls}")
+    print(f"截图负载合计: {payload_total / 1024:.0f}KB")
+    settle_detector.print_summary()
+    get_backend().print_summary()
+    if router:
+        router.print_summary()
+    location_cache.print_summary()
+    if macro_store:
+        macro_store.print_summary()
+    if ocr_locator:
+        ocr_locator.print_summary()
+    get_gateway().print_summary()
+    get_tracer().print_summary()
     print("\n执行历史:")
-    for i, h in enumerate(history, 1):
+    for i, h in enumerate(history.steps, 1):
         print(f"  {i}. {h}")
     print("=" * 60)
 
+    if recorder:
+        recorder.save(goal)
+    if macro_recorder and status == "finished":
+        macro_store.save(macro_recorder, location_cache.touched_entries())
+
+    return {"status": status, "steps": len(history), "brain_calls": brain_calls}
+
 
 def main() -> None:
     if len(sys.argv) < 2:
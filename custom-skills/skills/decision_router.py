@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+decision_router.py - 大脑决策的分层路由（规则 → 小模型 → qwen3-max）
+
+smart_execute 每一轮都请求 qwen3-max，包括输入后按回车、目标在首屏之外需要滚动这类显而易见的后续步骤。
+这里按代价从低到高逐层尝试：
+- rules: 针对明显后续步骤的规则（搜索框输入后回车、找不到点击目标时向下滚动），不调用模型
+- small: 更小更快的视觉模型，要求先输出 confidence；置信度不够、想要结束任务或调用失败时升级
+- max:   qwen3-max，兜底
+
+低层给出的决策带检查点执行；执行失败或检查点未通过时，下一轮直接交给 qwen3-max。
+每层统计询问次数、采用率、验证结果、耗时与预估费用。
+
+费用优先使用网关记录的 token 用量；提前结束读取的流式调用拿不到 usage，
+按 文本长度 + 图片像素（约 28x28 像素 1 个 token）估算。
+
+环境变量：
+- CASCADE: 是否开启分层路由（默认 1，关闭时每一轮都直接请求 qwen3-max）
+- CASCADE_RULES: 是否启用规则层（默认 1）
+- CASCADE_SMALL_MODEL: 小模型名称（默认 qwen3-vl-flash，为空则跳过小模型层）
+- CASCADE_MIN_CONFIDENCE: 采用小模型决策所需的最低置信度（默认 0.8）
+- CASCADE_MAX_RULE_SCROLLS: 规则层最多连续滚动几次（默认 2；成功执行滚动以外的动作后重新计数）
+- CASCADE_PRICES: 模型单价 JSON，元 / 百万 tokens，例如 {"qwen3-max": [6, 24]}
+"""
+
+import json
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from history_manager import estimate_tokens
+from model_gateway import get_gateway
+from step_tracer import percentile
+
+CASCADE = os.getenv("CASCADE", "1") == "1"
+CASCADE_RULES = os.getenv("CASCADE_RULES", "1") == "1"
+CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "qwen3-vl-flash")
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.8"))
+CASCADE_MAX_RULE_SCROLLS = int(os.getenv("CASCADE_MAX_RULE_SCROLLS", "2"))
+
+BRAIN_MODEL = "qwen3-max"
+
+# 输入 / 输出单价（元 / 百万 tokens，按公开列表价的第一档估算）
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "qwen3-max": (6.0, 24.0),
+    "qwen3-vl-flash": (0.15, 1.5),
+    "qwen3-vl-plus": (1.0, 10.0),
+}
+MODEL_PRICES.update(
+    {model: tuple(price) for model, price in json.loads(os.getenv("CASCADE_PRICES", "{}")).items()}
+)
+
+# 视觉模型大约每 28x28 像素一个 token
+IMAGE_PATCH_PIXELS = 28 * 28
+
+TIERS = ("rules", "small", "max")
+
+SMALL_MODEL_NOTE = """
+
+快速决策层补充要求：
+- 你是 qwen3-max 之前的快速决策层，只负责有把握的简单步骤，拿不准的会交给更强的模型
+- 第一个字段必须是 "confidence"（0-1 的数字），表示你对这个动作正确的把握，例如 {"confidence": 0.9, "action": ...}
+- 不要输出 FINISH / FAIL；认为任务已经完成或无法完成时，给出很低的 confidence
+"""
+
+_SEARCH_WORDS = ("搜索", "search", "查询", "检索")
+
+
+@dataclass
+class TierStats:
+    """某一层的统计"""
+
+    calls: int = 0
+    accepted: int = 0
+    verified: int = 0
+    failed: int = 0
+    cost: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def follow_up_rule(last: dict | None, goal: str, scrolls: int) -> dict | None:
+    """上一轮之后显而易见的下一步；没有把握时返回 None
+
+    last: 上一轮的 actions（执行的计划）、descriptions（每个动作的结果）、diverged（偏离原因）
+    """
+    if not last or not last["descriptions"]:
+        return None
+    item = last["actions"][len(last["descriptions"]) - 1]
+    params = item.get("parameters", {}) or {}
+
+    # 搜索框输入完但没有回车
+    if item.get("action") == "TYPE" and not last["diverged"] and not params.get("needs_enter"):
+        text = (goal + item.get("target_description", "")).lower()
+        if params.get("text") and any(word in text for word in _SEARCH_WORDS):
+            return {
+                "action": "KEY_PRESS",
+                "parameters": {"key": "enter"},
+                "checkpoint": {"expect_change": True},
+                "thought": "规则：搜索词已输入，按回车提交",
+            }
+
+    # 点击目标在当前画面里找不到，先向下滚动
+    if (
+        item.get("action") == "CLICK"
+        and last["descriptions"][-1].startswith("无法找到")
+        and scrolls < CASCADE_MAX_RULE_SCROLLS
+    ):
+        return {
+            "action": "SCROLL",
+            "parameters": {"direction": "down", "amount": "medium"},
+            "checkpoint": {"expect_change": True},
+            "thought": "规则：目标不在当前画面，向下滚动后再找",
+        }
+    return None
+
+
+def made_progress(last: dict | None) -> bool:
+    """上一轮是否成功执行了滚动以外的动作（规则层的连续滚动次数从这里重新计数）"""
+    if not last or not last["descriptions"] or last["diverged"]:
+        return False
+    return last["actions"][len(last["descriptions"]) - 1].get("action") != "SCROLL"
+
+
+class DecisionRouter:
+    """按 规则 → 小模型 → qwen3-max 的顺序取得决策，并统计每一层的效果"""
+
+    def __init__(
+        self,
+        ask: Callable[..., dict | None],
+        system_prompt: str,
+        ready: Callable[[dict], bool],
+        small_model: str = CASCADE_SMALL_MODEL,
+        rules: bool = CASCADE_RULES,
+        min_confidence: float = CASCADE_MIN_CONFIDENCE,
+    ) -> None:
+        """ask(screen, goal, history, model=..., system_prompt=..., ready=...) 即 ask_qwen3_brain"""
+        self.ask = ask
+        self.system_prompt = system_prompt
+        self.ready = ready
+        self.small_model = small_model
+        self.rules = rules
+        self.min_confidence = min_confidence
+        self.stats = {tier: TierStats() for tier in TIERS}
+        self.escalate_next = False
+        self.rule_scrolls = 0
+
+    def decide(
+        self, screen, goal: str, history: str, last: dict | None = None
+    ) -> tuple[dict | None, str]:
+        """返回 (决策, 层名)；层名为 max 表示调用了 qwen3-max"""
+        escalate, self.escalate_next = self.escalate_next, False
+        if made_progress(last):
+            self.rule_scrolls = 0
+
+        if not escalate and self.rules:
+            stats = self.stats["rules"]
+            start = time.monotonic()
+            decision = follow_up_rule(last, goal, self.rule_scrolls)
+            stats.calls += 1
+            stats.latencies.append(time.monotonic() - start)
+            if decision:
+                stats.accepted += 1
+                self.rule_scrolls += decision["action"] == "SCROLL"
+                print(f"\n📏 {decision['thought']}（不调用模型）")
+                return decision, "rules"
+
+        if not escalate and self.small_model:
+            decision = self._ask_model("small", self.small_model, screen, goal, history)
+            reason = self._reject_reason(decision)
+            if not reason:
+                self.stats["small"].accepted += 1
+                return decision, "small"
+            print(f"⬆️  {self.small_model} 的决策未采用（{reason}），升级到 {BRAIN_MODEL}")
+
+        return self._ask_model("max", BRAIN_MODEL, screen, goal, history), "max"
+
+    def verify(self, tier: str, ok: bool) -> None:
+        """记录低层决策的执行结果；失败时下一轮直接交给 qwen3-max"""
+        if tier not in ("rules", "small"):
+            return
+        stats = self.stats[tier]
+        if ok:
+            stats.verified += 1
+            return
+        stats.failed += 1
+        self.escalate_next = True
+        print(f"⬆️  {tier} 层的决策没有通过验证，下一轮直接交给 {BRAIN_MODEL}")
+
+    def _reject_reason(self, decision: dict | None) -> str | None:
+        if not decision:
+            return "调用失败"
+        if decision.get("action") in ("FINISH", "FAIL"):
+            return f"{decision['action']} 交给 {BRAIN_MODEL} 确认"
+        try:
+            confidence = float(decision.get("confidence", 0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if confidence < self.min_confidence:
+            return f"置信度 {confidence:.2f} < {self.min_confidence}"
+        return None
+
+    def _ask_model(self, tier: str, model: str, screen, goal: str, history: str) -> dict | None:
+        stats = self.stats[tier]
+        gateway = get_gateway()
+        before = len(gateway.records)
+        start = time.monotonic()
+
+        if tier == "small":
+            system_prompt = self.system_prompt + SMALL_MODEL_NOTE
+            decision = self.ask(
+                screen,
+                goal,
+                history,
+                model=model,
+                system_prompt=system_prompt,
+                ready=lambda fields: "confidence" in fields and self.ready(fields),
+            )
+        else:
+            system_prompt = self.system_prompt
+            decision = self.ask(screen, goal, history)
+
+        stats.calls += 1
+        stats.latencies.append(time.monotonic() - start)
+
+        records = [r for r in gateway.records[before:] if r.model == model]
+        prompt_tokens = sum(r.prompt_tokens for r in records)
+        completion_tokens = sum(r.completion_tokens for r in records)
+        if not prompt_tokens:
+            # 提前结束读取时没有 usage，按文本与图片大小估算
+            prompt_tokens = estimate_tokens(system_prompt + goal + history) + (
+                screen.width * screen.height // IMAGE_PATCH_PIXELS
+            )
+        if not completion_tokens and decision:
+            completion_tokens = estimate_tokens(json.dumps(decision, ensure_ascii=False))
+        stats.cost += call_cost(model, prompt_tokens, completion_tokens)
+        return decision
+
+    def print_summary(self) -> None:
+        rounds = sum(self.stats[tier].accepted for tier in ("rules", "small")) + self.stats["max"].calls
+        if not rounds:
+            return
+        names = {"rules": "规则", "small": self.small_model, "max": BRAIN_MODEL}
+        print("\n🪜 决策分层统计:")
+        for tier in TIERS:
+            stats = self.stats[tier]
+            if not stats.calls:
+                continue
+            accepted = stats.calls if tier == "max" else stats.accepted
+            line = (
+                f"  {tier:<5} {names[tier]:<16} 询问 {stats.calls} 次，采用 {accepted} 次"
+                f"（{accepted / stats.calls:.0%}）"
+            )
+            if tier != "max":
+                line += f"，验证通过 {stats.verified} / 失败 {stats.failed}"
+            line += (
+                f"，耗时 p50 {percentile(stats.latencies, 50):.2f}秒 / "
+                f"p95 {percentile(stats.latencies, 95):.2f}秒，费用约 ¥{stats.cost:.4f}"
+            )
+            print(line)
+        total_latency = sum(sum(s.latencies) for s in self.stats.values())
+        total_cost = sum(s.cost for s in self.stats.values())
+        print(
+            f"  平均每轮决策 {total_latency / rounds:.2f}秒，费用约 ¥{total_cost / rounds:.4f}"
+            f"（{rounds} 轮，合计 ¥{total_cost:.4f}）"
+        )
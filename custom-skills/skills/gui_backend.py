@@ -0,0 +1,717 @@
+#!/usr/bin/env python3
+"""
+gui_backend.py - 截图与输入的可插拔后端
+
+take_screenshot / execute_action 不再直接调用 macOS 命令，而是通过后端接口：
+- macos: 安装了 PyObjC 时在进程内直接调用 Quartz / AppKit（一个长期会话，不再为每个动作启动子进程）；
+         未安装时退回原有实现（screencapture / cliclick / osascript / pbcopy / open -a）
+- x11:   驱动一个 X 显示（例如 Xvfb），进程内用 mss 截图、pynput 注入鼠标键盘
+- sim:   确定性的模拟桌面，用 PIL 渲染脚本化页面并响应点击/输入，方便在 CI 中端到端压测
+
+输入通过 batch() 成批下发（例如 移动+点击、粘贴+回车 一次调用），后端可以把一批命令合并执行；
+每一批的耗时按命令组合统计（print_summary 输出 p50/p95）。
+
+环境变量：
+- GUI_BACKEND: macos | x11 | sim（默认 macos）
+- MACOS_INPUT_SESSION: macos 后端是否使用进程内会话（默认 1，需要 pip install pyobjc-framework-Quartz）
+- DISPLAY: x11 后端使用的显示，例如 :99
+- CHROME_BIN / CHROME_USER_DATA_DIR: x11 后端打开网址时使用的浏览器与配置目录
+- CHROME_ARGS: x11 后端启动浏览器时追加的命令行参数（空格分隔）
+- SIM_PAGES: 模拟桌面的页面脚本（JSON 文件），不设置则使用内置的搜索示例
+- SIM_SCREEN: 模拟桌面分辨率，例如 1280x800
+- SIM_FONT: 模拟桌面渲染中文所用字体文件
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from PIL import Image, ImageDraw, ImageFont
+
+from step_tracer import percentile
+
+GUI_BACKEND = os.getenv("GUI_BACKEND", "macos")
+MACOS_INPUT_SESSION = os.getenv("MACOS_INPUT_SESSION", "1") == "1"
+
+Bounds = tuple[int, int, int, int]
+
+# 一条输入命令：("move", x, y) / ("click", x, y) / ("type", text) / ("key", key) / ("scroll", amount)
+Command = tuple
+_COMMAND_METHODS = {
+    "move": "move",
+    "click": "click",
+    "type": "type_text",
+    "key": "key_press",
+    "scroll": "scroll",
+}
+
+
+def _has_cjk(text: str) -> bool:
+    return any("\u4e00" <= ch <= "\u9fff" for ch in text)
+
+
+class GuiBackend(ABC):
+    """截图与输入后端接口（坐标均为屏幕坐标）"""
+
+    name = "base"
+    # 截一帧是否廉价（进程内完成）；需要为每一帧启动子进程的后端设为 False，
+    # 页面稳定检测在这类后端上不轮询截图，改为按动作类型固定等待
+    cheap_grab = True
+
+    def __init__(self) -> None:
+        # 命令组合（例如 move+click）→ 每次下发的耗时
+        self.command_latencies: dict[str, list[float]] = {}
+
+    def batch(self, commands: list[Command]) -> float:
+        """按顺序执行一批输入命令，返回耗时"""
+        start = time.monotonic()
+        self._run_batch(commands)
+        elapsed = time.monotonic() - start
+        key = "+".join(command[0] for command in commands)
+        self.command_latencies.setdefault(key, []).append(elapsed)
+        return elapsed
+
+    def _run_batch(self, commands: list[Command]) -> None:
+        """默认逐条调用对应的方法；能合并命令的后端覆盖这里"""
+        for name, *args in commands:
+            getattr(self, _COMMAND_METHODS[name])(*args)
+
+    def print_summary(self) -> None:
+        if not self.command_latencies:
+            return
+        print(f"\n🖱️  输入命令耗时（后端: {self.name}）:")
+        for key, values in sorted(self.command_latencies.items()):
+            print(
+                f"  {key:<18} {len(values):>3} 次  p50 {percentile(values, 50) * 1000:.1f}ms"
+                f"  p95 {percentile(values, 95) * 1000:.1f}ms"
+            )
+
+    @abstractmethod
+    def activate_browser(self) -> None:
+        """让浏览器处于前台"""
+
+    @abstractmethod
+    def window_bounds(self) -> Bounds | None:
+        """浏览器窗口边界 (x1, y1, x2, y2)，未知时返回 None"""
+
+    def screen_size(self) -> tuple[int, int] | None:
+        """主屏幕在输入坐标系中的尺寸（macOS 为 point）；与截图像素一致或未知时返回 None"""
+        return None
+
+    def capture(self, output: str, bounds: Bounds | None = None) -> bool:
+        """截图写入 output（格式由扩展名决定），成功返回 True
+
+        子类至少实现 capture 和 grab 中的一个：能直接拿到像素的后端实现 grab，
+        只能写文件的后端（macOS screencapture）实现 capture。
+        """
+        img = self.grab(bounds)
+        if img is None:
+            return False
+        img.save(output)
+        return True
+
+    def grab(self, bounds: Bounds | None = None) -> Image.Image | None:
+        """截图到内存；默认经由按线程区分的临时 JPEG 文件"""
+        output = f"/tmp/allops_grab_{os.getpid()}_{threading.get_ident()}.jpg"
+        if not self.capture(output, bounds):
+            return None
+        with Image.open(output) as img:
+            img.load()
+        return img
+
+    @abstractmethod
+    def move(self, x: int, y: int) -> None: ...
+
+    @abstractmethod
+    def click(self, x: int, y: int) -> None: ...
+
+    @abstractmethod
+    def type_text(self, text: str) -> None: ...
+
+    @abstractmethod
+    def key_press(self, key: str) -> None: ...
+
+    @abstractmethod
+    def scroll(self, amount: int) -> None:
+        """滚动，正数向下，负数向上"""
+
+    @abstractmethod
+    def open_url(self, url: str) -> None: ...
+
+
+class MacOSBackend(GuiBackend):
+    """macOS：原有的 screencapture / cliclick / osascript 实现"""
+
+    name = "macos"
+    cheap_grab = False
+
+    def activate_browser(self) -> None:
+        # 三条语句放进同一个 osascript，每次截图只启动一个进程
+        subprocess.run(
+            [
+                "osascript",
+                "-e",
+                'tell application "Google Chrome" to activate',
+                "-e",
+                'tell application "System Events" to set frontmost of process "Google Chrome" to true',
+                "-e",
+                'tell application "Google Chrome" to set index of window 1 to 1',
+            ],
+            capture_output=True,
+            check=False,
+        )
+
+    def window_bounds(self) -> Bounds | None:
+        result = subprocess.run(
+            ["osascript", "-e", 'tell application "Google Chrome" to get bounds of front window'],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if result.returncode != 0:
+            return None
+        try:
+            x1, y1, x2, y2 = (int(v.strip()) for v in result.stdout.split(","))
+        except ValueError:
+            return None
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return x1, y1, x2, y2
+
+    def screen_size(self) -> tuple[int, int] | None:
+        # 桌面窗口的边界就是主屏幕的 point 尺寸（Retina 下截图像素是它的 2 倍）
+        if not hasattr(self, "_screen_size"):
+            result = subprocess.run(
+                ["osascript", "-e", 'tell application "Finder" to get bounds of window of desktop'],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            try:
+                x1, y1, x2, y2 = (int(v.strip()) for v in result.stdout.split(","))
+                self._screen_size = (x2 - x1, y2 - y1) if x2 > x1 and y2 > y1 else None
+            except ValueError:
+                self._screen_size = None
+        return self._screen_size
+
+    def capture(self, output: str, bounds: Bounds | None = None) -> bool:
+        cmd = ["screencapture", "-x"]
+        if output.endswith((".jpg", ".jpeg")):
+            cmd += ["-t", "jpg"]
+        if bounds:
+            x1, y1, x2, y2 = bounds
+            cmd += ["-R", f"{x1},{y1},{x2 - x1},{y2 - y1}"]
+        subprocess.run(cmd + [output], check=False)
+        return os.path.exists(output)
+
+    def move(self, x: int, y: int) -> None:
+        subprocess.run(["cliclick", f"m:{x},{y}"], check=False)
+
+    def click(self, x: int, y: int) -> None:
+        subprocess.run(["cliclick", f"c:{x},{y}"], check=False)
+
+    def type_text(self, text: str) -> None:
+        # 中文通过剪贴板 + Cmd+V 输入
+        if _has_cjk(text):
+            subprocess.run(["pbcopy"], input=text.encode("utf-8"), check=False)
+            time.sleep(0.15)
+            subprocess.run(
+                [
+                    "osascript",
+                    "-e",
+                    'tell application "System Events" to keystroke "v" using command down',
+                ],
+                check=False,
+            )
+        else:
+            subprocess.run(["cliclick", f"t:{text}"], check=False)
+
+    def key_press(self, key: str) -> None:
+        subprocess.run(["cliclick", f"kp:{key}"], check=False)
+
+    def scroll(self, amount: int) -> None:
+        subprocess.run(["cliclick", f"w:{amount}"], check=False)
+
+    def open_url(self, url: str) -> None:
+        subprocess.run(["open", "-a", "Google Chrome", url], check=False)
+
+    def _run_batch(self, commands: list[Command]) -> None:
+        """连续的 cliclick 命令合并成一次调用；中文粘贴和紧跟的回车合并成一次 osascript"""
+        pending: list[str] = []
+
+        def flush() -> None:
+            if pending:
+                subprocess.run(["cliclick", *pending], check=False)
+                pending.clear()
+
+        index = 0
+        while index < len(commands):
+            name, *args = commands[index]
+            index += 1
+            if name == "type" and _has_cjk(args[0]):
+                flush()
+                script = 'tell application "System Events"\nkeystroke "v" using command down'
+                if index < len(commands) and commands[index] in (("key", "return"), ("key", "enter")):
+                    script += "\nkey code 36"
+                    index += 1
+                subprocess.run(["pbcopy"], input=args[0].encode("utf-8"), check=False)
+                time.sleep(0.15)
+                subprocess.run(["osascript", "-e", script + "\nend tell"], check=False)
+            elif name == "move":
+                pending.append(f"m:{args[0]},{args[1]}")
+            elif name == "click":
+                pending.append(f"c:{args[0]},{args[1]}")
+            elif name == "type":
+                pending.append(f"t:{args[0]}")
+            elif name == "key":
+                pending.append(f"kp:{args[0]}")
+            elif name == "scroll":
+                pending.append(f"w:{args[0]}")
+        flush()
+
+
+# 按键名 → macOS 虚拟键码
+_MAC_KEYCODES = {
+    "return": 36,
+    "enter": 36,
+    "tab": 48,
+    "space": 49,
+    "delete": 51,
+    "backspace": 51,
+    "esc": 53,
+    "escape": 53,
+    "fwd-delete": 117,
+    "home": 115,
+    "end": 119,
+    "page-up": 116,
+    "page-down": 121,
+    "arrow-left": 123,
+    "arrow-right": 124,
+    "arrow-down": 125,
+    "arrow-up": 126,
+    "left": 123,
+    "right": 124,
+    "down": 125,
+    "up": 126,
+}
+# 字母键（ANSI 布局），用于 cmd+a 之类的组合键
+_MAC_KEYCODES.update(
+    {
+        "a": 0, "s": 1, "d": 2, "f": 3, "h": 4, "g": 5, "z": 6, "x": 7, "c": 8, "v": 9,
+        "b": 11, "q": 12, "w": 13, "e": 14, "r": 15, "y": 16, "t": 17, "o": 31, "u": 32,
+        "i": 34, "p": 35, "l": 37, "j": 38, "k": 40, "n": 45, "m": 46,
+    }
+)  # fmt: skip
+
+
+class QuartzBackend(MacOSBackend):
+    """macOS 进程内会话：PyObjC 直接调用 Quartz（截图 / 事件注入）与 AppKit（激活窗口 / 剪贴板）
+
+    整个运行期间复用同一个事件源与剪贴板对象，每个动作不再启动 cliclick / osascript 子进程；
+    截图前的 3 次 osascript 变成一次 NSRunningApplication 调用。
+    """
+
+    name = "macos"
+    cheap_grab = True
+
+    # 直接拿到像素，不再经过 screencapture 写文件
+    capture = GuiBackend.capture
+    # 逐条调用下面的 Quartz 方法，不再合并成 cliclick / osascript 子进程
+    _run_batch = GuiBackend._run_batch
+
+    def __init__(self) -> None:
+        super().__init__()
+        # 可选依赖：pip install pyobjc-framework-Quartz（会一并安装 AppKit）
+        import AppKit
+        import Quartz
+
+        self._appkit = AppKit
+        self._quartz = Quartz
+        self._source = Quartz.CGEventSourceCreate(Quartz.kCGEventSourceStateHIDSystemState)
+        self._pasteboard = AppKit.NSPasteboard.generalPasteboard()
+        self._modifiers = {
+            "cmd": Quartz.kCGEventFlagMaskCommand,
+            "command": Quartz.kCGEventFlagMaskCommand,
+            "ctrl": Quartz.kCGEventFlagMaskControl,
+            "alt": Quartz.kCGEventFlagMaskAlternate,
+            "option": Quartz.kCGEventFlagMaskAlternate,
+            "shift": Quartz.kCGEventFlagMaskShift,
+        }
+
+    def activate_browser(self) -> None:
+        apps = self._appkit.NSRunningApplication.runningApplicationsWithBundleIdentifier_(
+            "com.google.Chrome"
+        )
+        if not apps:
+            # 浏览器还没启动时交给 AppleScript 拉起
+            super().activate_browser()
+            return
+        apps[0].activateWithOptions_(
+            self._appkit.NSApplicationActivateIgnoringOtherApps
+            | self._appkit.NSApplicationActivateAllWindows
+        )
+
+    def window_bounds(self) -> Bounds | None:
+        q = self._quartz
+        windows = q.CGWindowListCopyWindowInfo(
+            q.kCGWindowListOptionOnScreenOnly | q.kCGWindowListExcludeDesktopElements,
+            q.kCGNullWindowID,
+        )
+        # 窗口按从前到后的顺序排列，第一个普通层级的 Chrome 窗口即前台窗口
+        for window in windows or []:
+            if window.get(q.kCGWindowOwnerName) == "Google Chrome" and window.get(q.kCGWindowLayer) == 0:
+                b = window[q.kCGWindowBounds]
+                x, y = int(b["X"]), int(b["Y"])
+                width, height = int(b["Width"]), int(b["Height"])
+                if width > 0 and height > 0:
+                    return x, y, x + width, y + height
+        return None
+
+    def screen_size(self) -> tuple[int, int] | None:
+        q = self._quartz
+        rect = q.CGDisplayBounds(q.CGMainDisplayID())
+        return int(rect.size.width), int(rect.size.height)
+
+    def grab(self, bounds: Bounds | None = None) -> Image.Image | None:
+        q = self._quartz
+        if bounds:
+            x1, y1, x2, y2 = bounds
+            rect = q.CGRectMake(x1, y1, x2 - x1, y2 - y1)
+        else:
+            rect = q.CGRectInfinite
+        image = q.CGWindowListCreateImage(
+            rect, q.kCGWindowListOptionOnScreenOnly, q.kCGNullWindowID, q.kCGWindowImageDefault
+        )
+        if image is None:
+            return None
+        width, height = q.CGImageGetWidth(image), q.CGImageGetHeight(image)
+        data = q.CGDataProviderCopyData(q.CGImageGetDataProvider(image))
+        return Image.frombuffer(
+            "RGBA", (width, height), bytes(data), "raw", "BGRA", q.CGImageGetBytesPerRow(image), 1
+        ).convert("RGB")
+
+    def _post_mouse(self, kind: int, x: int, y: int) -> None:
+        q = self._quartz
+        event = q.CGEventCreateMouseEvent(self._source, kind, (x, y), q.kCGMouseButtonLeft)
+        q.CGEventPost(q.kCGHIDEventTap, event)
+
+    def _post_key(self, keycode: int, flags: int = 0) -> None:
+        q = self._quartz
+        for down in (True, False):
+            event = q.CGEventCreateKeyboardEvent(self._source, keycode, down)
+            if flags:
+                q.CGEventSetFlags(event, flags)
+            q.CGEventPost(q.kCGHIDEventTap, event)
+
+    def move(self, x: int, y: int) -> None:
+        self._post_mouse(self._quartz.kCGEventMouseMoved, x, y)
+
+    def click(self, x: int, y: int) -> None:
+        self._post_mouse(self._quartz.kCGEventLeftMouseDown, x, y)
+        self._post_mouse(self._quartz.kCGEventLeftMouseUp, x, y)
+
+    def type_text(self, text: str) -> None:
+        q = self._quartz
+        if _has_cjk(text):
+            # 中文仍走剪贴板 + Cmd+V；进程内写剪贴板是同步的，不必等待
+            self._pasteboard.clearContents()
+            self._pasteboard.setString_forType_(text, self._appkit.NSPasteboardTypeString)
+            self._post_key(_MAC_KEYCODES["v"], q.kCGEventFlagMaskCommand)
+            return
+        # 每个事件最多携带 20 个字符
+        for start in range(0, len(text), 20):
+            chunk = text[start : start + 20]
+            for down in (True, False):
+                event = q.CGEventCreateKeyboardEvent(self._source, 0, down)
+                q.CGEventKeyboardSetUnicodeString(event, len(chunk), chunk)
+                q.CGEventPost(q.kCGHIDEventTap, event)
+
+    def key_press(self, key: str) -> None:
+        names = [k.strip().lower() for k in key.split("+")]
+        flags = 0
+        for name in names[:-1]:
+            flags |= self._modifiers.get(name, 0)
+        keycode = _MAC_KEYCODES.get(names[-1])
+        if keycode is None:
+            print(f"⚠️  不支持的按键: {key}")
+            return
+        self._post_key(keycode, flags)
+
+    def scroll(self, amount: int) -> None:
+        q = self._quartz
+        # Quartz 正数向上，与 cliclick 相反
+        event = q.CGEventCreateScrollWheelEvent(self._source, q.kCGScrollEventUnitLine, 1, -amount)
+        q.CGEventPost(q.kCGHIDEventTap, event)
+
+
+# 模型给出的按键名 → pynput Key 名称
+_X11_KEYS = {
+    "enter": "enter",
+    "return": "enter",
+    "esc": "esc",
+    "escape": "esc",
+    "tab": "tab",
+    "space": "space",
+    "backspace": "backspace",
+    "delete": "delete",
+    "up": "up",
+    "down": "down",
+    "left": "left",
+    "right": "right",
+    "arrow-up": "up",
+    "arrow-down": "down",
+    "arrow-left": "left",
+    "arrow-right": "right",
+    "page-up": "page_up",
+    "page-down": "page_down",
+    "home": "home",
+    "end": "end",
+    "ctrl": "ctrl",
+    "cmd": "ctrl",
+    "command": "ctrl",
+    "alt": "alt",
+    "shift": "shift",
+}
+
+
+class X11Backend(GuiBackend):
+    """X 显示（Xvfb 等）：mss 进程内截图，pynput 通过 XTest 注入输入"""
+
+    name = "x11"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # 可选依赖，只有选用 x11 后端时才需要安装
+        import mss
+        from pynput import keyboard, mouse
+
+        # mss 实例不能跨线程共用（页面稳定检测和提前截图在不同线程里截图），每个线程各建一个
+        self._mss_factory = mss.mss
+        self._local = threading.local()
+        self._keyboard = keyboard
+        self._kb = keyboard.Controller()
+        self._mouse = mouse.Controller()
+        self._button = mouse.Button.left
+
+    def activate_browser(self) -> None:
+        # Xvfb 上只跑一个全屏浏览器，无需切换窗口
+        pass
+
+    def window_bounds(self) -> Bounds | None:
+        return None
+
+    def _mss(self):
+        if not hasattr(self._local, "mss"):
+            self._local.mss = self._mss_factory()
+        return self._local.mss
+
+    def grab(self, bounds: Bounds | None = None) -> Image.Image | None:
+        sct = self._mss()
+        if bounds:
+            x1, y1, x2, y2 = bounds
+            region = {"left": x1, "top": y1, "width": x2 - x1, "height": y2 - y1}
+        else:
+            region = sct.monitors[0]
+        shot = sct.grab(region)
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def move(self, x: int, y: int) -> None:
+        self._mouse.position = (x, y)
+
+    def click(self, x: int, y: int) -> None:
+        self._mouse.position = (x, y)
+        self._mouse.click(self._button)
+
+    def type_text(self, text: str) -> None:
+        # pynput 会为非 ASCII 字符临时映射键码，中文也能直接输入
+        self._kb.type(text)
+
+    def _key(self, name: str):
+        name = name.strip().lower()
+        if name in _X11_KEYS:
+            return getattr(self._keyboard.Key, _X11_KEYS[name])
+        return name
+
+    def key_press(self, key: str) -> None:
+        keys = [self._key(k) for k in key.split("+")]
+        for k in keys:
+            self._kb.press(k)
+        for k in reversed(keys):
+            self._kb.release(k)
+
+    def scroll(self, amount: int) -> None:
+        # pynput 正数向上，与 cliclick 相反
+        self._mouse.scroll(0, -amount)
+
+    def open_url(self, url: str) -> None:
+        cmd = [os.getenv("CHROME_BIN", "google-chrome"), "--no-first-run", "--start-maximized"]
+        if os.getenv("CHROME_USER_DATA_DIR"):
+            cmd.append(f"--user-data-dir={os.environ['CHROME_USER_DATA_DIR']}")
+        # 例如 Xvfb 没有窗口管理器时用 --window-position=0,0 --window-size=1280,800 铺满屏幕
+        cmd += os.getenv("CHROME_ARGS", "").split()
+        subprocess.Popen(cmd + [url], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# 内置的模拟页面：搜索首页 → 结果页 → 新闻详情
+DEFAULT_SIM_PAGES = {
+    "start": "home",
+    "pages": {
+        "home": {
+            "title": "搜索首页",
+            "elements": [
+                {"id": "search", "kind": "input", "box": [340, 300, 840, 350], "on_enter": "results"},
+                {"id": "go", "kind": "button", "label": "百度一下", "box": [850, 300, 960, 350], "goto": "results"},
+            ],
+        },
+        "results": {
+            "title": "搜索结果",
+            "elements": [
+                {"id": "r1", "kind": "link", "label": "俄乌冲突最新进展", "box": [120, 160, 620, 190], "goto": "article"},
+                {"id": "r2", "kind": "link", "label": "拉夫罗夫就俄乌冲突发表讲话", "box": [120, 260, 620, 290], "goto": "article"},
+                {"id": "r3", "kind": "link", "label": "天气预报", "box": [120, 360, 620, 390], "goto": "article"},
+            ],
+        },
+        "article": {
+            "title": "新闻详情",
+            "elements": [{"id": "body", "kind": "text", "label": "正文内容", "box": [120, 160, 900, 600]}],
+        },
+    },
+}
+
+
+class SimulatedDesktop(GuiBackend):
+    """确定性的模拟桌面：按脚本渲染页面，点击/输入/回车会改变页面状态"""
+
+    name = "sim"
+
+    def __init__(self, spec: dict | None = None, size: tuple[int, int] | None = None) -> None:
+        super().__init__()
+        if spec is None and os.getenv("SIM_PAGES"):
+            with open(os.environ["SIM_PAGES"], encoding="utf-8") as f:
+                spec = json.load(f)
+        self.spec = spec or DEFAULT_SIM_PAGES
+        if size is None:
+            w, h = os.getenv("SIM_SCREEN", "1280x800").lower().split("x")
+            size = (int(w), int(h))
+        self.size = size
+        self.page = self.spec["start"]
+        self.values: dict[str, str] = {}
+        self.focused: str | None = None
+        self.scroll_y = 0
+        self.cursor = (0, 0)
+        self.events: list[dict] = []
+        font_path = os.getenv("SIM_FONT")
+        self.font = ImageFont.truetype(font_path, 20) if font_path else ImageFont.load_default()
+
+    def _elements(self) -> list[dict]:
+        return self.spec["pages"][self.page]["elements"]
+
+    def _navigate(self, page: str) -> None:
+        self.page = page
+        self.focused = None
+        self.scroll_y = 0
+        self.events.append({"event": "navigate", "page": page})
+
+    def render(self) -> Image.Image:
+        img = Image.new("RGB", self.size, "white")
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([0, 0, self.size[0], 60], fill=(235, 235, 235))
+        draw.text((20, 20), self.spec["pages"][self.page]["title"], fill="black", font=self.font)
+
+        for el in self._elements():
+            x1, y1, x2, y2 = el["box"]
+            y1, y2 = y1 - self.scroll_y, y2 - self.scroll_y
+            kind = el.get("kind")
+            label = self.values.get(el["id"], "") if kind == "input" else el.get("label", "")
+            if kind == "button":
+                draw.rectangle([x1, y1, x2, y2], fill=(50, 100, 230))
+                draw.text((x1 + 10, y1 + 12), label, fill="white", font=self.font)
+            elif kind == "input":
+                outline = (50, 100, 230) if self.focused == el["id"] else (160, 160, 160)
+                draw.rectangle([x1, y1, x2, y2], outline=outline, width=2)
+                draw.text((x1 + 10, y1 + 12), label, fill="black", font=self.font)
+            elif kind == "link":
+                draw.text((x1, y1 + 4), label, fill=(30, 30, 200), font=self.font)
+            else:
+                draw.text((x1, y1), label, fill="black", font=self.font)
+        return img
+
+    def activate_browser(self) -> None:
+        pass
+
+    def window_bounds(self) -> Bounds | None:
+        return None
+
+    def grab(self, bounds: Bounds | None = None) -> Image.Image | None:
+        img = self.render()
+        return img.crop(bounds) if bounds else img
+
+    def move(self, x: int, y: int) -> None:
+        self.cursor = (x, y)
+
+    def click(self, x: int, y: int) -> None:
+        self.cursor = (x, y)
+        self.events.append({"event": "click", "x": x, "y": y, "page": self.page})
+        for el in self._elements():
+            x1, y1, x2, y2 = el["box"]
+            if x1 <= x <= x2 and y1 - self.scroll_y <= y <= y2 - self.scroll_y:
+                if el.get("kind") == "input":
+                    self.focused = el["id"]
+                elif el.get("goto"):
+                    self._navigate(el["goto"])
+                return
+        self.focused = None
+
+    def type_text(self, text: str) -> None:
+        self.events.append({"event": "type", "text": text, "page": self.page})
+        if self.focused:
+            self.values[self.focused] = self.values.get(self.focused, "") + text
+
+    def key_press(self, key: str) -> None:
+        self.events.append({"event": "key", "key": key, "page": self.page})
+        if key.lower() in ("enter", "return") and self.focused:
+            for el in self._elements():
+                if el["id"] == self.focused and el.get("on_enter"):
+                    self._navigate(el["on_enter"])
+                    return
+
+    def scroll(self, amount: int) -> None:
+        self.scroll_y = max(0, self.scroll_y + amount * 20)
+
+    def open_url(self, url: str) -> None:
+        self.events.append({"event": "open_url", "url": url})
+        self._navigate(self.spec["start"])
+
+
+_BACKENDS = {
+    "macos": MacOSBackend,
+    "x11": X11Backend,
+    "sim": SimulatedDesktop,
+}
+
+_backend: GuiBackend | None = None
+
+
+def set_backend(backend: GuiBackend) -> None:
+    """替换进程内的后端（例如轨迹回放时使用录制的画面）"""
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> GuiBackend:
+    """进程内共享的后端实例（由 GUI_BACKEND 选择）"""
+    global _backend
+    if _backend is None:
+        if GUI_BACKEND not in _BACKENDS:
+            raise ValueError(f"未知的 GUI_BACKEND: {GUI_BACKEND}（可选 {', '.join(_BACKENDS)}）")
+        if GUI_BACKEND == "macos" and MACOS_INPUT_SESSION:
+            try:
+                _backend = QuartzBackend()
+            except ImportError as e:
+                print(f"⚠️  PyObjC 不可用，macOS 输入退回命令行工具（每个动作一个子进程）: {e}")
+        if _backend is None:
+            _backend = _BACKENDS[GUI_BACKEND]()
+    return _backend
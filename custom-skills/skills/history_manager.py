@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+history_manager.py - 大脑提示词中的历史步骤压缩
+
+smart_execute 以前把全部历史原样拼进提示词，长任务的上下文越来越大。
+这里保留最近 N 步原文，更早的步骤折叠成一行紧凑摘要，整体控制在 token 预算内：
+- 摘要里去掉坐标等细节，每步截断到固定长度
+- 仍然超出预算时从最早的步骤开始省略，只保留数量
+
+环境变量：
+- HISTORY_KEEP_RECENT: 原样保留的最近步数（默认 5）
+- HISTORY_TOKEN_BUDGET: 历史部分的 token 预算（默认 400）
+"""
+
+import os
+import re
+
+HISTORY_KEEP_RECENT = int(os.getenv("HISTORY_KEEP_RECENT", "5"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+
+# 摘要中每一步最多保留的字符数
+SUMMARY_STEP_CHARS = 24
+
+_COORD_RE = re.compile(r"\s*\(\s*-?\d+\s*,\s*-?\d+\s*\)")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其他约 4 字符 1 token"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compact_step(description: str) -> str:
+    """压缩单步描述：去掉坐标并截断"""
+    text = _COORD_RE.sub("", description).strip()
+    if len(text) > SUMMARY_STEP_CHARS:
+        text = text[: SUMMARY_STEP_CHARS - 1] + "…"
+    return text
+
+
+class HistoryManager:
+    """保存执行历史，并按 token 预算渲染给大脑"""
+
+    def __init__(
+        self,
+        keep_recent: int = HISTORY_KEEP_RECENT,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+    ) -> None:
+        self.keep_recent = keep_recent
+        self.token_budget = token_budget
+        self.steps: list[str] = []
+
+    def append(self, description: str) -> None:
+        self.steps.append(description)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def render(self) -> str:
+        """最近几步原文 + 更早步骤的摘要"""
+        split = max(0, len(self.steps) - self.keep_recent)
+        older, recent = self.steps[:split], self.steps[split:]
+
+        recent_text = "\n".join(f"{split + i + 1}. {h}" for i, h in enumerate(recent))
+        if not older:
+            return recent_text
+
+        budget = self.token_budget - estimate_tokens(recent_text)
+        summary = self._summarize(older, budget)
+        return summary + ("\n" + recent_text if recent_text else "")
+
+    def _summarize(self, older: list[str], budget: int) -> str:
+        compacted = [compact_step(h) for h in older]
+
+        # 从最早的步骤开始丢弃，直到摘要放得进预算
+        dropped = 0
+        while True:
+            kept = compacted[dropped:]
+            prefix = f"（前 {dropped} 步已省略）" if dropped else ""
+            summary = f"第 1-{len(older)} 步摘要：{prefix}" + "；".join(kept)
+            if estimate_tokens(summary) <= budget or not kept:
+                return summary
+            dropped += 1
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+location_cache.py - GUI-plus 定位结果缓存
+
+同一个元素（例如“页面中央的搜索框”）在几乎相同的画面上被反复定位时，
+直接复用上一次的坐标，省掉一次完整的视觉模型往返。
+
+- 键：画面的感知哈希（dHash）+ 归一化后的 target_description
+- 命中判定：描述相同且哈希汉明距离不超过阈值
+- 点击前用目标点附近的小块像素做一次廉价校验，不一致则视为未命中
+- LRU 淘汰，可选持久化到磁盘（JSON）；多个进程共用同一个文件时，保存前在文件锁内合并其他进程写入的条目
+
+坐标以图片内的相对位置（0-1）保存，窗口移动后仍可映射回正确的屏幕坐标。
+
+环境变量：
+- LOCATION_CACHE_SIZE: 最多缓存条目数（默认 256）
+- LOCATION_CACHE_PATH: 持久化文件路径，为空则只在内存中缓存
+- LOCATION_CACHE_MAX_DISTANCE: 画面哈希允许的最大汉明距离（默认 6）
+- LOCATION_CACHE_PATCH_THRESHOLD: 像素校验允许的平均差（0-1，默认 0.04）
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from PIL import Image, ImageChops, ImageStat
+
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", "256"))
+LOCATION_CACHE_PATH = os.getenv("LOCATION_CACHE_PATH", "")
+LOCATION_CACHE_MAX_DISTANCE = int(os.getenv("LOCATION_CACHE_MAX_DISTANCE", "6"))
+LOCATION_CACHE_PATCH_THRESHOLD = float(os.getenv("LOCATION_CACHE_PATCH_THRESHOLD", "0.04"))
+
+PATCH_SIZE = 16
+# 校验块占图片宽度的比例
+PATCH_SPAN = 0.03
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """差值哈希：对轻微渲染差异不敏感的 64 位画面指纹"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def normalize_description(description: str) -> str:
+    """归一化目标描述：统一引号、去掉空白与大小写差异"""
+    text = description.strip().lower()
+    text = re.sub(r"[‘’“”「」『』\"`]", "'", text)
+    return re.sub(r"\s+", "", text)
+
+
+def extract_patch(image: Image.Image, nx: float, ny: float) -> Image.Image:
+    """截取相对坐标 (nx, ny) 附近的一小块灰度像素"""
+    width, height = image.size
+    half = max(4, round(width * PATCH_SPAN / 2))
+    cx, cy = round(nx * width), round(ny * height)
+    box = (
+        max(0, cx - half),
+        max(0, cy - half),
+        min(width, cx + half),
+        min(height, cy + half),
+    )
+    return image.crop(box).convert("L").resize((PATCH_SIZE, PATCH_SIZE), Image.BILINEAR)
+
+
+@contextmanager
+def locked(path: str) -> Iterator[None]:
+    """多个进程读改写同一个持久化文件时互斥（锁文件为 path.lock）"""
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_json(path: str, data) -> None:
+    """先写本进程 / 线程自己的临时文件再替换，读者不会看到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_json(path: str, label: str):
+    """读取持久化文件；不存在或读取失败时返回 None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  {label}读取失败，忽略: {e}")
+        return None
+
+
+def valid_entry(key, entry) -> bool:
+    """持久化文件 / 轨迹宏里读到的条目结构是否完整（坐标在 0-1 之间，像素块长度正确）"""
+    if not isinstance(key, str) or not isinstance(entry, dict):
+        return False
+    desc, frame_hash, patch = entry.get("desc"), entry.get("hash"), entry.get("patch")
+    if not isinstance(desc, str) or not isinstance(frame_hash, int) or isinstance(frame_hash, bool):
+        return False
+    for name in ("nx", "ny"):
+        value = entry.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1:
+            return False
+    if not isinstance(patch, str) or len(patch) != PATCH_SIZE * PATCH_SIZE * 2:
+        return False
+    try:
+        bytes.fromhex(patch)
+    except ValueError:
+        return False
+    return True
+
+
+class LocationCache:
+    """按画面指纹 + 目标描述缓存 GUI-plus 的定位结果"""
+
+    def __init__(
+        self,
+        capacity: int = LOCATION_CACHE_SIZE,
+        path: str = LOCATION_CACHE_PATH,
+        max_distance: int = LOCATION_CACHE_MAX_DISTANCE,
+        patch_threshold: float = LOCATION_CACHE_PATCH_THRESHOLD,
+    ) -> None:
+        self.capacity = capacity
+        self.path = path
+        self.max_distance = max_distance
+        self.patch_threshold = patch_threshold
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        # 本次运行命中或写入过的条目（轨迹宏保存时一并带上）
+        self.touched: set[str] = set()
+        # 本次运行删除的条目：保存时合并文件里的条目，不把它们加回来
+        self.removed: set[str] = set()
+        self._load()
+
+    def lookup(
+        self, image: Image.Image, description: str, frame_hash: int | None = None
+    ) -> tuple[float, float] | None:
+        """查找缓存的相对坐标；命中时已通过像素校验（frame_hash 可传入已算好的 dHash）"""
+        desc = normalize_description(description)
+        frame_hash = dhash(image) if frame_hash is None else frame_hash
+
+        best_key, best_distance = None, self.max_distance + 1
+        for key, entry in self.entries.items():
+            if entry["desc"] != desc:
+                continue
+            distance = hamming(frame_hash, entry["hash"])
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        entry = self.entries[best_key]
+        nx, ny = entry["nx"], entry["ny"]
+        cached_patch = Image.frombytes("L", (PATCH_SIZE, PATCH_SIZE), bytes.fromhex(entry["patch"]))
+
+        # 廉价像素校验：目标点附近的像素必须与缓存时一致
+        patch = extract_patch(image, nx, ny)
+        diff = ImageStat.Stat(ImageChops.difference(patch, cached_patch)).mean[0] / 255.0
+        if diff > self.patch_threshold:
+            self.rejected += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(best_key)
+        self.touched.add(best_key)
+        self.hits += 1
+        return nx, ny
+
+    def store(
+        self,
+        image: Image.Image,
+        description: str,
+        nx: float,
+        ny: float,
+        frame_hash: int | None = None,
+    ) -> None:
+        """记录一次成功的定位（相对坐标）"""
+        desc = normalize_description(description)
+        frame_hash = dhash(image) if frame_hash is None else frame_hash
+        key = f"{frame_hash:016x}|{desc}"
+
+        self.removed.discard(key)
+        self.entries[key] = {
+            "desc": desc,
+            "hash": frame_hash,
+            "nx": nx,
+            "ny": ny,
+            "patch": extract_patch(image, nx, ny).tobytes().hex(),
+        }
+        self.entries.move_to_end(key)
+        self.touched.add(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        self._save()
+
+    def touched_entries(self) -> list[tuple[str, dict]]:
+        return [(key, self.entries[key]) for key in self.touched if key in self.entries]
+
+    def seed(self, entries: list[tuple[str, dict]]) -> None:
+        """预置条目（例如轨迹宏带来的定位），已有的条目不覆盖，结构不完整的丢弃"""
+        for key, entry in entries:
+            if valid_entry(key, entry):
+                self.entries.setdefault(key, entry)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, image: Image.Image, description: str) -> None:
+        """点击结果不对时，删除这条缓存"""
+        desc = normalize_description(description)
+        frame_hash = dhash(image)
+        for key in [
+            k
+            for k, e in self.entries.items()
+            if e["desc"] == desc and hamming(frame_hash, e["hash"]) <= self.max_distance
+        ]:
+            del self.entries[key]
+            self.removed.add(key)
+        self._save()
+
+    def _read_file(self) -> list[tuple[str, dict]]:
+        """持久化文件里结构完整的条目（按文件中的顺序）"""
+        data = read_json(self.path, "定位缓存")
+        if data is None:
+            return []
+        entries = data.get("entries") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            print("⚠️  定位缓存文件格式不对，忽略")
+            return []
+        valid = [item for item in entries if isinstance(item, list) and len(item) == 2 and valid_entry(*item)]
+        if len(valid) < len(entries):
+            print(f"⚠️  定位缓存文件中有 {len(entries) - len(valid)} 条损坏的条目，已忽略")
+        return [(key, entry) for key, entry in valid]
+
+    def _load(self) -> None:
+        for key, entry in self._read_file():
+            self.entries[key] = entry
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        with locked(self.path):
+            # 其他进程（并发会话）写入、本进程还没有的条目排在最旧的位置，超出容量时先淘汰
+            for key, entry in reversed(self._read_file()):
+                if key not in self.entries and key not in self.removed:
+                    self.entries[key] = entry
+                    self.entries.move_to_end(key, last=False)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            write_json(self.path, {"entries": list(self.entries.items())})
+
+    def print_summary(self) -> None:
+        total = self.hits + self.misses
+        if not total:
+            return
+        print(
+            f"\n🗂️  定位缓存: 命中 {self.hits}/{total} ({self.hits / total:.0%})，"
+            f"像素校验拒绝 {self.rejected} 次，当前 {len(self.entries)} 条"
+        )
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+macro_cache.py - 轨迹宏：重放学到的工作流，跳过大脑调用
+
+同样的工作流（打开网站、搜索某个词、点开结果）每天要跑很多次，每次都要为每一步重新请求 qwen3-max。
+这里把成功完成的 smart_execute 轨迹保存成“宏”：
+- 键：归一化后的目标模板（引号里的文字和数字换成占位符，例如 搜索'天气' → 搜索'{0}'）
+- 每一轮记录这一轮开始时的画面指纹（dHash）和执行的动作，动作里出现的占位符文字同样替换掉
+- 同时带上这次运行用到的定位缓存条目，重放时点击也不必请求 GUI-plus（仍做像素校验）
+
+新的运行先按模板找宏，每一轮截图后与宏中后续步骤的画面指纹比对：
+- 指纹一致（汉明距离不超过阈值）就直接执行记录的动作，检查点照常验证
+- 画面与记录不符、或重放的动作偏离时才调用大脑，之后的画面重新对上时继续重放
+- 任务成功结束后用这次的轨迹更新宏；多个进程共用同一个文件时，保存前在文件锁内合并其他进程保存的宏
+- 宏里只有会改变画面的动作：FINISH / FAIL 不记录也不重放，任务是否完成每次都交给大脑判断
+
+环境变量：
+- MACRO_CACHE: 是否开启轨迹宏（默认 1）
+- MACRO_CACHE_PATH: 宏的持久化文件（默认 /tmp/allops_macros.json）
+- MACRO_MAX_DISTANCE: 画面指纹允许的最大汉明距离（默认 4，比定位缓存更严格，因为输入类动作不再定位）
+- MACRO_CACHE_SIZE: 最多保存的宏数量（默认 64）
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+
+from location_cache import hamming, locked, normalize_description, read_json, write_json
+
+MACRO_CACHE = os.getenv("MACRO_CACHE", "1") == "1"
+MACRO_CACHE_PATH = os.getenv("MACRO_CACHE_PATH", "/tmp/allops_macros.json")
+MACRO_MAX_DISTANCE = int(os.getenv("MACRO_MAX_DISTANCE", "4"))
+MACRO_CACHE_SIZE = int(os.getenv("MACRO_CACHE_SIZE", "64"))
+
+# 目标中的可变部分：中英文引号、书名号里的文字，以及数字
+_SLOT_RE = re.compile(
+    r"'[^']+'|\"[^\"]+\"|‘[^’]+’|“[^”]+”|「[^」]+」|《[^》]+》|\d+(?:\.\d+)?"
+)
+_QUOTES = "'\"‘’“”「」《》"
+
+# 结束类动作：由大脑确认，不从宏里重放（旧版本保存的宏里可能带着）
+_TERMINAL = ("FINISH", "FAIL")
+
+
+def goal_template(goal: str) -> tuple[str, list[str]]:
+    """把目标拆成模板和槽位值：搜索'天气'第2页 → (搜索'{0}'第{1}页, ['天气', '2'])"""
+    slots: list[str] = []
+    parts: list[str] = []
+    last = 0
+    for match in _SLOT_RE.finditer(goal):
+        parts.append(normalize_description(goal[last : match.start()]))
+        raw = match.group()
+        value = raw.strip(_QUOTES) if raw[0] in _QUOTES else raw
+        parts.append(("'{%d}'" if raw[0] in _QUOTES else "{%d}") % len(slots))
+        slots.append(value)
+        last = match.end()
+    parts.append(normalize_description(goal[last:]))
+    return "".join(parts), slots
+
+
+def _marker(index: int) -> str:
+    return f"⟦{index}⟧"
+
+
+def _map_strings(value, fn):
+    if isinstance(value, str):
+        return fn(value)
+    if isinstance(value, list):
+        return [_map_strings(v, fn) for v in value]
+    if isinstance(value, dict):
+        return {k: _map_strings(v, fn) for k, v in value.items()}
+    return value
+
+
+def abstract_actions(actions: list, slots: list[str]) -> list:
+    """动作中出现的槽位值换成占位符（长的先换，避免 '12' 里的 '1' 被误换）"""
+    order = sorted(range(len(slots)), key=lambda i: len(slots[i]), reverse=True)
+
+    def replace(text: str) -> str:
+        for i in order:
+            if slots[i]:
+                text = text.replace(slots[i], _marker(i))
+        return text
+
+    return _map_strings(actions, replace)
+
+
+def fill_actions(actions: list, slots: list[str]) -> list:
+    """占位符换回本次目标的槽位值"""
+    return _map_strings(actions, lambda text: _fill(text, slots))
+
+
+def _fill(text: str, slots: list[str]) -> str:
+    for i, value in enumerate(slots):
+        text = text.replace(_marker(i), value)
+    return text
+
+
+def _map_anchor(key: str, entry: dict, fn) -> list:
+    """只替换定位缓存条目里的描述；键中的 dHash 与像素 patch 原样保留"""
+    frame_hash, _, _ = key.partition("|")
+    desc = fn(entry["desc"])
+    return [f"{frame_hash}|{desc}", {**entry, "desc": desc}]
+
+
+def abstract_anchors(anchors: list, slots: list[str]) -> list:
+    return [_map_anchor(key, entry, lambda d: abstract_actions(d, slots)) for key, entry in anchors]
+
+
+def fill_anchors(anchors: list, slots: list[str]) -> list[tuple[str, dict]]:
+    return [tuple(_map_anchor(key, entry, lambda d: _fill(d, slots))) for key, entry in anchors]
+
+
+class MacroPlayer:
+    """按画面指纹逐轮匹配一条宏"""
+
+    def __init__(self, macro: dict, slots: list[str], max_distance: int) -> None:
+        self.macro = macro
+        self.slots = slots
+        self.max_distance = max_distance
+        self.position = 0
+
+    def match(self, frame_hash: int) -> list[dict] | None:
+        """当前画面对得上宏中后续某一步时返回该步的动作（已填入槽位），否则返回 None"""
+        steps = self.macro["steps"]
+        for index in range(self.position, len(steps)):
+            if any(a.get("action") in _TERMINAL for a in steps[index]["actions"]):
+                continue
+            distance = hamming(frame_hash, steps[index]["hash"])
+            if distance <= self.max_distance:
+                self.position = index + 1
+                print(
+                    f"♻️  轨迹宏命中第 {index + 1}/{len(steps)} 步（画面指纹距离 {distance}），跳过大脑"
+                )
+                return fill_actions(steps[index]["actions"], self.slots)
+        return None
+
+
+class MacroRecorder:
+    """收集一次运行中完整执行的每一轮，成功结束后保存成宏"""
+
+    def __init__(self, goal: str) -> None:
+        self.template, self.slots = goal_template(goal)
+        self.steps: list[dict] = []
+
+    def add_step(self, frame_hash: int, actions: list[dict]) -> None:
+        actions = [a for a in actions if a.get("action") not in _TERMINAL]
+        if not actions:
+            return
+        self.steps.append(
+            {"hash": frame_hash, "actions": abstract_actions(actions, self.slots)}
+        )
+
+
+class MacroStore:
+    """按目标模板保存宏，并统计多少轮是由宏直接执行的"""
+
+    def __init__(
+        self,
+        path: str = MACRO_CACHE_PATH,
+        capacity: int = MACRO_CACHE_SIZE,
+        max_distance: int = MACRO_MAX_DISTANCE,
+    ) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.macros: OrderedDict[str, dict] = OrderedDict()
+        self.served = 0
+        self.total = 0
+        self._load()
+
+    def player(self, goal: str) -> MacroPlayer | None:
+        """本次目标有对应的宏时返回重放器"""
+        template, slots = goal_template(goal)
+        macro = self.macros.get(template)
+        if not macro:
+            return None
+        print(f"♻️  找到轨迹宏（{len(macro['steps'])} 轮，已使用 {macro['uses']} 次）: {template}")
+        macro["uses"] += 1
+        self.macros.move_to_end(template)
+        return MacroPlayer(macro, slots, self.max_distance)
+
+    def anchors(self, goal: str) -> list[tuple[str, dict]]:
+        """宏里保存的定位缓存条目（已填入本次目标的槽位值）"""
+        template, slots = goal_template(goal)
+        macro = self.macros.get(template)
+        if not macro:
+            return []
+        return fill_anchors(macro.get("anchors", []), slots)
+
+    def count(self, served: bool) -> None:
+        self.total += 1
+        self.served += int(served)
+
+    def save(self, recorder: MacroRecorder, anchors: list[tuple[str, dict]]) -> None:
+        """用成功完成的轨迹更新宏（同一模板只保留最近一次）"""
+        if not recorder.steps:
+            return
+        previous = self.macros.get(recorder.template, {})
+        self.macros[recorder.template] = {
+            "template": recorder.template,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "uses": previous.get("uses", 0),
+            "steps": recorder.steps,
+            "anchors": abstract_anchors(anchors, recorder.slots),
+        }
+        self.macros.move_to_end(recorder.template)
+        while len(self.macros) > self.capacity:
+            self.macros.popitem(last=False)
+        self._save()
+        print(f"💾 轨迹宏已保存（{len(recorder.steps)} 轮）: {recorder.template}")
+
+    def _read_file(self) -> list[dict]:
+        data = read_json(self.path, "轨迹宏")
+        if not isinstance(data, dict) or not isinstance(data.get("macros"), list):
+            return []
+        return [m for m in data["macros"] if isinstance(m, dict) and isinstance(m.get("template"), str)]
+
+    def _load(self) -> None:
+        for macro in self._read_file()[-self.capacity :]:
+            self.macros[macro["template"]] = macro
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        with locked(self.path):
+            # 其他进程（并发会话）保存、本进程还没有的宏排在最旧的位置，超出容量时先淘汰
+            for macro in reversed(self._read_file()):
+                if macro["template"] not in self.macros:
+                    self.macros[macro["template"]] = macro
+                    self.macros.move_to_end(macro["template"], last=False)
+            while len(self.macros) > self.capacity:
+                self.macros.popitem(last=False)
+            write_json(self.path, {"macros": list(self.macros.values())})
+
+    def print_summary(self) -> None:
+        if not self.total:
+            return
+        print(
+            f"\n♻️  轨迹宏: {self.served}/{self.total} 轮由缓存直接执行 "
+            f"({self.served / self.total:.0%})，当前 {len(self.macros)} 条宏"
+        )
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+model_gateway.py - GUI 代理共用的模型网关
+
+allops_smart_v3.py 和 search_click_real_guiplus.py 都通过这里调用 DashScope：
+- 进程内只有一个长连接池（httpx keep-alive），不再每一步都重新握手 TLS
+- 按模型设置超时
+- 连接错误 / 超时 / 限流 / 5xx 时按带抖动的指数退避重试
+- 记录每次调用的耗时与 token 用量，结束时打印汇总
+- chat_stream 支持流式输出，边收边把已累积的文本交给回调；回调返回 True 时提前结束读取
+- observers 可以订阅每次成功调用（用于轨迹录制）；有订阅者时，提前结束读取的流式调用会在后台
+  把剩余输出读完再通知，订阅者拿到的是完整回复和真实的端到端耗时（调用方不必等待）
+- limiter 限制每分钟调用数与同时在途的调用数，可以在多个进程之间共享（多会话并发时使用）
+- 可选的请求对冲：流式调用超过历史首包耗时的某个分位数还没有响应，就再发一个相同请求，
+  先收到首个分片的一路胜出，另一路关闭；对冲请求数受预算比例限制
+
+环境变量：
+- DASHSCOPE_API_KEY / DASHSCOPE_BASE_URL
+- GATEWAY_TIMEOUT: 默认超时秒数（默认 60）
+- GATEWAY_TIMEOUT_<MODEL>: 某个模型的超时，例如 GATEWAY_TIMEOUT_GUI_PLUS=30
+- GATEWAY_MAX_RETRIES: 最大重试次数（默认 2）
+- GATEWAY_BACKOFF_BASE / GATEWAY_BACKOFF_MAX: 退避基数与上限秒数（默认 0.5 / 8）
+- GATEWAY_POOL_SIZE: 连接池大小（默认 8）
+- GATEWAY_RATE_LIMIT: 每分钟最多发起的调用数，0 表示不限（默认 0）
+- GATEWAY_MAX_CONCURRENT: 同时在途的调用数上限，0 表示不限（默认 0）
+- GATEWAY_HEDGE: 是否开启请求对冲（默认 0）
+- GATEWAY_HEDGE_PERCENTILE: 对冲等待时间取首包耗时的哪个分位数（默认 90）
+- GATEWAY_HEDGE_MIN_DELAY: 对冲等待时间下限秒数（默认 0.5）
+- GATEWAY_HEDGE_MIN_SAMPLES: 某个模型至少有多少个首包耗时样本后才开始对冲（默认 5）
+- GATEWAY_HEDGE_BUDGET: 对冲请求最多占该模型请求数的比例（默认 0.1）
+"""
+
+import concurrent.futures
+import contextlib
+import dataclasses
+import itertools
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+import httpx
+import openai
+from openai import OpenAI
+
+from step_tracer import get_tracer, percentile
+
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "sk-xxxxxxxxxx")
+DASHSCOPE_BASE_URL = os.getenv(
+    "DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
+)
+
+GATEWAY_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT", "60"))
+GATEWAY_MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+GATEWAY_BACKOFF_BASE = float(os.getenv("GATEWAY_BACKOFF_BASE", "0.5"))
+GATEWAY_BACKOFF_MAX = float(os.getenv("GATEWAY_BACKOFF_MAX", "8"))
+GATEWAY_POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", "8"))
+GATEWAY_RATE_LIMIT = float(os.getenv("GATEWAY_RATE_LIMIT", "0"))
+GATEWAY_MAX_CONCURRENT = int(os.getenv("GATEWAY_MAX_CONCURRENT", "0"))
+GATEWAY_HEDGE = os.getenv("GATEWAY_HEDGE", "0") == "1"
+GATEWAY_HEDGE_PERCENTILE = float(os.getenv("GATEWAY_HEDGE_PERCENTILE", "90"))
+GATEWAY_HEDGE_MIN_DELAY = float(os.getenv("GATEWAY_HEDGE_MIN_DELAY", "0.5"))
+GATEWAY_HEDGE_MIN_SAMPLES = int(os.getenv("GATEWAY_HEDGE_MIN_SAMPLES", "5"))
+GATEWAY_HEDGE_BUDGET = float(os.getenv("GATEWAY_HEDGE_BUDGET", "0.1"))
+
+# 各模型的默认超时（秒），可被 GATEWAY_TIMEOUT_<MODEL> 覆盖
+MODEL_TIMEOUTS = {
+    "qwen3-max": 60.0,
+    "gui-plus": 30.0,
+}
+
+# 值得重试的错误：连接失败、超时、限流、服务端错误
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+@dataclass
+class CallRecord:
+    """一次模型调用的耗时与用量"""
+
+    model: str
+    latency: float
+    attempts: int
+    ok: bool
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    first_token: float | None = None
+    hedged: bool = False
+    hedge_won: bool = False
+
+
+def model_timeout(model: str) -> float:
+    env_name = "GATEWAY_TIMEOUT_" + model.upper().replace("-", "_").replace(".", "_")
+    if os.getenv(env_name):
+        return float(os.environ[env_name])
+    return MODEL_TIMEOUTS.get(model, GATEWAY_TIMEOUT)
+
+
+def backoff_delay(attempt: int) -> float:
+    """带完全抖动的指数退避"""
+    cap = min(GATEWAY_BACKOFF_MAX, GATEWAY_BACKOFF_BASE * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+class RateLimiter:
+    """模型调用限流：每分钟调用数 + 同时在途调用数
+
+    内部只用 multiprocessing 的锁 / 共享值 / 信号量，同一个实例可以传给子进程共享额度。
+    """
+
+    def __init__(
+        self,
+        per_minute: float = GATEWAY_RATE_LIMIT,
+        max_concurrent: int = GATEWAY_MAX_CONCURRENT,
+        ctx=None,
+    ) -> None:
+        ctx = ctx or multiprocessing.get_context()
+        self.per_minute = per_minute
+        self.max_concurrent = max_concurrent
+        self._interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = ctx.Lock()
+        self._next_slot = ctx.Value("d", 0.0, lock=False)
+        self._slots = ctx.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+
+    def __enter__(self) -> "RateLimiter":
+        if self._slots:
+            self._slots.acquire()
+        if self._interval:
+            # 跨进程用墙钟排队：每次调用占一个 interval 宽的时间槽
+            with self._lock:
+                now = time.time()
+                start = max(now, self._next_slot.value)
+                self._next_slot.value = start + self._interval
+            if start > now:
+                time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._slots:
+            self._slots.release()
+
+
+class _OpenedStream:
+    """已收到首个分片的流式响应；关闭时一并释放限流额度"""
+
+    def __init__(self, stream, chunks: Iterator, release: contextlib.ExitStack) -> None:
+        self.stream = stream
+        self.chunks = chunks
+        self._release = release
+        self.hedged = False
+        self.hedge_won = False
+
+    def close(self) -> None:
+        try:
+            self.stream.close()
+        finally:
+            self._release.close()
+
+    def __enter__(self) -> "_OpenedStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _close_loser(future: concurrent.futures.Future) -> None:
+    """对冲中输掉的一路：一拿到响应就关闭"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class ModelGateway:
+    """基于长连接池的 OpenAI 兼容客户端封装"""
+
+    def __init__(
+        self,
+        api_key: str = DASHSCOPE_API_KEY,
+        base_url: str = DASHSCOPE_BASE_URL,
+        max_retries: int = GATEWAY_MAX_RETRIES,
+        pool_size: int = GATEWAY_POOL_SIZE,
+    ) -> None:
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=300,
+            ),
+            timeout=httpx.Timeout(GATEWAY_TIMEOUT, connect=10.0),
+        )
+        # 重试由网关自己做（带抖动），SDK 内部不再重试
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        self.records: list[CallRecord] = []
+        # 每次成功调用后回调 observer(record, messages, text)
+        self.observers: list[Callable[[CallRecord, list[dict], str], None]] = []
+        self._drains: list[threading.Thread] = []
+        self.limiter: RateLimiter | None = (
+            RateLimiter() if GATEWAY_RATE_LIMIT > 0 or GATEWAY_MAX_CONCURRENT > 0 else None
+        )
+        # 请求对冲：每个模型最近的首包耗时样本，以及请求 / 对冲 / 对冲胜出次数
+        self.hedge = GATEWAY_HEDGE
+        self.hedge_stats: dict[str, dict[str, int]] = {}
+        self._first_chunk: dict[str, deque[float]] = {}
+        self._hedge_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="hedge"
+        )
+
+    def _throttle(self) -> contextlib.AbstractContextManager:
+        return self.limiter or contextlib.nullcontext()
+
+    def warm_up(self) -> None:
+        """提前建立连接（TLS 握手），失败不影响后续调用"""
+        start = time.monotonic()
+        try:
+            self.client.models.list()
+            print(f"🔌 模型连接已预热 ({time.monotonic() - start:.2f}秒)")
+        except Exception as e:  # noqa: BLE001
+            print(f"⚠️  连接预热失败（忽略）: {e}")
+
+    def chat(self, model: str, messages: list[dict], **kwargs) -> str:
+        """调用 chat completions，返回文本内容"""
+        timeout = model_timeout(model)
+        start = time.monotonic()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self._throttle():
+                    completion = self.client.chat.completions.create(
+                        model=model, messages=messages, timeout=timeout, **kwargs
+                    )
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt > self.max_retries:
+                    self.records.append(
+                        CallRecord(model, time.monotonic() - start, attempt, ok=False)
+                    )
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"⚠️  {model} 调用失败（{type(e).__name__}），{delay:.2f}秒后重试...")
+                time.sleep(delay)
+
+        record = self._record_success(model, start, attempt, completion.usage)
+        text = completion.choices[0].message.content
+        self._notify(record, messages, text)
+        return text
+
+    def chat_stream(
+        self,
+        model: str,
+        messages: list[dict],
+        on_text: Callable[[str], bool | None] | None = None,
+        **kwargs,
+    ) -> str:
+        """流式调用 chat completions；每收到一段内容就用累积文本调用 on_text
+
+        on_text 返回 True 时立即关闭连接并返回已收到的文本（此时没有 usage）。
+        中途出错重试时累积文本从新请求的开头重新开始，on_text 收到的文本不再是上一次的延续。
+        开启对冲时由 _open_stream 决定哪一路请求胜出，之后只读取胜出的一路。
+        """
+        timeout = model_timeout(model)
+        start = time.monotonic()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            parts: list[str] = []
+            usage = None
+            first_token = None
+            stopped = False
+            try:
+                opened = self._open_stream(model, messages, timeout, kwargs)
+                try:
+                    for chunk in opened.chunks:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if not delta:
+                            continue
+                        if first_token is None:
+                            first_token = time.monotonic() - start
+                        parts.append(delta)
+                        if on_text and on_text("".join(parts)):
+                            stopped = True
+                            break
+                finally:
+                    # 有订阅者时提前结束的流交给后台线程读完，由它关闭
+                    if not (stopped and self.observers):
+                        opened.close()
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt > self.max_retries:
+                    self.records.append(
+                        CallRecord(model, time.monotonic() - start, attempt, ok=False)
+                    )
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"⚠️  {model} 流式调用失败（{type(e).__name__}），{delay:.2f}秒后重试...")
+                time.sleep(delay)
+
+        if stopped:
+            print(f"✂️  {model}: 已拿到所需字段，提前结束读取")
+        record = self._record_success(
+            model, start, attempt, usage, first_token, opened.hedged, opened.hedge_won
+        )
+        text = "".join(parts)
+        if stopped and self.observers:
+            drain = threading.Thread(
+                target=self._drain_and_notify,
+                args=(opened, record, messages, parts, start),
+                daemon=True,
+            )
+            self._drains.append(drain)
+            drain.start()
+        else:
+            self._notify(record, messages, text)
+        return text
+
+    def _drain_and_notify(
+        self,
+        opened: _OpenedStream,
+        record: CallRecord,
+        messages: list[dict],
+        parts: list[str],
+        start: float,
+    ) -> None:
+        """读完提前结束的流，用完整回复和端到端耗时通知订阅者（不计入 records）"""
+        parts = list(parts)
+        usage = None
+        try:
+            with opened:
+                for chunk in opened.chunks:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+        except RETRYABLE_ERRORS as e:
+            print(f"⚠️  {record.model}: 剩余输出读取失败（{type(e).__name__}），只通知已收到的部分")
+        full = dataclasses.replace(
+            record,
+            latency=time.monotonic() - start,
+            prompt_tokens=usage.prompt_tokens if usage else record.prompt_tokens,
+            completion_tokens=usage.completion_tokens if usage else record.completion_tokens,
+        )
+        self._notify(full, messages, "".join(parts))
+
+    def wait_observers(self, timeout: float | None = None) -> None:
+        """等待后台读取剩余输出的线程全部通知完订阅者"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for drain in self._drains:
+            drain.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._drains = [d for d in self._drains if d.is_alive()]
+
+    def _open_one(
+        self, model: str, messages: list[dict], timeout: float, kwargs: dict
+    ) -> _OpenedStream:
+        """发起一路流式请求，等到第一个分片再返回"""
+        release = contextlib.ExitStack()
+        release.enter_context(self._throttle())
+        stream = None
+        try:
+            opened_at = time.monotonic()
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            iterator = iter(stream)
+            first = next(iterator, None)
+            self._first_chunk.setdefault(model, deque(maxlen=200)).append(
+                time.monotonic() - opened_at
+            )
+        except BaseException:
+            if stream is not None:
+                stream.close()
+            release.close()
+            raise
+        chunks = itertools.chain([first] if first is not None else [], iterator)
+        return _OpenedStream(stream, chunks, release)
+
+    def _hedge_delay(self, model: str) -> float | None:
+        """本次请求的对冲等待时间；不对冲（未开启 / 样本不足 / 超出预算）时返回 None"""
+        stats = self.hedge_stats.setdefault(model, {"calls": 0, "hedged": 0, "won": 0})
+        stats["calls"] += 1
+        if not self.hedge:
+            return None
+        samples = self._first_chunk.get(model) or ()
+        if len(samples) < GATEWAY_HEDGE_MIN_SAMPLES:
+            return None
+        if stats["hedged"] + 1 > GATEWAY_HEDGE_BUDGET * stats["calls"]:
+            return None
+        return max(GATEWAY_HEDGE_MIN_DELAY, percentile(list(samples), GATEWAY_HEDGE_PERCENTILE))
+
+    def _open_stream(
+        self, model: str, messages: list[dict], timeout: float, kwargs: dict
+    ) -> _OpenedStream:
+        """打开流式请求；超过对冲等待时间仍无响应时再发一路，先收到首个分片的胜出"""
+        delay = self._hedge_delay(model)
+        if delay is None:
+            return self._open_one(model, messages, timeout, kwargs)
+
+        primary = self._hedge_pool.submit(self._open_one, model, messages, timeout, kwargs)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        stats = self.hedge_stats[model]
+        stats["hedged"] += 1
+        print(f"🪁 {model}: {delay:.2f}秒内没有响应，发出对冲请求")
+        backup = self._hedge_pool.submit(self._open_one, model, messages, timeout, kwargs)
+
+        winner = None
+        error = None
+        pending = {primary, backup}
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                elif winner is None:
+                    winner = future
+                else:
+                    future.result().close()
+
+        for future in pending:
+            future.cancel()
+            future.add_done_callback(_close_loser)
+
+        if winner is None:
+            raise error
+        opened = winner.result()
+        opened.hedged = True
+        opened.hedge_won = winner is backup
+        if opened.hedge_won:
+            stats["won"] += 1
+        return opened
+
+    def _notify(self, record: CallRecord, messages: list[dict], text: str) -> None:
+        for observer in self.observers:
+            observer(record, messages, text)
+
+    def _record_success(
+        self,
+        model: str,
+        start: float,
+        attempt: int,
+        usage,
+        first_token: float | None = None,
+        hedged: bool = False,
+        hedge_won: bool = False,
+    ) -> CallRecord:
+        record = CallRecord(
+            model=model,
+            latency=time.monotonic() - start,
+            attempts=attempt,
+            ok=True,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            first_token=first_token,
+            hedged=hedged,
+            hedge_won=hedge_won,
+        )
+        self.records.append(record)
+        get_tracer().annotate(
+            model=model,
+            prompt_tokens=record.prompt_tokens,
+            completion_tokens=record.completion_tokens,
+            attempts=attempt,
+            first_token=first_token,
+            hedged=hedged,
+        )
+        print(
+            f"⏱️  {model}: {record.latency:.2f}秒"
+            + (f"（首 token {first_token:.2f}秒）" if first_token is not None else "")
+            + f"，tokens {record.prompt_tokens}+{record.completion_tokens}"
+            + (f"，重试 {attempt - 1} 次" if attempt > 1 else "")
+            + (("，对冲请求胜出" if hedge_won else "，原请求胜出") if hedged else "")
+        )
+        return record
+
+    def print_summary(self) -> None:
+        if not self.records:
+            return
+        print("\n📡 模型调用统计:")
+        for model in sorted({r.model for r in self.records}):
+            records = [r for r in self.records if r.model == model]
+            ok = [r for r in records if r.ok]
+            latency = sum(r.latency for r in records)
+            print(
+                f"  {model}: {len(records)} 次（失败 {len(records) - len(ok)}），"
+                f"平均 {latency / len(records):.2f}秒，"
+                f"tokens {sum(r.prompt_tokens for r in ok)}+"
+                f"{sum(r.completion_tokens for r in ok)}，"
+                f"重试 {sum(r.attempts - 1 for r in records)} 次"
+            )
+            stats = self.hedge_stats.get(model)
+            if stats and stats["hedged"]:
+                print(
+                    f"    对冲 {stats['hedged']} 次（占请求 {stats['hedged'] / stats['calls']:.0%}），"
+                    f"对冲请求胜出 {stats['won']} 次（{stats['won'] / stats['hedged']:.0%}）"
+                )
+
+    def close(self) -> None:
+        self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+        self.http_client.close()
+
+
+_gateway: ModelGateway | None = None
+
+
+def get_gateway() -> ModelGateway:
+    """进程内共享的网关实例"""
+    global _gateway
+    if _gateway is None:
+        _gateway = ModelGateway()
+    return _gateway
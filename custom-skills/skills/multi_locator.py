@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+multi_locator.py - 一次 GUI-plus 请求定位同一帧上的多个目标
+
+ask_gui_plus / call_gui_plus 每次只定位一个元素：多步计划里的几个目标、
+搜索结果页上要逐个核对的候选标题，各要一次视觉模型往返。
+这里把同一帧的多个 target_description 编号后放进一个请求，模型按编号返回每个目标的
+found / x / y，N 个目标只需一次往返。
+
+调用方（allops_smart_v3.ask_gui_plus_many、search_click_real_guiplus.call_gui_plus_many）
+负责发请求；这里提供提示词、消息构造和结果解析。坐标均为图片坐标。
+"""
+
+import json
+
+GUI_PLUS_BATCH_PROMPT = """你是一个精确的坐标定位器。
+用户会给出同一张截图上的多个目标元素描述（带编号），你需要逐个在截图中找到它们并返回精确坐标。
+
+你必须返回严格的 JSON 格式（thought 放在最后）：
+{
+  "targets": [
+    {"index": 1, "found": true, "x": 坐标x, "y": 坐标y},
+    {"index": 2, "found": false}
+  ],
+  "thought": "简要说明"
+}
+
+重要：
+1. 只输出 JSON
+2. targets 按编号顺序，每个目标一项，不能遗漏
+3. 坐标必须精确，不同目标不要共用一个坐标
+4. 某个目标不确定时，它的 found 返回 false，不影响其他目标
+5. 字段顺序固定：targets 在前，thought 在最后
+"""
+
+
+def batch_ready(fields: dict) -> bool:
+    """流式解析时 targets 数组一完整即可使用"""
+    return "targets" in fields
+
+
+def batch_instruction(descriptions: list[str]) -> str:
+    lines = [f"{i}. {desc}" for i, desc in enumerate(descriptions, 1)]
+    return "请在截图中分别找到以下目标，按编号返回坐标：\n" + "\n".join(lines)
+
+
+def batch_messages(image_url: str, descriptions: list[str]) -> list[dict]:
+    return [
+        {"role": "system", "content": GUI_PLUS_BATCH_PROMPT},
+        {
+            "role": "user",
+            "content": [
+                {"type": "image_url", "image_url": {"url": image_url}},
+                {"type": "text", "text": batch_instruction(descriptions)},
+            ],
+        },
+    ]
+
+
+def coerce_coordinate(value) -> int | None:
+    """兼容数组和单值格式"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_batch_result(result: dict | str, count: int) -> list[dict]:
+    """把模型回复整理成与描述一一对应的 [{"found", "image_x", "image_y"}]
+
+    优先按 index 对应；没有 index 时按数组顺序。缺失或坐标无效的目标记为未找到。
+    """
+    if isinstance(result, str):
+        text = result
+        if "```json" in text:
+            text = text.split("```json")[1].split("```")[0]
+        elif "```" in text:
+            text = text.split("```")[1].split("```")[0]
+        result = json.loads(text.strip())
+
+    locations = [{"found": False} for _ in range(count)]
+    targets = result.get("targets") or []
+    for position, item in enumerate(targets):
+        if not isinstance(item, dict):
+            continue
+        index = coerce_coordinate(item.get("index"))
+        slot = index - 1 if index is not None else position
+        if not 0 <= slot < count or not item.get("found") or locations[slot]["found"]:
+            continue
+        x, y = coerce_coordinate(item.get("x")), coerce_coordinate(item.get("y"))
+        if x is None or y is None:
+            continue
+        locations[slot] = {"found": True, "image_x": x, "image_y": y}
+    return locations
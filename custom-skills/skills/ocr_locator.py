@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+ocr_locator.py - 文字类目标的本地 OCR 快速定位
+
+qwen3-max 给出的 target_description 常常引用页面上的可见文字，例如
+"写着'百度一下'的蓝色按钮"、"标题包含'拉夫罗夫'的新闻链接"。这类目标不必请求 GUI-plus：
+- 在本机对整帧做一次 OCR（同一帧只识别一次）
+- 把引号里的文字与识别结果做模糊匹配（允许只匹配一行中的一部分）
+- 只有一个明确的最佳匹配时直接返回坐标和置信度；没有匹配或多处相近时返回 None，交给 GUI-plus
+
+OCR 引擎是可选依赖，未安装时自动关闭快速定位：
+- rapidocr: pip install rapidocr_onnxruntime（中文效果好，默认）
+- tesseract: pip install pytesseract，并安装 tesseract 与 chi_sim 语言包
+
+环境变量：
+- OCR_LOCATOR: 是否开启本地 OCR 定位（默认 1）
+- OCR_ENGINE: rapidocr | tesseract（默认 rapidocr）
+- OCR_TESSERACT_LANG: tesseract 语言（默认 chi_sim+eng）
+- OCR_MIN_SCORE: 文字相似度下限 0-1（默认 0.8）
+- OCR_MIN_CONFIDENCE: OCR 识别置信度下限 0-1（默认 0.5）
+- OCR_AMBIGUITY_MARGIN: 第二名与第一名的相似度差距小于该值且位置不同时视为有歧义（默认 0.05）
+"""
+
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+from PIL import Image
+
+from step_tracer import percentile
+
+OCR_LOCATOR = os.getenv("OCR_LOCATOR", "1") == "1"
+OCR_ENGINE = os.getenv("OCR_ENGINE", "rapidocr")
+OCR_TESSERACT_LANG = os.getenv("OCR_TESSERACT_LANG", "chi_sim+eng")
+OCR_MIN_SCORE = float(os.getenv("OCR_MIN_SCORE", "0.8"))
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "0.5"))
+OCR_AMBIGUITY_MARGIN = float(os.getenv("OCR_AMBIGUITY_MARGIN", "0.05"))
+
+# 中英文引号、书名号里的文字
+_QUOTED_RE = re.compile(r"'([^']+)'|\"([^\"]+)\"|‘([^’]+)’|“([^”]+)”|「([^」]+)」|《([^》]+)》")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class TextBox:
+    """OCR 识别出的一行文字（图片像素坐标）"""
+
+    text: str
+    box: tuple[int, int, int, int]
+    confidence: float
+
+
+@dataclass
+class OcrMatch:
+    """本地定位结果（图片像素坐标）"""
+
+    x: float
+    y: float
+    text: str
+    score: float
+    confidence: float
+
+
+def extract_quoted(description: str) -> list[str]:
+    """取出描述中被引号括起来的文字"""
+    quoted = []
+    for match in _QUOTED_RE.finditer(description):
+        text = next(group for group in match.groups() if group)
+        text = _SPACE_RE.sub("", text)
+        if text:
+            quoted.append(text)
+    return quoted
+
+
+def partial_ratio(needle: str, text: str) -> tuple[float, int]:
+    """needle 与 text 中等长片段的最佳相似度，返回 (相似度, 片段起点)"""
+    if not needle or not text:
+        return 0.0, 0
+    if needle in text:
+        return 1.0, text.index(needle)
+    if len(text) <= len(needle):
+        return SequenceMatcher(None, needle, text).ratio(), 0
+
+    best, best_start = 0.0, 0
+    for start in range(len(text) - len(needle) + 1):
+        score = SequenceMatcher(None, needle, text[start : start + len(needle)]).ratio()
+        if score > best:
+            best, best_start = score, start
+    return best, best_start
+
+
+class RapidOcrEngine:
+    def __init__(self) -> None:
+        # 可选依赖，只有开启 OCR 定位时才需要安装
+        import numpy
+        from rapidocr_onnxruntime import RapidOCR
+
+        self._numpy = numpy
+        self._ocr = RapidOCR()
+
+    def recognize(self, image: Image.Image) -> list[TextBox]:
+        result, _ = self._ocr(self._numpy.asarray(image.convert("RGB")))
+        boxes = []
+        for points, text, score in result or []:
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            box = (round(min(xs)), round(min(ys)), round(max(xs)), round(max(ys)))
+            boxes.append(TextBox(text, box, float(score)))
+        return boxes
+
+
+class TesseractEngine:
+    def __init__(self) -> None:
+        import pytesseract
+
+        self._tesseract = pytesseract
+
+    def recognize(self, image: Image.Image) -> list[TextBox]:
+        data = self._tesseract.image_to_data(
+            image, lang=OCR_TESSERACT_LANG, output_type=self._tesseract.Output.DICT
+        )
+
+        # tesseract 按词输出，合并成行
+        lines: dict[tuple[int, int, int], list[int]] = {}
+        for i, word in enumerate(data["text"]):
+            if word.strip() and float(data["conf"][i]) >= 0:
+                key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+                lines.setdefault(key, []).append(i)
+
+        boxes = []
+        for indexes in lines.values():
+            x1 = min(data["left"][i] for i in indexes)
+            y1 = min(data["top"][i] for i in indexes)
+            x2 = max(data["left"][i] + data["width"][i] for i in indexes)
+            y2 = max(data["top"][i] + data["height"][i] for i in indexes)
+            confidence = sum(float(data["conf"][i]) for i in indexes) / len(indexes) / 100
+            text = "".join(data["text"][i] for i in indexes)
+            boxes.append(TextBox(text, (x1, y1, x2, y2), confidence))
+        return boxes
+
+
+_ENGINES = {"rapidocr": RapidOcrEngine, "tesseract": TesseractEngine}
+
+
+class OcrLocator:
+    """本地 OCR 定位，并统计命中率与耗时"""
+
+    def __init__(
+        self,
+        engine: str = OCR_ENGINE,
+        min_score: float = OCR_MIN_SCORE,
+        min_confidence: float = OCR_MIN_CONFIDENCE,
+        margin: float = OCR_AMBIGUITY_MARGIN,
+    ) -> None:
+        self.engine_name = engine
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        self.margin = margin
+        self._engine = None
+        self.available = True
+        self._frame_key: str | None = None
+        self._boxes: list[TextBox] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.ambiguous = 0
+        self.latencies: list[float] = []
+
+    def _get_engine(self):
+        if self._engine is None and self.available:
+            try:
+                self._engine = _ENGINES[self.engine_name]()
+            except (ImportError, KeyError) as e:
+                print(f"⚠️  OCR 引擎 {self.engine_name} 不可用，关闭本地定位: {e}")
+                self.available = False
+        return self._engine
+
+    def recognize(self, image: Image.Image, frame_key: str | None = None) -> list[TextBox]:
+        """识别整帧文字；同一帧（像素完全相同）只识别一次（frame_key 可传入已算好的摘要）"""
+        key = frame_key or hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+        if key != self._frame_key:
+            self._boxes = [b for b in self._get_engine().recognize(image) if b.text.strip()]
+            self._frame_key = key
+        return self._boxes
+
+    def locate(
+        self, image: Image.Image, description: str, frame_key: str | None = None
+    ) -> OcrMatch | None:
+        """按描述中的引号文字本地定位；没有引号、引擎不可用、无匹配或有歧义时返回 None"""
+        quoted = extract_quoted(description)
+        if not quoted or self._get_engine() is None:
+            return None
+
+        start = time.monotonic()
+        boxes = self.recognize(image, frame_key)
+
+        candidates: list[OcrMatch] = []
+        for needle in quoted:
+            for box in boxes:
+                if box.confidence < self.min_confidence:
+                    continue
+                text = _SPACE_RE.sub("", box.text)
+                score, offset = partial_ratio(needle, text)
+                if score < self.min_score:
+                    continue
+                # 只匹配到一行中的一部分时，按字符位置估算这部分的中心
+                x1, y1, x2, y2 = box.box
+                center = (offset + min(len(needle), len(text)) / 2) / max(1, len(text))
+                candidates.append(
+                    OcrMatch(x1 + (x2 - x1) * center, (y1 + y2) / 2, box.text, score, box.confidence)
+                )
+
+        self.latencies.append(time.monotonic() - start)
+        candidates.sort(key=lambda m: (m.score, m.confidence), reverse=True)
+
+        if not candidates:
+            self.misses += 1
+            print(f"🔤 OCR 未匹配到: {' / '.join(quoted)}")
+            return None
+
+        best = candidates[0]
+        rivals = [
+            m
+            for m in candidates[1:]
+            if best.score - m.score < self.margin
+            and (abs(m.x - best.x) > 4 or abs(m.y - best.y) > 4)
+        ]
+        if rivals:
+            self.ambiguous += 1
+            print(f"🔤 OCR 匹配有歧义（{len(rivals) + 1} 处相近），交给 GUI-plus")
+            return None
+
+        self.hits += 1
+        print(
+            f"🔤 OCR 命中: '{best.text}' 相似度 {best.score:.2f} 置信度 {best.confidence:.2f}"
+            f"（{self.latencies[-1] * 1000:.0f}ms）"
+        )
+        return best
+
+    def print_summary(self) -> None:
+        total = self.hits + self.misses + self.ambiguous
+        if not total:
+            return
+        print(
+            f"\n🔤 OCR 本地定位: 命中 {self.hits}/{total} ({self.hits / total:.0%})，"
+            f"未匹配 {self.misses}，歧义 {self.ambiguous}，"
+            f"耗时 p50 {percentile(self.latencies, 50) * 1000:.0f}ms / "
+            f"p95 {percentile(self.latencies, 95) * 1000:.0f}ms"
+        )
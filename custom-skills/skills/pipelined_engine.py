@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+pipelined_engine.py - allops_smart_v3 的流水线执行引擎（asyncio）
+
+smart_execute 每一步都是严格串行的：截图 → 编码 → 大脑 → 定位 → 执行 → 等待。
+这里用 asyncio 把互不依赖的阶段重叠起来：
+- 页面稳定检测一看到相邻两帧一致，就提前开始截图 + 编码；等待结束后若画面没再变化，直接复用这一帧
+- 截图都在内存里（Frame），投机截的帧不会覆盖还在使用的那一帧
+- 大脑和定位共用同一份已编码的截图
+- 大脑流式输出时，一旦 JSON 里的 target_description（以及可选的 target_area）完整出现，就投机地先发定位请求；
+  只对 CLICK 和 click_first 的 TYPE 投机；最终决策的目标与区域都一致时直接使用结果，否则丢弃
+
+说明：
+- 浏览器只在开始时激活一次，之后默认它保持在前台。
+- 每一轮都直接请求 qwen3-max，不经过 smart_execute 的决策分层（DecisionRouter）与轨迹宏，
+  也不录制轨迹（TrajectoryRecorder）；需要这些功能时使用 smart_execute。
+- 投机定位与主线程不会同时定位：目标不一致时先等投机定位结束，每一轮结束前也会等它结束，
+  定位缓存与 OCR 引擎不是线程安全的。
+
+环境变量：
+- PIPELINE_SPECULATIVE_LOCATOR: 是否开启投机定位（默认 1）
+
+使用方法: python3 pipelined_engine.py '任务目标' [最大步骤]
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+
+from allops_smart_v3 import (
+    ask_qwen3_brain,
+    execute_action,
+    locate_target,
+    location_cache,
+    normalize_plan,
+    ocr_locator,
+    run_plan,
+    settle_detector,
+)
+from gui_backend import get_backend
+from history_manager import HistoryManager
+from model_gateway import get_gateway
+from screen_encoding import EncodedImage, capture_frame
+from settle_detector import frame_diff
+from step_tracer import get_tracer
+
+PIPELINE_SPECULATIVE_LOCATOR = os.getenv("PIPELINE_SPECULATIVE_LOCATOR", "1") == "1"
+
+_TARGET_RE = re.compile(r'"target_description"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_ACTION_RE = re.compile(r'"action"\s*:\s*"([A-Z_]+)"')
+_AREA_RE = re.compile(r'"target_area"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_PARAMETERS_RE = re.compile(r'"parameters"\s*:')
+_CLICK_FIRST_RE = re.compile(r'"click_first"\s*:\s*true')
+
+
+def capture_encoded() -> EncodedImage | None:
+    """截图并编码（不激活浏览器）"""
+    tracer = get_tracer()
+    with tracer.span("capture"):
+        frame = capture_frame()
+    if not frame:
+        return None
+    with tracer.span("encode") as span:
+        screen = frame.encoded()
+        span.update(raw_bytes=screen.raw_bytes, payload_bytes=screen.payload_bytes)
+    return screen
+
+
+class SpeculativeLocator:
+    """从大脑的流式输出中提前拿到 target_description 并发起定位"""
+
+    def __init__(self, pool: concurrent.futures.ThreadPoolExecutor, screen: EncodedImage):
+        self.pool = pool
+        self.screen = screen
+        self.target: str | None = None
+        self.area: str | None = None
+        self.future: concurrent.futures.Future | None = None
+
+    def on_partial(self, text: str) -> None:
+        if self.future is not None:
+            return
+
+        # 字段顺序固定为 action / target_description / target_area / parameters，
+        # 第一个动作的这几个字段都完整后才发请求
+        action = _ACTION_RE.search(text)
+        if not action or action.group(1) not in ("CLICK", "TYPE"):
+            return
+
+        match = _TARGET_RE.search(text, action.end())
+        if not match:
+            return
+        parameters = _PARAMETERS_RE.search(text, match.end())
+        if not parameters:
+            return
+        # 不先点击的 TYPE 不需要定位
+        if action.group(1) == "TYPE":
+            end = text.find("}", parameters.end())
+            if not _CLICK_FIRST_RE.search(text, parameters.end(), end if end >= 0 else len(text)):
+                return
+
+        target = json.loads(f'"{match.group(1)}"')
+        if not target:
+            return
+        area = _AREA_RE.search(text, match.end(), parameters.start())
+        area = json.loads(f'"{area.group(1)}"') if area else None
+
+        print(f"\n🚀 投机定位: {target}" + (f"（{area}）" if area else ""))
+        self.target = target
+        self.area = area
+        self.future = self.pool.submit(locate_target, self.screen, target, area)
+
+    def locator(
+        self, screen: EncodedImage, target_description: str, area: str | None = None
+    ) -> dict:
+        """给 execute_action 用：目标与区域一致则复用投机结果"""
+        if self.future is not None and (target_description, area or None) == (
+            self.target,
+            self.area,
+        ):
+            print("⚡ 使用投机定位结果")
+            return self.future.result()
+        self.drain()
+        return locate_target(screen, target_description, area)
+
+    def drain(self) -> None:
+        """丢弃没用上的投机定位：还没开始就取消，已在运行就等它结束"""
+        if self.future is None or self.future.cancel():
+            return
+        try:
+            self.future.result()
+        except Exception:  # noqa: BLE001 - 结果本来就要丢弃
+            pass
+
+
+async def settle_and_capture(
+    loop: asyncio.AbstractEventLoop, action: str, screen: EncodedImage
+) -> tuple[float, EncodedImage | None]:
+    """等待页面稳定，同时在画面初步稳定时提前截图编码"""
+    pending: list[asyncio.Future] = []
+
+    def on_stable() -> None:
+        # 在 settle 线程里被调用：把截图编码丢到线程池
+        pending.append(
+            asyncio.run_coroutine_threadsafe(asyncio.to_thread(capture_encoded), loop)
+        )
+
+    def wait() -> float:
+        with get_tracer().span("settle", action=action):
+            return settle_detector.wait(
+                action, screen.bounds, screen.frame.thumbnail, on_stable
+            )
+
+    waited = await asyncio.to_thread(wait)
+
+    if pending:
+        early = await asyncio.wrap_future(pending[-1])
+        last = settle_detector.last_frame
+        if early and last is not None:
+            thumb = await asyncio.to_thread(lambda: early.frame.thumbnail)
+            if frame_diff(thumb, last) <= settle_detector.threshold:
+                return waited, early
+        print("↻ 提前截取的画面已过期，重新截图")
+
+    return waited, None
+
+
+async def pipelined_execute(goal: str, max_steps: int = 20) -> None:
+    """流水线版 smart_execute"""
+    print("=" * 60)
+    print("🧠 allops_smart_v3 - 流水线执行引擎")
+    print("=" * 60)
+    print(f"\n🎯 任务目标: {goal}")
+    print(f"⚙️  最大步骤: {max_steps}")
+    print(f"🚀 投机定位: {'开启' if PIPELINE_SPECULATIVE_LOCATOR else '关闭'}")
+    print("=" * 60)
+
+    loop = asyncio.get_running_loop()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    # 激活浏览器的同时预热模型连接
+    print("\n🌐 准备工作环境...")
+    await asyncio.gather(
+        asyncio.to_thread(get_backend().activate_browser),
+        asyncio.to_thread(get_gateway().warm_up),
+    )
+    await asyncio.to_thread(settle_detector.wait, "ACTIVATE")
+    print("✅ 环境准备完成！\n")
+
+    history = HistoryManager()
+    step_num = 1
+    payload_total = 0
+    step_times: list[float] = []
+    next_screen: EncodedImage | None = None
+
+    while step_num <= max_steps:
+        step_start = time.monotonic()
+        get_tracer().begin_step(step_num)
+        print("\n\n" + "#" * 60)
+        print(f"# 第 {step_num} 轮")
+        print("#" * 60)
+
+        # 1. 截图（上一轮等待时已提前截好的直接复用）
+        screen = next_screen or await asyncio.to_thread(capture_encoded)
+        next_screen = None
+        if not screen:
+            print("❌ 截图失败")
+            break
+        print(f"📦 图像负载: {screen.describe()}")
+        payload_total += screen.payload_bytes
+
+        # 2. 大脑决策（流式，可投机定位）
+        history_text = history.render()
+        speculative = SpeculativeLocator(pool, screen)
+        decision = await asyncio.to_thread(
+            ask_qwen3_brain,
+            screen,
+            goal,
+            history_text,
+            speculative.on_partial if PIPELINE_SPECULATIVE_LOCATOR else None,
+        )
+        if not decision:
+            print("\n❌ Qwen3-Max 决策失败，终止")
+            break
+
+        plan = normalize_plan(decision)
+        action = plan[0].get("action")
+        if action == "FINISH":
+            print("\n🎉 任务成功完成！")
+            break
+        if action == "FAIL":
+            print("\n😔 任务失败")
+            break
+
+        # 3. 多步计划交给 run_plan 串行执行（每步都要验证检查点）
+        if len(plan) > 1:
+            descriptions, diverged = await asyncio.to_thread(
+                run_plan, plan, screen, speculative.locator
+            )
+            for description in descriptions:
+                history.append(description)
+            if diverged:
+                print(f"\n↩️  计划偏离：{diverged}，重新规划")
+                history.append(f"（计划中断：{diverged}）")
+            await asyncio.to_thread(speculative.drain)
+            step_times.append(time.monotonic() - step_start)
+            step_num += 1
+            continue
+
+        # 4. 单个动作：执行后等待页面稳定，同时准备下一轮的截图
+        success, description = await asyncio.to_thread(
+            execute_action, plan[0], screen, speculative.locator
+        )
+        history.append(description)
+        await asyncio.to_thread(speculative.drain)
+
+        if action in ["CLICK", "TYPE", "KEY_PRESS", "SCROLL"]:
+            waited, next_screen = await settle_and_capture(loop, action, screen)
+            print(f"✅ 页面已稳定（等待 {waited:.2f}秒）")
+
+        step_times.append(time.monotonic() - step_start)
+        step_num += 1
+
+    if step_num > max_steps:
+        print(f"\n⚠️  达到最大步骤数 ({max_steps})，终止")
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    # 总结
+    print("\n" + "=" * 60)
+    print("📊 执行总结")
+    print("=" * 60)
+    print(f"总步骤数: {len(history)}")
+    if step_times:
+        print(f"平均每步耗时: {sum(step_times) / len(step_times):.2f}秒")
+    print(f"截图负载合计: {payload_total / 1024:.0f}KB")
+    print("\n执行历史:")
+    for i, h in enumerate(history.steps, 1):
+        print(f"  {i}. {h}")
+    settle_detector.print_summary()
+    get_backend().print_summary()
+    location_cache.print_summary()
+    if ocr_locator:
+        ocr_locator.print_summary()
+    get_gateway().print_summary()
+    get_tracer().print_summary()
+    print("=" * 60)
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print("使用方法: python3 pipelined_engine.py '任务目标' [最大步骤]")
+        sys.exit(1)
+
+    goal = sys.argv[1]
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    asyncio.run(pipelined_execute(goal, max_steps))
+
+
+if __name__ == "__main__":
+    main()
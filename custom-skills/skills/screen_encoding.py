@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+screen_encoding.py - 截图编码管线
+
+在把截图发给 qwen3-max / gui-plus 之前做一次可配置的编码：
+- 只截取浏览器窗口区域（而不是整块 Retina 屏幕）
+- 按长边缩放到目标尺寸
+- 以 JPEG / WebP / PNG 输出，可设置质量
+
+截图直接进内存成为 Frame，不再写临时文件再读回来。Frame 的派生形式
+（各种编码后的图片 / data URL、帧差缩略图、dHash、内容摘要）第一次用到时才计算，
+之后在大脑、定位、缓存、稳定检测之间共享，同一帧不会重复编码。
+
+模型返回的坐标是相对于编码后图片的，通过 EncodedImage.to_screen 映射回屏幕坐标。
+
+crop_image 从原始截图按区域（ROI）裁剪并重新编码，裁剪图的映射同样直接回到屏幕坐标；
+region_around / area_region 给出常用的裁剪区域（某点附近、大脑提示的页面区域）。
+
+环境变量：
+- ENCODE_CAPTURE: window | screen（默认 window）
+- ENCODE_MAX_EDGE: 长边像素上限，0 表示不缩放（默认 1600）
+- ENCODE_FORMAT: jpeg | webp | png（默认 jpeg）
+- ENCODE_QUALITY: 有损格式的质量 1-100（默认 80）
+"""
+
+import base64
+import hashlib
+import io
+import os
+from dataclasses import dataclass, field
+from functools import cached_property
+
+from PIL import Image
+
+from gui_backend import get_backend
+from location_cache import dhash
+from settle_detector import make_thumbnail
+
+ENCODE_CAPTURE = os.getenv("ENCODE_CAPTURE", "window")
+ENCODE_MAX_EDGE = int(os.getenv("ENCODE_MAX_EDGE", "1600"))
+ENCODE_FORMAT = os.getenv("ENCODE_FORMAT", "jpeg")
+ENCODE_QUALITY = int(os.getenv("ENCODE_QUALITY", "80"))
+
+Region = tuple[int, int, int, int]
+
+_PIL_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP", "png": "PNG"}
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass
+class EncodeOptions:
+    """截图编码配置（默认值来自环境变量）"""
+
+    capture: str = ENCODE_CAPTURE
+    max_long_edge: int = ENCODE_MAX_EDGE
+    image_format: str = ENCODE_FORMAT
+    quality: int = ENCODE_QUALITY
+
+
+@dataclass
+class EncodedImage:
+    """编码后的截图，以及从图片像素到屏幕坐标的映射"""
+
+    frame: "Frame"
+    data_url: str
+    width: int
+    height: int
+    image_format: str
+    raw_bytes: int
+    origin_x: float = 0.0
+    origin_y: float = 0.0
+    scale_x: float = 1.0
+    scale_y: float = 1.0
+    bounds: tuple[int, int, int, int] | None = field(default=None)
+    # 裁剪图在所属整帧图片中的区域（整帧为 None）
+    region: Region | None = None
+
+    @property
+    def payload_bytes(self) -> int:
+        return len(self.data_url)
+
+    def to_screen(self, x: float, y: float) -> tuple[int, int]:
+        """把模型返回的图片坐标映射回屏幕坐标"""
+        return (
+            round(self.origin_x + x * self.scale_x),
+            round(self.origin_y + y * self.scale_y),
+        )
+
+    def describe(self) -> str:
+        return (
+            f"{self.raw_bytes / 1024:.0f}KB → {self.payload_bytes / 1024:.0f}KB "
+            f"({self.width}x{self.height} {self.image_format.lower()})"
+        )
+
+
+class Frame:
+    """一次截图的内存表示：原始像素 + 按需计算并缓存的派生形式
+
+    全屏截图时 screen_size 为屏幕在输入坐标系中的尺寸（macOS 的 point），用于把像素换算回点击坐标。
+    """
+
+    def __init__(
+        self,
+        image: Image.Image,
+        bounds: Region | None = None,
+        screen_size: tuple[int, int] | None = None,
+    ) -> None:
+        self.image = image
+        self.bounds = bounds
+        self.screen_size = screen_size
+        self._encoded: dict[tuple, EncodedImage] = {}
+
+    @classmethod
+    def open(cls, path: str, bounds: Region | None = None) -> "Frame":
+        with Image.open(path) as img:
+            img.load()
+        return cls(img, bounds)
+
+    @property
+    def raw_bytes(self) -> int:
+        """原始像素缓冲区大小"""
+        return self.image.width * self.image.height * len(self.image.getbands())
+
+    def encoded(self, options: EncodeOptions | None = None) -> EncodedImage:
+        """按配置编码（同一配置只编码一次）"""
+        options = options or EncodeOptions()
+        key = (options.max_long_edge, options.image_format.lower(), options.quality)
+        if key not in self._encoded:
+            self._encoded[key] = encode_frame(self, options)
+        return self._encoded[key]
+
+    @cached_property
+    def thumbnail(self) -> Image.Image:
+        """页面稳定检测用的灰度小图"""
+        return make_thumbnail(self.image)
+
+    @cached_property
+    def dhash(self) -> int:
+        """定位缓存用的画面指纹"""
+        return dhash(self.image)
+
+    @cached_property
+    def digest(self) -> str:
+        """像素内容摘要（完全相同的两帧摘要相同）"""
+        return hashlib.blake2b(self.image.tobytes(), digest_size=16).hexdigest()
+
+
+def capture_frame(options: EncodeOptions | None = None) -> Frame | None:
+    """截图到内存；window 模式下只截浏览器窗口区域"""
+    options = options or EncodeOptions()
+
+    backend = get_backend()
+    bounds = backend.window_bounds() if options.capture == "window" else None
+    image = backend.grab(bounds)
+    if image is None:
+        return None
+    return Frame(image, bounds, None if bounds else backend.screen_size())
+
+
+def encode_frame(frame: Frame, options: EncodeOptions | None = None) -> EncodedImage:
+    """按配置缩放并编码截图，生成 data URL（一般通过 Frame.encoded 调用以复用结果）"""
+    options = options or EncodeOptions()
+    bounds = frame.bounds
+
+    src_w, src_h = frame.image.size
+    data_url, width, height, pil_format = _encode(frame.image, options)
+
+    encoded = EncodedImage(
+        frame=frame,
+        data_url=data_url,
+        width=width,
+        height=height,
+        image_format=pil_format,
+        raw_bytes=frame.raw_bytes,
+        bounds=bounds,
+    )
+
+    if bounds:
+        # 窗口截图：映射到窗口所在的屏幕坐标（Retina 下截图像素是 point 的 2 倍）
+        x1, y1, x2, y2 = bounds
+        encoded.origin_x, encoded.origin_y = x1, y1
+        encoded.scale_x = (x2 - x1) / width
+        encoded.scale_y = (y2 - y1) / height
+    else:
+        # 全屏截图：映射到屏幕坐标（Retina 下按 point 尺寸换算，未知时按截图像素）
+        screen_w, screen_h = frame.screen_size or (src_w, src_h)
+        encoded.scale_x = screen_w / width
+        encoded.scale_y = screen_h / height
+
+    return encoded
+
+
+def _encode(img: Image.Image, options: EncodeOptions) -> tuple[str, int, int, str]:
+    """缩放并编码成 data URL，返回 (data_url, 宽, 高, 格式)"""
+    pil_format = _PIL_FORMATS.get(options.image_format.lower(), "PNG")
+    src_w, src_h = img.size
+
+    if options.max_long_edge and max(src_w, src_h) > options.max_long_edge:
+        ratio = options.max_long_edge / max(src_w, src_h)
+        img = img.resize(
+            (max(1, round(src_w * ratio)), max(1, round(src_h * ratio))),
+            Image.LANCZOS,
+        )
+
+    if pil_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    if pil_format == "PNG":
+        img.save(buf, format="PNG", optimize=True)
+    else:
+        img.save(buf, format=pil_format, quality=options.quality)
+
+    data_url = (
+        f"data:{_MIME_TYPES[pil_format]};base64,"
+        + base64.b64encode(buf.getvalue()).decode("utf-8")
+    )
+    return data_url, img.width, img.height, pil_format
+
+
+def crop_image(
+    screen: EncodedImage, region: Region, options: EncodeOptions | None = None
+) -> EncodedImage:
+    """从原始截图裁出 region（screen 的图片坐标）并重新编码，保留原始分辨率的细节"""
+    options = options or EncodeOptions()
+    x1, y1, x2, y2 = region
+
+    img = screen.frame.image
+    fx, fy = img.width / screen.width, img.height / screen.height
+    crop = img.crop((round(x1 * fx), round(y1 * fy), round(x2 * fx), round(y2 * fy)))
+    data_url, width, height, pil_format = _encode(crop, options)
+
+    return EncodedImage(
+        frame=screen.frame,
+        data_url=data_url,
+        width=width,
+        height=height,
+        image_format=pil_format,
+        raw_bytes=screen.raw_bytes,
+        origin_x=screen.origin_x + x1 * screen.scale_x,
+        origin_y=screen.origin_y + y1 * screen.scale_y,
+        scale_x=screen.scale_x * (x2 - x1) / width,
+        scale_y=screen.scale_y * (y2 - y1) / height,
+        bounds=screen.bounds,
+        region=region,
+    )
+
+
+def region_around(screen: EncodedImage, x: float, y: float, fraction: float) -> Region:
+    """以 (x, y) 为中心、边长为整帧 fraction 的区域（贴边时向内平移）"""
+    w = max(1, round(screen.width * fraction))
+    h = max(1, round(screen.height * fraction))
+    x1 = min(max(0, round(x - w / 2)), screen.width - w)
+    y1 = min(max(0, round(y - h / 2)), screen.height - h)
+    return x1, y1, x1 + w, y1 + h
+
+
+# 页面区域提示 → 整帧上的相对范围（相邻区域互相重叠一半，目标压线也能被包含）
+_AREA_ROWS = {"top": (0.0, 0.5), "middle": (0.25, 0.75), "bottom": (0.5, 1.0)}
+_AREA_COLS = {"left": (0.0, 0.5), "center": (0.25, 0.75), "right": (0.5, 1.0)}
+
+
+def area_region(screen: EncodedImage, area: str) -> Region | None:
+    """把 "top-right"、"bottom"、"center" 这类区域提示换算成裁剪区域，无法识别时返回 None"""
+    rows, cols = (0.0, 1.0), (0.0, 1.0)
+    for part in area.lower().replace("_", "-").replace(" ", "-").split("-"):
+        if part in _AREA_ROWS:
+            rows = _AREA_ROWS[part]
+        elif part in _AREA_COLS:
+            cols = _AREA_COLS[part]
+        elif part:
+            return None
+    if (rows, cols) == ((0.0, 1.0), (0.0, 1.0)):
+        return None
+    return (
+        round(cols[0] * screen.width),
+        round(rows[0] * screen.height),
+        round(cols[1] * screen.width),
+        round(rows[1] * screen.height),
+    )
@@ -5,17 +5,29 @@
 
 模拟
 搜索俄乌冲突 并点击  标题包含'拉夫罗夫'的新闻
+
+只给一个关键词（或不给，默认 拉夫罗夫）时，和原来一样直接交给 GUI-plus 按指令决策。
+给出多个候选关键词时：结果页上的候选标题先查定位缓存，剩下的一次 GUI-plus 请求批量核对，
+定位结果写回定位缓存（LOCATION_CACHE_PATH 设置后跨运行复用）；点击第一个找到的标题，
+一个都没找到时再交给 GUI-plus 按指令决策。
+
+使用方法: python3 search_click_real_guiplus.py [关键词 ...]
 """
 import os
 import sys
 import time
 import json
 import base64
-import subprocess
-from openai import OpenAI
 
-# 配置
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "sk-xxxxxxxxxxxxxxxxxxxxxxx")
+from PIL import Image
+
+from gui_backend import get_backend
+from location_cache import LocationCache
+from model_gateway import get_gateway
+from multi_locator import batch_messages, parse_batch_result
+
+# 候选标题的定位缓存（截图坐标即屏幕坐标，按截图尺寸保存相对位置）
+location_cache = LocationCache()
 
 # GUI-plus 的系统提示词（来自官方文档）
 SYSTEM_PROMPT = """## 1. 核心角色 (Core Role)
@@ -86,8 +98,7 @@ SYSTEM_PROMPT = """## 1. 核心角色 (Core Role)
 def take_screenshot(output="/tmp/guiplus_screen.png"):
     """截取屏幕"""
     print(f"📸 截图...")
-    subprocess.run(["screencapture", "-x", output])
-    if os.path.exists(output):
+    if get_backend().capture(output) and os.path.exists(output):
         print(f"✅ 截图成功: {output}")
         return output
     return None
@@ -123,20 +134,13 @@ def call_gui_plus(screenshot_path, user_instruction):
         }
     ]
     
-    # 调用 OpenAI 兼容 API
-    client = OpenAI(
-        api_key=DASHSCOPE_API_KEY,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
-    
+    # 调用 OpenAI 兼容 API（共享长连接网关）
     try:
-        completion = client.chat.completions.create(
+        result_text = get_gateway().chat(
             model="gui-plus",
             messages=messages,
             extra_body={"vl_high_resolution_images": True}
         )
-        
-        result_text = completion.choices[0].message.content
         print(f"\n📝 GUI-plus 返回:")
         print(result_text)
         print()
@@ -156,6 +160,65 @@ def call_gui_plus(screenshot_path, user_instruction):
         return None
 
 
+def call_gui_plus_many(screenshot_path, descriptions):
+    """一次 GUI-plus 请求定位截图上的多个目标（例如结果页上的每条新闻标题）
+
+    返回与 descriptions 一一对应的 [{"found", "image_x", "image_y"}]
+    """
+    print(f"🤖 调用 GUI-plus 批量定位 {len(descriptions)} 个目标...")
+    image_url = image_to_base64_url(screenshot_path)
+
+    try:
+        result_text = get_gateway().chat(
+            model="gui-plus",
+            messages=batch_messages(image_url, descriptions),
+            extra_body={"vl_high_resolution_images": True}
+        )
+        locations = parse_batch_result(result_text, len(descriptions))
+    except Exception as e:
+        print(f"❌ API 调用失败: {e}")
+        return [{"found": False} for _ in descriptions]
+
+    for desc, location in zip(descriptions, locations):
+        if location["found"]:
+            print(f"   ✅ {desc}: ({location['image_x']}, {location['image_y']})")
+        else:
+            print(f"   ❌ {desc}: 未找到")
+    return locations
+
+
+def locate_titles(screenshot_path, keywords):
+    """核对结果页上的多条候选标题：先查定位缓存，未命中的一次批量定位，找到的写回缓存
+
+    返回 {关键词: (x, y) 或 None}
+    """
+    with Image.open(screenshot_path) as img:
+        image = img.convert("RGB")
+    width, height = image.size
+    descriptions = {kw: f"标题包含'{kw}'的新闻链接" for kw in keywords}
+
+    results = {}
+    missing = []
+    for kw, desc in descriptions.items():
+        cached = location_cache.lookup(image, desc)
+        if cached:
+            results[kw] = (int(cached[0] * width), int(cached[1] * height))
+            print(f"⚡ 定位缓存命中: {desc} → {results[kw]}")
+        else:
+            missing.append(kw)
+
+    if missing:
+        locations = call_gui_plus_many(screenshot_path, [descriptions[kw] for kw in missing])
+        for kw, location in zip(missing, locations):
+            if not location["found"]:
+                results[kw] = None
+                continue
+            x, y = location["image_x"], location["image_y"]
+            results[kw] = (x, y)
+            location_cache.store(image, descriptions[kw], x / width, y / height)
+    return results
+
+
 def execute_action(action_result):
     """执行 GUI-plus 返回的动作"""
     if not action_result:
@@ -191,7 +254,7 @@ def execute_action(action_result):
         
         # 移动鼠标
         print("1️⃣ 移动鼠标...")
-        subprocess.run(["cliclick", f"m:{x},{y}"])
+        get_backend().move(x, y)
         
         # 等待确认
         print("⏳ 等待 3 秒...")
@@ -199,7 +262,7 @@ def execute_action(action_result):
         
         # 点击
         print("2️⃣ 点击!")
-        subprocess.run(["cliclick", f"c:{x},{y}"])
+        get_backend().click(x, y)
         print(f"✅ 已点击 ({x}, {y})")
         return True
     
@@ -208,9 +271,8 @@ def execute_action(action_result):
         needs_enter = params.get("needs_enter", False)
         print(f"⌨️  输入文本: {text}")
         # 这里可以实现文本输入
-        subprocess.run(["cliclick", f"t:{text}"])
-        if needs_enter:
-            subprocess.run(["cliclick", "kp:return"])
+        commands = [("type", text)] + ([("key", "return")] if needs_enter else [])
+        get_backend().batch(commands)
         print("✅ 已输入")
         return True
     
@@ -231,8 +293,8 @@ def execute_action(action_result):
         
         print(f"🔄 滚动: {direction} ({amount}) = {clicks} 单位")
         
-        # 使用 cliclick 的滚轮命令 (w:N)
-        subprocess.run(["cliclick", f"w:{scroll_value}"])
+        # 滚轮命令（macOS 下为 cliclick w:N）
+        get_backend().batch([("scroll", scroll_value)])
         
         print(f"✅ 已滚动 {direction}")
         return True
@@ -260,12 +322,13 @@ def main():
     
     # 任务设置
     search_query = "俄乌冲突"
-    target_task = "点击标题包含'拉夫罗夫'的新闻"
+    keywords = sys.argv[1:] or ["拉夫罗夫"]
+    target_task = f"点击标题包含'{keywords[0]}'的新闻"
     
     # 1. 打开 Google 搜索
     print(f"🌐 打开 Google 搜索: {search_query}")
     url = f"https://www.google.com/search?q={search_query}"
-    subprocess.run(["open", "-a", "Google Chrome", url])
+    get_backend().open_url(url)
     print("⏳ 等待页面加载 (6秒)...")
     time.sleep(6)
     
@@ -275,9 +338,22 @@ def main():
         print("❌ 截图失败")
         return
     
-    # 3. 调用 GUI-plus
-    instruction = f"在这个Google搜索结果页面中，{target_task}"
-    result = call_gui_plus(screenshot, instruction)
+    # 3. 有多个候选关键词时先核对候选标题（一次批量定位），找到就直接点击第一个
+    found = []
+    if len(keywords) > 1:
+        titles = locate_titles(screenshot, keywords)
+        found = [(kw, pos) for kw, pos in titles.items() if pos]
+    if found:
+        kw, (x, y) = found[0]
+        result = {
+            "action": "CLICK",
+            "parameters": {"x": x, "y": y, "description": f"标题包含'{kw}'的新闻"},
+            "thought": f"批量核对找到 {len(found)}/{len(keywords)} 个候选标题，点击第一个",
+        }
+    else:
+        # 单个关键词、或没有找到候选标题时交给 GUI-plus 按指令决策
+        instruction = f"在这个Google搜索结果页面中，{target_task}"
+        result = call_gui_plus(screenshot, instruction)
     
     if not result:
         print("❌ GUI-plus 调用失败")
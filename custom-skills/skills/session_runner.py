@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+session_runner.py - 多会话并发执行 GUI 任务
+
+allops_smart_v3.py 的 main() 一次只在前台 Chrome 里跑一个目标。这里读入一批目标并发执行：
+- 每个任务一个独立进程（进程池，任务结束即退出），拥有自己的 Xvfb 虚拟显示和浏览器配置目录
+- 每个任务有单独的步数上限
+- 所有进程共享同一个模型限流器（每分钟调用数 + 同时在途调用数）
+- 定位缓存 / 轨迹宏可以共用同一个持久化文件（LOCATION_CACHE_PATH / MACRO_CACHE_PATH），
+  保存时在文件锁内合并其他会话的更新
+- 每个任务的输出写到自己的目录，主进程只打印进度，结束时汇总吞吐（任务/小时、每个任务的模型调用数）
+
+环境变量：
+- SESSION_BACKEND: x11 | sim（默认 x11；sim 不启动 Xvfb，用于压测调度本身）
+- SESSION_ROOT: 会话目录（日志、浏览器配置、埋点），默认 /tmp/allops_sessions
+- SESSION_SCREEN: 虚拟显示分辨率（默认 1280x800）
+- SESSION_DISPLAY_BASE: 虚拟显示编号起点，第 i 个任务使用 :(起点 + i)（默认 100）
+- SESSION_START_URL: 每个会话启动浏览器时打开的网址（默认 https://www.baidu.com）
+- SESSION_BROWSER_WAIT: 启动浏览器后等待的秒数（默认 3）
+- SESSION_KEEP_PROFILES: 任务结束后保留浏览器配置目录（默认 0）
+- GATEWAY_RATE_LIMIT / GATEWAY_MAX_CONCURRENT: 所有会话共享的模型限流
+
+使用方法: python3 session_runner.py 目标列表.txt [并发数] [每个任务最大步骤]
+（目标列表每行一个目标，空行和 # 开头的行会被忽略；文件名为 - 时从标准输入读取）
+
+需要 Python 3.11+（进程池的 max_tasks_per_child，保证每个任务都在新进程里按自己的环境变量导入模块）。
+"""
+
+import concurrent.futures
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+
+from model_gateway import GATEWAY_MAX_CONCURRENT, GATEWAY_RATE_LIMIT, RateLimiter
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "x11")
+SESSION_ROOT = os.getenv("SESSION_ROOT", "/tmp/allops_sessions")
+SESSION_SCREEN = os.getenv("SESSION_SCREEN", "1280x800")
+SESSION_DISPLAY_BASE = int(os.getenv("SESSION_DISPLAY_BASE", "100"))
+SESSION_START_URL = os.getenv("SESSION_START_URL", "https://www.baidu.com")
+SESSION_BROWSER_WAIT = float(os.getenv("SESSION_BROWSER_WAIT", "3"))
+SESSION_KEEP_PROFILES = os.getenv("SESSION_KEEP_PROFILES", "0") == "1"
+
+# 子进程里由 _init_worker 设置
+_limiter: RateLimiter | None = None
+
+
+def load_goals(path: str) -> list[str]:
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def start_xvfb(display: int, screen: str = SESSION_SCREEN) -> subprocess.Popen:
+    """启动一个 Xvfb 虚拟显示，等它的 socket 出现后返回"""
+    proc = subprocess.Popen(
+        ["Xvfb", f":{display}", "-screen", "0", f"{screen}x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    socket_path = f"/tmp/.X11-unix/X{display}"
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None:
+            raise RuntimeError(f"Xvfb :{display} 启动失败（退出码 {proc.returncode}）")
+        if time.monotonic() > deadline:
+            proc.kill()
+            raise RuntimeError(f"Xvfb :{display} 启动超时")
+        time.sleep(0.05)
+    return proc
+
+
+def _init_worker(limiter: RateLimiter | None) -> None:
+    global _limiter
+    _limiter = limiter
+
+
+def run_session(index: int, goal: str, max_steps: int) -> dict:
+    """在子进程中执行一个任务（每个任务一个新进程，模块按本会话的环境变量重新导入）"""
+    session_dir = os.path.join(SESSION_ROOT, f"session_{index:04d}")
+    profile_dir = os.path.join(session_dir, "profile")
+    os.makedirs(profile_dir, exist_ok=True)
+
+    os.environ["GUI_BACKEND"] = SESSION_BACKEND
+    os.environ["CHROME_USER_DATA_DIR"] = profile_dir
+    width, height = SESSION_SCREEN.lower().split("x")
+    os.environ["CHROME_ARGS"] = f"--window-position=0,0 --window-size={width},{height}"
+    if SESSION_BACKEND == "sim":
+        os.environ["SIM_SCREEN"] = SESSION_SCREEN
+
+    result = {"index": index, "goal": goal, "status": "error", "steps": 0, "model_calls": {}}
+    xvfb = None
+    start = time.monotonic()
+    log_path = os.path.join(session_dir, "log.txt")
+
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(
+        log
+    ), contextlib.redirect_stderr(log):
+        try:
+            if SESSION_BACKEND == "x11":
+                display = SESSION_DISPLAY_BASE + index
+                xvfb = start_xvfb(display)
+                os.environ["DISPLAY"] = f":{display}"
+
+            from allops_smart_v3 import smart_execute
+            from gui_backend import get_backend
+            from model_gateway import get_gateway
+            from step_tracer import get_tracer
+
+            get_tracer().path = os.path.join(session_dir, "trace.jsonl")
+            gateway = get_gateway()
+            gateway.limiter = _limiter
+
+            if SESSION_BACKEND == "x11":
+                get_backend().open_url(SESSION_START_URL)
+                time.sleep(SESSION_BROWSER_WAIT)
+
+            result.update(smart_execute(goal, max_steps))
+            for record in gateway.records:
+                calls = result["model_calls"]
+                calls[record.model] = calls.get(record.model, 0) + 1
+        except Exception:  # noqa: BLE001
+            traceback.print_exc()
+        finally:
+            if xvfb:
+                # 关掉显示后浏览器也会随之退出
+                xvfb.terminate()
+                xvfb.wait(timeout=5)
+            if not SESSION_KEEP_PROFILES:
+                shutil.rmtree(profile_dir, ignore_errors=True)
+
+    result["duration"] = round(time.monotonic() - start, 2)
+    result["log"] = log_path
+    return result
+
+
+def print_summary(results: list[dict], elapsed: float) -> None:
+    print("\n" + "=" * 60)
+    print("📊 多会话执行汇总")
+    print("=" * 60)
+    total = len(results)
+    if not total:
+        return
+
+    by_status: dict[str, int] = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+    print(f"任务数: {total}（" + "，".join(f"{k} {v}" for k, v in sorted(by_status.items())) + "）")
+    print(f"总耗时: {elapsed:.1f}秒，吞吐: {total / elapsed * 3600:.1f} 任务/小时")
+    print(
+        f"平均每个任务: {sum(r['duration'] for r in results) / total:.1f}秒，"
+        f"{sum(r['steps'] for r in results) / total:.1f} 步"
+    )
+
+    models = sorted({m for r in results for m in r["model_calls"]})
+    for model in models:
+        calls = sum(r["model_calls"].get(model, 0) for r in results)
+        print(f"  {model}: 共 {calls} 次，平均每个任务 {calls / total:.1f} 次")
+    print(f"明细: {os.path.join(SESSION_ROOT, 'results.jsonl')}")
+    print("=" * 60)
+
+
+def run_goals(goals: list[str], workers: int = 4, max_steps: int = 20) -> list[dict]:
+    """并发执行一批目标，返回每个任务的结果"""
+    if sys.version_info < (3, 11):
+        raise RuntimeError(
+            "session_runner 需要 Python 3.11+（ProcessPoolExecutor 的 max_tasks_per_child），"
+            f"当前为 {sys.version.split()[0]}"
+        )
+    os.makedirs(SESSION_ROOT, exist_ok=True)
+    ctx = multiprocessing.get_context("spawn")
+    limiter = None
+    if GATEWAY_RATE_LIMIT > 0 or GATEWAY_MAX_CONCURRENT > 0:
+        limiter = RateLimiter(GATEWAY_RATE_LIMIT, GATEWAY_MAX_CONCURRENT, ctx=ctx)
+
+    print("=" * 60)
+    print("🧠 allops_smart_v3 - 多会话并发执行")
+    print("=" * 60)
+    print(f"任务数: {len(goals)}，并发: {workers}，每个任务最多 {max_steps} 步")
+    print(f"后端: {SESSION_BACKEND}，会话目录: {SESSION_ROOT}")
+    if limiter:
+        print(
+            f"模型限流: 每分钟 {GATEWAY_RATE_LIMIT or '不限'} 次，"
+            f"同时在途 {GATEWAY_MAX_CONCURRENT or '不限'} 个"
+        )
+    print("=" * 60)
+
+    results: list[dict] = []
+    start = time.monotonic()
+    results_path = os.path.join(SESSION_ROOT, "results.jsonl")
+
+    with open(results_path, "w", encoding="utf-8") as out, concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(limiter,),
+        max_tasks_per_child=1,
+    ) as pool:
+        futures = {
+            pool.submit(run_session, index, goal, max_steps): (index, goal)
+            for index, goal in enumerate(goals)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            index, goal = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # noqa: BLE001
+                # 子进程异常退出（例如被系统杀掉）
+                result = {
+                    "index": index,
+                    "goal": goal,
+                    "status": "error",
+                    "steps": 0,
+                    "model_calls": {},
+                    "duration": 0.0,
+                    "error": str(e),
+                }
+            results.append(result)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            icon = "✅" if result["status"] == "finished" else "❌"
+            print(
+                f"{icon} [{len(results)}/{len(goals)}] #{index} {result['status']} "
+                f"{result['steps']} 步 {result['duration']:.1f}秒 - {goal}"
+            )
+
+    print_summary(results, time.monotonic() - start)
+    return results
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print("使用方法: python3 session_runner.py 目标列表.txt [并发数] [每个任务最大步骤]")
+        sys.exit(1)
+
+    goals = load_goals(sys.argv[1])
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    max_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    run_goals(goals, workers, max_steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+settle_detector.py - 基于帧差的页面稳定检测
+
+代替固定的 sleep：以低分辨率不断截取小图，相邻帧不再变化即认为页面已稳定。
+- 如果给了动作前的参考帧，先等画面发生变化，再等它稳定（避免点击后页面还没开始响应就继续）
+- 超过 max_wait 无论如何都会返回
+- 按动作类型记录每次实际等待的时长
+- 记住最后一帧（小图 last_frame 与原图 last_image），检查点可以直接在这一帧上验证，不必重新截图
+- 后端截一帧要启动子进程时（未安装 PyObjC 的 macOS），不再轮询：按动作类型固定等待，
+  之后截一帧作为最后一帧（窗口激活只等待、不截图）
+
+环境变量：
+- SETTLE_POLL_INTERVAL: 轮询间隔秒数（默认 0.1）
+- SETTLE_MAX_WAIT: 最长等待秒数（默认 3.0）
+- SETTLE_CHANGE_TIMEOUT: 等待画面开始变化的最长秒数（默认 0.8）
+- SETTLE_STABLE_FRAMES: 连续多少帧不变视为稳定（默认 2）
+- SETTLE_DIFF_THRESHOLD: 帧差阈值，0-1 之间的平均像素差（默认 0.005）
+"""
+
+import os
+import time
+from collections.abc import Callable
+
+from PIL import Image, ImageChops, ImageStat
+
+from gui_backend import get_backend
+
+SETTLE_POLL_INTERVAL = float(os.getenv("SETTLE_POLL_INTERVAL", "0.1"))
+SETTLE_MAX_WAIT = float(os.getenv("SETTLE_MAX_WAIT", "3.0"))
+SETTLE_CHANGE_TIMEOUT = float(os.getenv("SETTLE_CHANGE_TIMEOUT", "0.8"))
+SETTLE_STABLE_FRAMES = int(os.getenv("SETTLE_STABLE_FRAMES", "2"))
+SETTLE_DIFF_THRESHOLD = float(os.getenv("SETTLE_DIFF_THRESHOLD", "0.005"))
+
+THUMB_SIZE = (96, 60)
+
+# 截图代价高的后端上按动作类型固定等待的秒数（原来 smart_execute 里的固定 sleep）
+FIXED_WAITS = {"ACTIVATE": 0.7, "CLICK": 1.5, "TYPE": 1.5, "KEY_PRESS": 1.5, "SCROLL": 1.0}
+
+
+def make_thumbnail(image: Image.Image) -> Image.Image:
+    """缩成灰度小图，用于廉价的帧差比较"""
+    return image.convert("L").resize(THUMB_SIZE, Image.BILINEAR)
+
+
+def grab_thumbnail(bounds: tuple[int, int, int, int] | None = None) -> Image.Image | None:
+    """截取一帧低分辨率灰度图（截图直接在内存中缩小）"""
+    image = get_backend().grab(bounds)
+    if image is None:
+        return None
+    return make_thumbnail(image)
+
+
+def frame_diff(a: Image.Image, b: Image.Image) -> float:
+    """两帧之间的平均像素差（0-1）"""
+    diff = ImageChops.difference(a, b)
+    return ImageStat.Stat(diff).mean[0] / 255.0
+
+
+class SettleDetector:
+    """轮询低分辨率帧，直到画面稳定或超时，并按动作类型统计等待时间"""
+
+    def __init__(
+        self,
+        poll_interval: float = SETTLE_POLL_INTERVAL,
+        max_wait: float = SETTLE_MAX_WAIT,
+        change_timeout: float = SETTLE_CHANGE_TIMEOUT,
+        stable_frames: int = SETTLE_STABLE_FRAMES,
+        threshold: float = SETTLE_DIFF_THRESHOLD,
+    ) -> None:
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.change_timeout = change_timeout
+        self.stable_frames = stable_frames
+        self.threshold = threshold
+        self.waits: dict[str, list[float]] = {}
+        self.last_frame: Image.Image | None = None
+        self.last_image: Image.Image | None = None
+        self.last_bounds: tuple[int, int, int, int] | None = None
+
+    def wait(
+        self,
+        label: str,
+        bounds: tuple[int, int, int, int] | None = None,
+        reference: Image.Image | None = None,
+        on_stable: Callable[[], None] | None = None,
+    ) -> float:
+        """等待页面稳定，返回实际等待秒数
+
+        on_stable 在第一次观察到相邻两帧一致时调用，可用来提前开始截图编码。
+        """
+        start = time.monotonic()
+        deadline = start + self.max_wait
+
+        if not get_backend().cheap_grab:
+            return self._wait_fixed(label, bounds, start)
+
+        prev_image, prev = self._grab(bounds)
+        if prev is None:
+            # 截不到图时退回到固定等待，之后再试一次，不沿用上一次等待的帧
+            time.sleep(self.max_wait)
+            self._remember(bounds, *self._grab(bounds))
+            return self._record(label, start)
+
+        # 1. 有参考帧时，先等画面开始变化
+        if reference is not None and reference.size == prev.size:
+            change_deadline = min(deadline, start + self.change_timeout)
+            while frame_diff(reference, prev) <= self.threshold:
+                if time.monotonic() >= change_deadline:
+                    break
+                time.sleep(self.poll_interval)
+                image, thumb = self._grab(bounds)
+                if thumb is not None:
+                    prev_image, prev = image, thumb
+
+        # 2. 等待连续若干帧不再变化
+        stable = 0
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            image, cur = self._grab(bounds)
+            if cur is None:
+                continue
+            if frame_diff(prev, cur) <= self.threshold:
+                stable += 1
+                if stable == 1 and on_stable:
+                    on_stable()
+                if stable >= self.stable_frames:
+                    break
+            else:
+                stable = 0
+            prev_image, prev = image, cur
+
+        self._remember(bounds, prev_image, prev)
+        return self._record(label, start)
+
+    def _wait_fixed(
+        self, label: str, bounds: tuple[int, int, int, int] | None, start: float
+    ) -> float:
+        """固定等待；动作之后再截一帧给检查点用，窗口激活之后紧接着就会截图，不再多截"""
+        time.sleep(min(self.max_wait, FIXED_WAITS.get(label, self.max_wait)))
+        if label == "ACTIVATE":
+            self._remember(None, None, None)
+        else:
+            self._remember(bounds, *self._grab(bounds))
+        return self._record(label, start)
+
+    @staticmethod
+    def _grab(
+        bounds: tuple[int, int, int, int] | None,
+    ) -> tuple[Image.Image | None, Image.Image | None]:
+        image = get_backend().grab(bounds)
+        if image is None:
+            return None, None
+        return image, make_thumbnail(image)
+
+    def _remember(
+        self,
+        bounds: tuple[int, int, int, int] | None,
+        image: Image.Image | None,
+        thumb: Image.Image | None,
+    ) -> None:
+        self.last_image, self.last_frame, self.last_bounds = image, thumb, bounds
+
+    def _record(self, label: str, start: float) -> float:
+        waited = time.monotonic() - start
+        self.waits.setdefault(label, []).append(waited)
+        return waited
+
+    def print_summary(self) -> None:
+        if not self.waits:
+            return
+        print("\n⏱️  页面稳定等待统计:")
+        for label, values in self.waits.items():
+            avg = sum(values) / len(values)
+            print(
+                f"  {label}: {len(values)} 次，平均 {avg:.2f}s，"
+                f"最长 {max(values):.2f}s，合计 {sum(values):.2f}s"
+            )
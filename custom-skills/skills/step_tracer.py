@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+step_tracer.py - GUI 代理每一步的分阶段耗时埋点
+
+每一步拆成若干阶段（activate / capture / encode / brain / cache_lookup / locator / input / settle），
+每个阶段是一个 span，记录耗时以及附加信息（token 数、负载字节数、动作类型等）：
+- span 以 JSON lines 追加写入 STEP_TRACE_PATH
+- span 可以嵌套；模型网关会把 token 用量补充到当前线程最内层的 span 上
+- 结束时按阶段打印 p50 / p95 / 合计
+
+环境变量：
+- STEP_TRACE_PATH: JSON lines 输出文件（默认 /tmp/allops_trace.jsonl，设为空则不写文件）
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+STEP_TRACE_PATH = os.getenv("STEP_TRACE_PATH", "/tmp/allops_trace.jsonl")
+
+# 汇总时累加的数值字段
+SUMMED_FIELDS = ("prompt_tokens", "completion_tokens", "payload_bytes")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近秩法求分位数：第 ceil(pct% × n) 小的值"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+class StepTracer:
+    """收集分阶段 span，写 JSON lines 并在结束时汇总"""
+
+    def __init__(self, path: str = STEP_TRACE_PATH) -> None:
+        self.path = path
+        self.step: int | None = None
+        self.spans: list[dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin_step(self, step_num: int) -> None:
+        self.step = step_num
+
+    def _stack(self) -> list[dict]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, stage: str, **attrs) -> Iterator[dict]:
+        """记录一个阶段；返回的 dict 可在阶段内继续补充字段"""
+        record = {"step": self.step, "stage": stage, **attrs}
+        stack = self._stack()
+        stack.append(record)
+        start = time.monotonic()
+        record["ts"] = time.time()
+        try:
+            yield record
+        finally:
+            record["duration"] = round(time.monotonic() - start, 4)
+            stack.pop()
+            self._emit(record)
+
+    def annotate(self, **attrs) -> None:
+        """给当前线程最内层的 span 补充字段（没有 span 时忽略）"""
+        stack = self._stack()
+        if stack:
+            stack[-1].update(attrs)
+
+    def _emit(self, record: dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def print_summary(self) -> None:
+        if not self.spans:
+            return
+        print("\n⏱️  分阶段耗时（秒）:")
+        print(f"  {'阶段':<14}{'次数':>6}{'p50':>9}{'p95':>9}{'合计':>9}")
+        stages = list(dict.fromkeys(s["stage"] for s in self.spans))
+        for stage in stages:
+            spans = [s for s in self.spans if s["stage"] == stage]
+            durations = [s["duration"] for s in spans]
+            extras = []
+            for field in SUMMED_FIELDS:
+                total = sum(s.get(field, 0) for s in spans)
+                if total:
+                    extras.append(f"{field}={total}")
+            print(
+                f"  {stage:<14}{len(spans):>6}{percentile(durations, 50):>9.3f}"
+                f"{percentile(durations, 95):>9.3f}{sum(durations):>9.2f}"
+                + (f"  {' '.join(extras)}" if extras else "")
+            )
+        if self.path:
+            print(f"  明细: {self.path}")
+
+
+_tracer: StepTracer | None = None
+
+
+def get_tracer() -> StepTracer:
+    """进程内共享的埋点实例"""
+    global _tracer
+    if _tracer is None:
+        _tracer = StepTracer()
+    return _tracer
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+stream_json.py - 模型流式输出的增量 JSON 解析
+
+ask_qwen3_brain / ask_gui_plus 以前要等完整回复，再切掉 ``` 包裹、整体 json.loads。
+这里边收边解析顶层 JSON 对象：
+- 每个顶层字段的值一完整就解析出来（嵌套对象 / 数组整体解析）
+- 调用方给出 ready 条件（例如 action + parameters 已完整），满足后立即停止读取，
+  后面的 thought 等字段不再等待
+- 开头出现过长的非 JSON 文本、结构错误、值无法解析时立刻判定为格式错误，不等回复结束就重试
+
+提前结束时服务端不会再发 usage，这次调用的 token 数记为 0。
+
+环境变量：
+- STREAM_EARLY_DISPATCH: 是否在字段完整后提前结束读取（默认 1）
+- STREAM_PARSE_RETRIES: 格式错误时的重试次数（默认 1）
+- STREAM_MAX_PREFIX: JSON 开始前允许的最多字符数（``` 包裹、少量说明文字，默认 64）
+"""
+
+import json
+import os
+from collections.abc import Callable
+
+STREAM_EARLY_DISPATCH = os.getenv("STREAM_EARLY_DISPATCH", "1") == "1"
+STREAM_PARSE_RETRIES = int(os.getenv("STREAM_PARSE_RETRIES", "1"))
+STREAM_MAX_PREFIX = int(os.getenv("STREAM_MAX_PREFIX", "64"))
+
+_VALUE_START = set('"{[-0123456789tfn')
+_WHITESPACE = set(" \t\r\n")
+
+
+class MalformedOutput(ValueError):
+    """模型输出不是预期的 JSON 对象"""
+
+
+class IncrementalJSONParser:
+    """增量解析一个顶层 JSON 对象，顶层字段完整后放进 fields"""
+
+    def __init__(self, max_prefix: int = STREAM_MAX_PREFIX) -> None:
+        self.max_prefix = max_prefix
+        self.reset()
+
+    def reset(self) -> None:
+        """丢弃已解析的状态，从头开始"""
+        self.text = ""
+        self.fields: dict = {}
+        self.done = False
+        self._pos = 0
+        self._state = "prefix"
+        self._token_start = 0
+        self._key = ""
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def update(self, text: str) -> None:
+        """传入目前为止累积的全部文本（与 chat_stream 的回调一致）
+
+        网关在流中途出错重试时，累积文本会从新一次请求的开头重新开始；
+        新文本不是已收到文本的延续时，从头重新解析。
+        """
+        if not text.startswith(self.text):
+            self.reset()
+        self.text = text
+        self._scan()
+
+    def feed(self, delta: str) -> None:
+        self.update(self.text + delta)
+
+    def result(self) -> dict:
+        if not self.done:
+            raise MalformedOutput(f"JSON 不完整: {self.text[-80:]!r}")
+        return self.fields
+
+    def _fail(self, reason: str) -> None:
+        context = self.text[max(0, self._pos - 40) : self._pos + 1]
+        raise MalformedOutput(f"{reason}（位置 {self._pos}）: {context!r}")
+
+    def _scan(self) -> None:
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            state = self._state
+
+            if state == "prefix":
+                if ch == "{":
+                    self._state = "key"
+                elif self._pos >= self.max_prefix:
+                    self._fail("JSON 之前的多余文本过长")
+
+            elif state == "key":
+                if ch == '"':
+                    self._token_start = self._pos
+                    self._state = "key_string"
+                elif ch == "}" and not self.fields:
+                    self.done = True
+                elif ch not in _WHITESPACE:
+                    self._fail("应为字段名")
+
+            elif state == "key_string":
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._key = json.loads(text[self._token_start : self._pos + 1])
+                    self._state = "colon"
+
+            elif state == "colon":
+                if ch == ":":
+                    self._state = "value_start"
+                elif ch not in _WHITESPACE:
+                    self._fail("应为冒号")
+
+            elif state == "value_start":
+                if ch in _VALUE_START:
+                    self._token_start = self._pos
+                    self._state = "value"
+                    self._depth = 0
+                    self._in_string = False
+                    self._escape = False
+                    continue  # 由 value 状态处理这个字符
+                if ch not in _WHITESPACE:
+                    self._fail("应为字段值")
+
+            elif state == "value":
+                if self._value_step(ch):
+                    # 值结束于当前字符之前（基本类型遇到分隔符）
+                    self._finish_value(self._pos)
+                    continue
+                if self._depth == 0 and not self._in_string and self._closed_here(ch):
+                    self._finish_value(self._pos + 1)
+
+            elif state == "after_value":
+                if ch == ",":
+                    self._state = "key"
+                elif ch == "}":
+                    self.done = True
+                elif ch not in _WHITESPACE:
+                    self._fail("应为逗号或 }")
+
+            self._pos += 1
+
+    def _value_step(self, ch: str) -> bool:
+        """推进值内部的状态；基本类型遇到分隔符时返回 True"""
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return False
+
+        if ch == '"':
+            if self._depth == 0 and self._pos != self._token_start:
+                self._fail("字段值中出现多余的引号")
+            self._in_string = True
+        elif ch in "{[":
+            self._depth += 1
+        elif ch in "}]":
+            if self._depth == 0:
+                return True
+            self._depth -= 1
+        elif self._depth == 0 and (ch == "," or ch in _WHITESPACE):
+            return True
+        return False
+
+    def _closed_here(self, ch: str) -> bool:
+        """字符串 / 容器类型的值是否在当前字符处闭合"""
+        first = self.text[self._token_start]
+        return (first == '"' and ch == '"' and self._pos != self._token_start) or (
+            first in "{[" and ch in "}]"
+        )
+
+    def _finish_value(self, end: int) -> None:
+        raw = self.text[self._token_start : end]
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self._fail(f"字段 {self._key} 的值无法解析（{e.msg}）")
+        self._state = "after_value"
+
+
+def stream_json_object(
+    stream: Callable[..., str],
+    ready: Callable[[dict], bool],
+    on_partial: Callable[[str], None] | None = None,
+    retries: int = STREAM_PARSE_RETRIES,
+    **kwargs,
+) -> dict:
+    """用 stream(on_text=..., **kwargs)（例如 gateway.chat_stream）流式取回一个 JSON 对象
+
+    ready(fields) 为真时提前结束读取并返回已解析的字段；格式错误时重试。
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        parser = IncrementalJSONParser()
+
+        def on_text(text: str) -> bool:
+            if on_partial:
+                on_partial(text)
+            parser.update(text)
+            # 对象已经完整时不必提前断开：剩下的只是 ``` 收尾，还能拿到 usage
+            return STREAM_EARLY_DISPATCH and not parser.done and ready(parser.fields)
+
+        try:
+            text = stream(on_text=on_text, **kwargs)
+            parser.update(text)
+            if parser.done:
+                return parser.fields
+            if STREAM_EARLY_DISPATCH and ready(parser.fields):
+                print("⚡ 关键字段已完整，提前执行（不再等待剩余输出）")
+                return parser.fields
+            return parser.result()
+        except MalformedOutput as e:
+            if attempt > retries:
+                raise
+            print(f"⚠️  模型输出格式错误（{e}），立即重试...")
+
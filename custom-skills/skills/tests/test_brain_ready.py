@@ -0,0 +1,24 @@
+from allops_smart_v3 import brain_ready
+
+
+def test_plan_is_ready():
+    assert brain_ready({"plan": [{"action": "SCROLL", "parameters": {}}]})
+
+
+def test_non_locating_action_needs_only_parameters():
+    assert brain_ready({"action": "KEY_PRESS", "parameters": {"key": "enter"}})
+    assert brain_ready({"action": "TYPE", "parameters": {"text": "a", "click_first": False}})
+    assert not brain_ready({"action": "KEY_PRESS"})
+
+
+def test_click_waits_for_target_description():
+    assert not brain_ready({"action": "CLICK", "parameters": {}})
+    assert brain_ready({"action": "CLICK", "target_description": "按钮", "parameters": {}})
+    assert not brain_ready({"action": "TYPE", "parameters": {"text": "a", "click_first": True}})
+
+
+def test_out_of_order_description_waits_for_area_or_thought():
+    fields = {"action": "CLICK", "parameters": {}, "target_description": "按钮"}
+    assert not brain_ready(fields)
+    assert brain_ready({**fields, "target_area": "top-right"})
+    assert brain_ready({**fields, "thought": "..."})
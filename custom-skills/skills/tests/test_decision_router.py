@@ -0,0 +1,90 @@
+import pytest
+
+import decision_router
+from decision_router import DecisionRouter, call_cost, follow_up_rule
+
+
+def round_(actions, descriptions, diverged=None):
+    return {"actions": actions, "descriptions": descriptions, "diverged": diverged}
+
+
+def test_enter_after_typing_search_text():
+    last = round_(
+        [{"action": "TYPE", "target_description": "搜索框", "parameters": {"text": "天气"}}],
+        ["输入了 天气"],
+    )
+    assert follow_up_rule(last, "打开百度查天气", 0)["parameters"] == {"key": "enter"}
+
+
+def test_no_enter_when_already_submitted_or_diverged():
+    typed = {"action": "TYPE", "target_description": "搜索框", "parameters": {"text": "天气", "needs_enter": True}}
+    assert follow_up_rule(round_([typed], ["输入了 天气"]), "搜索天气", 0) is None
+    typed["parameters"]["needs_enter"] = False
+    assert follow_up_rule(round_([typed], ["输入了 天气"], "画面没有变化"), "搜索天气", 0) is None
+
+
+def test_scroll_when_click_target_missing_until_limit():
+    last = round_([{"action": "CLICK", "target_description": "下一页"}], ["无法找到：下一页"])
+    assert follow_up_rule(last, "翻页", 0)["action"] == "SCROLL"
+    assert follow_up_rule(last, "翻页", decision_router.CASCADE_MAX_RULE_SCROLLS) is None
+
+
+def test_no_rule_without_history():
+    assert follow_up_rule(None, "任何目标", 0) is None
+    assert follow_up_rule(round_([], []), "任何目标", 0) is None
+
+
+def test_call_cost_uses_price_table():
+    assert call_cost("qwen3-max", 1_000_000, 0) == pytest.approx(6.0)
+    assert call_cost("unknown-model", 1_000_000, 1_000_000) == 0
+
+
+@pytest.mark.parametrize(
+    ("decision", "rejected"),
+    [
+        (None, True),
+        ({"action": "FINISH", "confidence": 1}, True),
+        ({"action": "CLICK", "confidence": 0.5}, True),
+        ({"action": "CLICK", "confidence": "high"}, True),
+        ({"action": "CLICK", "confidence": 0.95}, False),
+    ],
+)
+def test_small_model_rejection(decision, rejected):
+    router = DecisionRouter(lambda *a, **k: None, "prompt", lambda f: True, min_confidence=0.8)
+    assert (router._reject_reason(decision) is not None) == rejected
+
+
+def test_failed_verification_escalates_next_round():
+    router = DecisionRouter(lambda *a, **k: None, "prompt", lambda f: True, small_model="")
+    router.verify("rules", False)
+    assert router.escalate_next
+    last = round_([{"action": "CLICK", "target_description": "下一页"}], ["无法找到：下一页"])
+    # 升级后跳过规则层，直接询问 qwen3-max；下一轮恢复从规则层开始
+    router._ask_model = lambda tier, *a: {"action": "SCROLL", "tier": tier}
+    decision, tier = router.decide(None, "翻页", "", last)
+    assert tier == "max" and decision["tier"] == "max"
+    decision, tier = router.decide(None, "翻页", "", last)
+    assert tier == "rules"
+
+
+def test_rule_scrolls_are_bounded_across_click_misses():
+    """点击失败 → 规则滚动 → 再次点击失败 …… 规则层最多连续滚动 CASCADE_MAX_RULE_SCROLLS 次"""
+    router = DecisionRouter(lambda *a, **k: None, "prompt", lambda f: True, small_model="")
+    router._ask_model = lambda tier, *a: {"action": "CLICK", "target_description": "下一页"}
+    miss = round_([{"action": "CLICK", "target_description": "下一页"}], ["无法找到：下一页"], "第 1 步执行失败")
+    scrolled = round_([{"action": "SCROLL"}], ["向down滚动了medium"])
+
+    tiers = []
+    last = miss
+    for _ in range(decision_router.CASCADE_MAX_RULE_SCROLLS + 1):
+        decision, tier = router.decide(None, "翻页", "", last)
+        tiers.append(tier)
+        if tier == "rules":
+            # 滚动后的一轮交给模型，模型再次点击仍然找不到
+            assert router.decide(None, "翻页", "", scrolled)[1] == "max"
+        last = miss
+    assert tiers == ["rules"] * decision_router.CASCADE_MAX_RULE_SCROLLS + ["max"]
+
+    clicked = round_([{"action": "CLICK", "target_description": "下一页"}], ["点击了 下一页 (1, 2)"])
+    router.decide(None, "翻页", "", clicked)
+    assert router.decide(None, "翻页", "", miss)[1] == "rules"
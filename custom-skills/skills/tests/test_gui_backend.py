@@ -0,0 +1,77 @@
+from PIL import Image
+
+import gui_backend
+from gui_backend import MacOSBackend, SimulatedDesktop
+
+
+def test_simulated_search_flow():
+    desktop = SimulatedDesktop(size=(1280, 800))
+    desktop.click(400, 320)
+    desktop.type_text("俄乌冲突")
+    desktop.key_press("Return")
+    assert desktop.page == "results"
+    assert desktop.values == {"search": "俄乌冲突"}
+
+    desktop.click(300, 275)
+    assert desktop.page == "article"
+    assert [e["event"] for e in desktop.events] == ["click", "type", "key", "navigate", "click", "navigate"]
+
+
+def test_simulated_click_outside_drops_focus():
+    desktop = SimulatedDesktop(size=(1280, 800))
+    desktop.click(400, 320)
+    desktop.click(10, 700)
+    desktop.type_text("ignored")
+    desktop.key_press("enter")
+    assert desktop.page == "home"
+    assert desktop.values == {}
+
+
+def test_simulated_scroll_shifts_hit_boxes():
+    desktop = SimulatedDesktop(size=(1280, 800))
+    desktop.click(900, 320)
+    assert desktop.page == "results"
+    # 滚动 100 像素：原来 360-390 的链接移到 260-290，原来 160-190 的移到 60-90
+    desktop.scroll(5)
+    desktop.click(300, 375)
+    assert desktop.page == "results"
+    desktop.click(300, 75)
+    assert desktop.page == "article"
+
+
+def test_simulated_capture_renders_current_page(tmp_path):
+    desktop = SimulatedDesktop(size=(640, 400))
+    output = str(tmp_path / "shot.png")
+    assert desktop.capture(output, (0, 0, 320, 200))
+    with Image.open(output) as img:
+        assert img.size == (320, 200)
+
+    before = desktop.render()
+    desktop.click(400, 320)
+    desktop.type_text("abc")
+    assert desktop.render().tobytes() != before.tobytes()
+
+
+def test_batch_records_latency_per_command_combination():
+    desktop = SimulatedDesktop(size=(1280, 800))
+    desktop.batch([("move", 400, 320), ("click", 400, 320)])
+    desktop.batch([("type", "abc"), ("key", "Return")])
+    assert desktop.page == "results"
+    assert set(desktop.command_latencies) == {"move+click", "type+key"}
+
+
+def test_macos_batch_merges_cliclick_and_paste(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gui_backend.subprocess, "run", lambda cmd, **kwargs: calls.append(cmd))
+    monkeypatch.setattr(gui_backend.time, "sleep", lambda seconds: None)
+
+    backend = MacOSBackend()
+    backend.batch([("move", 1, 2), ("click", 1, 2), ("type", "abc"), ("key", "tab")])
+    assert calls == [["cliclick", "m:1,2", "c:1,2", "t:abc", "kp:tab"]]
+
+    calls.clear()
+    backend.batch([("click", 1, 2), ("type", "俄乌冲突"), ("key", "return")])
+    assert calls[0] == ["cliclick", "c:1,2"]
+    assert calls[1] == ["pbcopy"]
+    assert calls[2][:2] == ["osascript", "-e"] and "key code 36" in calls[2][2]
+    assert len(calls) == 3
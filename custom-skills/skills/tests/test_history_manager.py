@@ -0,0 +1,37 @@
+from history_manager import HistoryManager, compact_step, estimate_tokens
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("天气预报") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_compact_step_drops_coordinates_and_truncates():
+    assert compact_step("点击了 搜索按钮 (640, 400)") == "点击了 搜索按钮"
+    assert len(compact_step("x" * 100)) == 24
+
+
+def test_recent_steps_are_kept_verbatim():
+    history = HistoryManager(keep_recent=3, token_budget=400)
+    for i in range(3):
+        history.append(f"步骤{i} (1, 2)")
+    assert history.render() == "1. 步骤0 (1, 2)\n2. 步骤1 (1, 2)\n3. 步骤2 (1, 2)"
+
+
+def test_older_steps_are_summarized():
+    history = HistoryManager(keep_recent=2, token_budget=400)
+    for i in range(5):
+        history.append(f"点击了 第{i}个 (10, 20)")
+    lines = history.render().split("\n")
+    assert lines[0] == "第 1-3 步摘要：点击了 第0个；点击了 第1个；点击了 第2个"
+    assert lines[1:] == ["4. 点击了 第3个 (10, 20)", "5. 点击了 第4个 (10, 20)"]
+
+
+def test_summary_drops_oldest_steps_to_fit_budget():
+    history = HistoryManager(keep_recent=1, token_budget=40)
+    for i in range(20):
+        history.append(f"输入了 很长的一段搜索关键词第{i}条")
+    summary, recent = history.render().split("\n")
+    assert "已省略" in summary
+    assert estimate_tokens(summary) <= 40 - estimate_tokens(recent)
+    assert recent == "20. 输入了 很长的一段搜索关键词第19条"
@@ -0,0 +1,111 @@
+import json
+import random
+
+import pytest
+from PIL import Image
+
+from location_cache import LocationCache, dhash, hamming, normalize_description
+
+
+@pytest.fixture
+def noisy_frame() -> Image.Image:
+    rng = random.Random(7)
+    image = Image.new("L", (640, 400))
+    image.putdata([rng.randrange(256) for _ in range(640 * 400)])
+    return image.convert("RGB")
+
+
+def test_normalize_description():
+    assert normalize_description(" 写着“百度一下”的 按钮 ") == "写着'百度一下'的按钮"
+
+
+def test_dhash_is_stable_and_sensitive():
+    # 左右方向的渐变：dHash 比较的是水平相邻像素
+    a = Image.linear_gradient("L").transpose(Image.ROTATE_90).convert("RGB")
+    b = a.transpose(Image.FLIP_LEFT_RIGHT)
+    assert hamming(dhash(a), dhash(a.copy())) == 0
+    assert hamming(dhash(a), dhash(b)) > 6
+
+
+def test_store_then_lookup(noisy_frame):
+    cache = LocationCache(path="")
+    cache.store(noisy_frame, "搜索框", 0.25, 0.5)
+    assert cache.lookup(noisy_frame, " 搜索框 ") == (0.25, 0.5)
+    assert cache.lookup(noisy_frame, "别的按钮") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_pixel_check_rejects_changed_target(noisy_frame):
+    cache = LocationCache(path="")
+    cache.store(noisy_frame, "搜索框", 0.25, 0.5)
+    changed = noisy_frame.copy()
+    # 只改目标点附近的一小块：画面指纹仍然匹配，像素校验不通过
+    changed.paste((255, 255, 255), (150, 190, 170, 210))
+    assert cache.lookup(changed, "搜索框") is None
+    assert cache.rejected == 1
+
+
+def test_corrupt_entries_are_dropped_on_load(noisy_frame, tmp_path):
+    path = tmp_path / "cache.json"
+    cache = LocationCache(path=str(path))
+    cache.store(noisy_frame, "搜索框", 0.25, 0.5)
+    (key, entry), = cache.entries.items()
+    bad = [
+        [key + "x", {**entry, "patch": "not hex"}],
+        [key + "y", {**entry, "patch": entry["patch"][:-2]}],
+        [key + "z", {**entry, "nx": "0.5"}],
+        [key + "w", {**entry, "ny": 1.5}],
+        [key + "v", {k: v for k, v in entry.items() if k != "hash"}],
+        ["only one item"],
+    ]
+    path.write_text(json.dumps({"entries": [[key, entry]] + bad}))
+
+    reloaded = LocationCache(path=str(path))
+    assert list(reloaded.entries) == [key]
+    assert reloaded.lookup(noisy_frame, "搜索框") == (0.25, 0.5)
+
+    path.write_text(json.dumps(["not", "a", "cache"]))
+    assert not LocationCache(path=str(path)).entries
+
+
+def test_seed_skips_corrupt_entries(noisy_frame):
+    source = LocationCache(path="")
+    source.store(noisy_frame, "搜索框", 0.25, 0.5)
+    (key, entry), = source.entries.items()
+    cache = LocationCache(path="")
+    cache.seed([(key, entry), ("bad", {**entry, "patch": 3})])
+    assert list(cache.entries) == [key]
+
+
+def test_invalidate_removes_matching_entries(noisy_frame):
+    cache = LocationCache(path="")
+    cache.store(noisy_frame, "搜索框", 0.25, 0.5)
+    cache.store(noisy_frame, "按钮", 0.5, 0.5)
+    cache.invalidate(noisy_frame, "搜索框")
+    assert cache.lookup(noisy_frame, "搜索框") is None
+    assert cache.lookup(noisy_frame, "按钮") == (0.5, 0.5)
+
+
+def test_lru_capacity_and_persistence(noisy_frame, tmp_path):
+    path = tmp_path / "cache.json"
+    cache = LocationCache(path=str(path), capacity=2)
+    for name in ("a", "b", "c"):
+        cache.store(noisy_frame, name, 0.5, 0.5)
+    assert [e["desc"] for e in cache.entries.values()] == ["b", "c"]
+    assert len(json.loads(path.read_text())["entries"]) == 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+    reloaded = LocationCache(path=str(path), capacity=2)
+    assert reloaded.lookup(noisy_frame, "c") == (0.5, 0.5)
+
+
+def test_processes_sharing_a_file_merge_updates(noisy_frame, tmp_path):
+    """并发会话共用一个文件：各自写入的条目都保留，删除的条目不会被别人的旧副本加回来"""
+    path = str(tmp_path / "cache.json")
+    first, second = LocationCache(path=path), LocationCache(path=path)
+    first.store(noisy_frame, "搜索框", 0.25, 0.5)
+    second.store(noisy_frame, "按钮", 0.5, 0.5)
+    assert {e["desc"] for e in LocationCache(path=path).entries.values()} == {"搜索框", "按钮"}
+
+    second.invalidate(noisy_frame, "搜索框")
+    assert {e["desc"] for e in LocationCache(path=path).entries.values()} == {"按钮"}
@@ -0,0 +1,111 @@
+import random
+
+from PIL import Image
+
+from location_cache import LocationCache
+from macro_cache import (
+    MacroRecorder,
+    MacroStore,
+    abstract_actions,
+    fill_actions,
+    goal_template,
+)
+
+
+def noisy_frame() -> Image.Image:
+    rng = random.Random(3)
+    image = Image.new("L", (320, 200))
+    image.putdata([rng.randrange(256) for _ in range(320 * 200)])
+    return image.convert("RGB")
+
+
+def test_goal_template_extracts_slots():
+    assert goal_template("搜索'天气'第2页") == ("搜索'{0}'第{1}页", ["天气", "2"])
+    assert goal_template("打开“百度”") == ("打开'{0}'", ["百度"])
+
+
+def test_abstract_and_fill_round_trip():
+    slots = ["天气", "12"]
+    actions = [{"action": "TYPE", "parameters": {"text": "天气", "page": "12", "n": 12}}]
+    abstracted = abstract_actions(actions, slots)
+    assert abstracted[0]["parameters"]["text"] == "⟦0⟧"
+    assert abstracted[0]["parameters"]["page"] == "⟦1⟧"
+    assert abstracted[0]["parameters"]["n"] == 12
+    filled = fill_actions(abstracted, ["新闻", "3"])
+    assert filled[0]["parameters"] == {"text": "新闻", "page": "3", "n": 12}
+
+
+def test_player_matches_steps_in_order():
+    store = MacroStore(path="")
+    recorder = MacroRecorder("搜索'天气'")
+    recorder.add_step(0b1111, [{"action": "TYPE", "parameters": {"text": "天气"}}])
+    recorder.add_step(0xFF00, [{"action": "KEY_PRESS", "parameters": {"key": "enter"}}])
+    store.save(recorder, [])
+
+    player = store.player("搜索'新闻'")
+    assert player.match(0b1110)[0]["parameters"]["text"] == "新闻"
+    assert player.match(0) is None
+    assert player.match(0xFF00)[0]["action"] == "KEY_PRESS"
+    assert store.player("打开'新闻'") is None
+
+
+def test_anchor_slots_only_touch_description():
+    """数字槽位不能改写定位缓存键里的 dHash 和十六进制像素块"""
+    frame = noisy_frame()
+    cache = LocationCache(path="")
+    cache.store(frame, "第2页按钮", 0.5, 0.5)
+    (key, entry), = cache.touched_entries()
+
+    store = MacroStore(path="")
+    recorder = MacroRecorder("搜索'天气'第2页")
+    recorder.add_step(1, [{"action": "CLICK", "target_description": "第2页按钮"}])
+    store.save(recorder, cache.touched_entries())
+
+    (new_key, new_entry), = store.anchors("搜索'新闻'第10页")
+    assert new_key == key.split("|")[0] + "|第10页按钮"
+    assert new_entry["desc"] == "第10页按钮"
+    assert new_entry["patch"] == entry["patch"]
+    assert new_entry["hash"] == entry["hash"]
+
+    seeded = LocationCache(path="")
+    seeded.seed(store.anchors("搜索'新闻'第10页"))
+    assert seeded.lookup(frame, "第10页按钮") == (0.5, 0.5)
+
+
+def test_store_persists_and_evicts(tmp_path):
+    path = tmp_path / "macros.json"
+    store = MacroStore(path=str(path), capacity=1)
+    for goal in ("搜索'a'", "打开'b'"):
+        recorder = MacroRecorder(goal)
+        recorder.add_step(1, [{"action": "SCROLL", "parameters": {}}])
+        store.save(recorder, [])
+    assert list(store.macros) == ["打开'{0}'"]
+    assert not list(tmp_path.glob("*.tmp"))
+    assert list(MacroStore(path=str(path)).macros) == ["打开'{0}'"]
+
+
+def test_terminal_actions_are_never_replayed():
+    """FINISH / FAIL 不进宏；旧文件里带着的也跳过，任务是否完成交给大脑"""
+    store = MacroStore(path="")
+    recorder = MacroRecorder("搜索'天气'")
+    recorder.add_step(0xF0, [{"action": "TYPE", "parameters": {"text": "天气"}}])
+    recorder.add_step(0x0F, [{"action": "FINISH", "parameters": {}}])
+    assert len(recorder.steps) == 1
+    store.save(recorder, [])
+    store.macros["搜索'{0}'"]["steps"].append(
+        {"hash": 0x0F, "actions": [{"action": "FINISH", "parameters": {}}]}
+    )
+
+    player = store.player("搜索'新闻'")
+    assert player.match(0x0F) is None
+    assert player.match(0xF0)[0]["action"] == "TYPE"
+
+
+def test_processes_sharing_a_file_merge_macros(tmp_path):
+    path = str(tmp_path / "macros.json")
+    first, second = MacroStore(path=path), MacroStore(path=path)
+    for store, goal in ((first, "搜索'天气'"), (second, "打开'百度'")):
+        recorder = MacroRecorder(goal)
+        recorder.add_step(0xF0, [{"action": "CLICK", "target_description": "按钮"}])
+        store.save(recorder, [])
+    assert set(MacroStore(path=path).macros) == {"搜索'{0}'", "打开'{0}'"}
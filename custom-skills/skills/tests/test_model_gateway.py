@@ -0,0 +1,95 @@
+import time
+import types
+
+import pytest
+
+import model_gateway
+from model_gateway import ModelGateway, RateLimiter, backoff_delay, model_timeout
+from trajectory import start_replay_server
+
+
+def test_backoff_is_bounded(monkeypatch):
+    monkeypatch.setattr(model_gateway.random, "uniform", lambda low, high: high)
+    assert backoff_delay(1) == model_gateway.GATEWAY_BACKOFF_BASE
+    assert backoff_delay(2) == model_gateway.GATEWAY_BACKOFF_BASE * 2
+    assert backoff_delay(30) == model_gateway.GATEWAY_BACKOFF_MAX
+
+
+def test_model_timeout_env_override(monkeypatch):
+    assert model_timeout("gui-plus") == 30.0
+    monkeypatch.setenv("GATEWAY_TIMEOUT_GUI_PLUS", "12")
+    assert model_timeout("gui-plus") == 12.0
+    assert model_timeout("unknown") == model_gateway.GATEWAY_TIMEOUT
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(per_minute=600, max_concurrent=1)
+    start = time.monotonic()
+    for _ in range(3):
+        with limiter:
+            pass
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(model_gateway, "GATEWAY_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(model_gateway, "GATEWAY_HEDGE_MIN_DELAY", 0.05)
+    monkeypatch.setattr(model_gateway, "GATEWAY_HEDGE_PERCENTILE", 90)
+
+    def make(budget, base_url="http://127.0.0.1:9/v1"):
+        monkeypatch.setattr(model_gateway, "GATEWAY_HEDGE_BUDGET", budget)
+        gateway = ModelGateway(api_key="test", base_url=base_url)
+        gateway.hedge = True
+        return gateway
+
+    return make
+
+
+def test_hedge_waits_for_samples_and_respects_budget(hedging):
+    gateway = hedging(budget=0.25)
+    assert gateway._hedge_delay("qwen3-max") is None
+
+    gateway._first_chunk["qwen3-max"] = model_gateway.deque([0.1] * 9 + [0.3])
+    delays = []
+    for _ in range(8):
+        delay = gateway._hedge_delay("qwen3-max")
+        delays.append(delay)
+        if delay is not None:
+            gateway.hedge_stats["qwen3-max"]["hedged"] += 1
+    # 样本不足的那次调用也计入调用数；对冲数始终不超过调用数的 25%，等待时间取首包耗时的 p90
+    assert [d is not None for d in delays] == [False, False, True, False, False, False, True, False]
+    assert delays[2] == pytest.approx(0.1)
+    stats = gateway.hedge_stats["qwen3-max"]
+    assert stats["hedged"] <= 0.25 * stats["calls"]
+    gateway.close()
+
+
+def test_hedge_disabled_never_delays(hedging):
+    gateway = hedging(budget=1.0)
+    gateway.hedge = False
+    gateway._first_chunk["qwen3-max"] = model_gateway.deque([0.1] * 10)
+    assert gateway._hedge_delay("qwen3-max") is None
+    gateway.close()
+
+
+def test_slow_stream_is_hedged(hedging):
+    calls = [
+        {"model": "qwen3-max", "request": "", "response": "慢", "latency": 2.0, "first_token": 2.0,
+         "prompt_tokens": 1, "completion_tokens": 1},
+        {"model": "qwen3-max", "request": "", "response": "快", "latency": 0.01, "first_token": 0.0,
+         "prompt_tokens": 1, "completion_tokens": 1},
+    ]
+    server, _ = start_replay_server(types.SimpleNamespace(calls=calls))
+    gateway = hedging(budget=1.0, base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+    # 对冲等待 0.3 秒：原请求一定先到达替身服务、拿到慢的那条录制
+    gateway._first_chunk["qwen3-max"] = model_gateway.deque([0.3] * 10)
+
+    start = time.monotonic()
+    assert gateway.chat_stream("qwen3-max", [{"role": "user", "content": "hi"}]) == "快"
+    assert time.monotonic() - start < 1.5
+    record = gateway.records[-1]
+    assert record.hedged and record.hedge_won
+    assert gateway.hedge_stats["qwen3-max"] == {"calls": 1, "hedged": 1, "won": 1}
+    gateway.close()
+    server.shutdown()
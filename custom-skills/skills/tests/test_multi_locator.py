@@ -0,0 +1,39 @@
+from multi_locator import batch_instruction, batch_messages, coerce_coordinate, parse_batch_result
+
+
+def test_instruction_numbers_targets():
+    assert batch_instruction(["搜索框", "按钮"]).endswith("1. 搜索框\n2. 按钮")
+    content = batch_messages("data:image/png;base64,x", ["a"])[1]["content"]
+    assert content[0]["image_url"]["url"] == "data:image/png;base64,x"
+
+
+def test_coerce_coordinate():
+    assert coerce_coordinate("12.7") == 12
+    assert coerce_coordinate([30, 40]) == 30
+    assert coerce_coordinate([]) is None
+    assert coerce_coordinate("left") is None
+
+
+def test_parse_by_index_with_missing_and_invalid_targets():
+    result = {
+        "targets": [
+            {"index": 3, "found": True, "x": 5, "y": 6},
+            {"index": 1, "found": True, "x": 1, "y": 2},
+            {"index": 2, "found": True, "x": "?", "y": 2},
+            {"index": 9, "found": True, "x": 1, "y": 1},
+        ]
+    }
+    assert parse_batch_result(result, 4) == [
+        {"found": True, "image_x": 1, "image_y": 2},
+        {"found": False},
+        {"found": True, "image_x": 5, "image_y": 6},
+        {"found": False},
+    ]
+
+
+def test_parse_without_index_uses_position_and_keeps_first_hit():
+    text = '```json\n{"targets": [{"found": true, "x": 1, "y": 1}, {"index": 1, "found": true, "x": 9, "y": 9}]}\n```'
+    assert parse_batch_result(text, 2) == [
+        {"found": True, "image_x": 1, "image_y": 1},
+        {"found": False},
+    ]
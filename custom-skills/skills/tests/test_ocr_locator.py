@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image
+
+from ocr_locator import OcrLocator, TextBox, extract_quoted, partial_ratio
+
+
+class FixedEngine:
+    """按固定结果“识别”，并记录识别次数"""
+
+    def __init__(self, boxes: list[TextBox]) -> None:
+        self.boxes = boxes
+        self.calls = 0
+
+    def recognize(self, image: Image.Image) -> list[TextBox]:
+        self.calls += 1
+        return self.boxes
+
+
+def make_locator(boxes: list[TextBox]) -> OcrLocator:
+    locator = OcrLocator()
+    locator._engine = FixedEngine(boxes)
+    return locator
+
+
+@pytest.fixture
+def frame() -> Image.Image:
+    return Image.new("RGB", (800, 600), "white")
+
+
+def test_extract_quoted():
+    assert extract_quoted("写着'百度 一下'的蓝色按钮") == ["百度一下"]
+    assert extract_quoted("标题包含“拉夫罗夫”或《新闻》的链接") == ["拉夫罗夫", "新闻"]
+    assert extract_quoted("页面中央的搜索框") == []
+
+
+def test_partial_ratio():
+    assert partial_ratio("拉夫罗夫", "拉夫罗夫就俄乌冲突发表讲话") == (1.0, 0)
+    assert partial_ratio("俄乌冲突", "拉夫罗夫就俄乌冲突发表讲话") == (1.0, 5)
+    score, start = partial_ratio("饿乌冲突", "拉夫罗夫就俄乌冲突发表讲话")
+    assert score == pytest.approx(0.75) and start == 5
+    assert partial_ratio("", "text") == (0.0, 0)
+
+
+def test_locate_partial_line_uses_character_position(frame):
+    locator = make_locator([TextBox("拉夫罗夫就俄乌冲突发表讲话", (100, 200, 230, 220), 0.9)])
+    match = locator.locate(frame, "标题包含'拉夫罗夫'的新闻链接")
+    # 前 4 个字符的中心：100 + 130 * 2 / 13
+    assert (match.x, match.y) == (pytest.approx(120), 210)
+    assert locator.hits == 1
+
+
+def test_locate_rejects_ambiguous_and_low_confidence(frame):
+    locator = make_locator(
+        [
+            TextBox("俄乌冲突最新进展", (120, 160, 620, 190), 0.9),
+            TextBox("拉夫罗夫就俄乌冲突发表讲话", (120, 260, 620, 290), 0.9),
+            TextBox("天气预报", (120, 360, 620, 390), 0.3),
+        ]
+    )
+    assert locator.locate(frame, "包含'俄乌冲突'的链接") is None
+    assert locator.locate(frame, "写着'天气预报'的链接") is None
+    assert locator.locate(frame, "页面中央的搜索框") is None
+    assert (locator.hits, locator.misses, locator.ambiguous) == (0, 1, 1)
+
+
+def test_same_frame_is_recognized_once(frame):
+    locator = make_locator([TextBox("百度一下", (850, 300, 960, 350), 0.9)])
+    locator.locate(frame, "写着'百度一下'的按钮")
+    locator.locate(frame.copy(), "写着'百度一下'的按钮")
+    assert locator._engine.calls == 1
+    locator.locate(Image.new("RGB", (800, 600), "black"), "写着'百度一下'的按钮")
+    assert locator._engine.calls == 2
+
+
+def test_missing_engine_disables_locator(frame):
+    locator = OcrLocator(engine="no-such-engine")
+    assert locator.locate(frame, "写着'百度一下'的按钮") is None
+    assert not locator.available
@@ -0,0 +1,80 @@
+import concurrent.futures
+
+import pytest
+
+import pipelined_engine
+from pipelined_engine import SpeculativeLocator
+
+
+class InlinePool:
+    """立即在当前线程执行，记录提交的定位请求"""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append(args[1:])
+        future = concurrent.futures.Future()
+        future.set_result({"found": True, "args": args[1:]})
+        return future
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pipelined_engine, "locate_target", lambda *a: {"found": True, "direct": a[1:]})
+    return InlinePool()
+
+
+def stream(locator, text):
+    for end in range(1, len(text) + 1):
+        locator.on_partial(text[:end])
+
+
+def test_click_waits_for_parameters(pool):
+    spec = SpeculativeLocator(pool, screen=None)
+    text = '{"action": "CLICK", "target_description": "登录", "parameters": {}}'
+    spec.on_partial(text[: text.index('"parameters"')])
+    assert pool.calls == []
+    stream(spec, text)
+    assert pool.calls == [("登录", None)]
+    assert spec.locator(None, "注册")["direct"] == ("注册", None)
+
+
+def test_click_waits_for_area_and_passes_it(pool):
+    spec = SpeculativeLocator(pool, screen=None)
+    stream(
+        spec,
+        '{"action": "CLICK", "target_description": "登录", "target_area": "top-right", "parameters": {}}',
+    )
+    assert pool.calls == [("登录", "top-right")]
+    assert spec.locator(None, "登录", "top-right")["args"] == ("登录", "top-right")
+    assert spec.locator(None, "登录", "bottom")["direct"] == ("登录", "bottom")
+
+
+def test_click_without_area(pool):
+    spec = SpeculativeLocator(pool, screen=None)
+    stream(spec, '{"action": "CLICK", "target_description": "登录", "parameters": {}}')
+    assert pool.calls == [("登录", None)]
+    assert "args" in spec.locator(None, "登录")
+
+
+def test_type_only_speculates_with_click_first(pool):
+    spec = SpeculativeLocator(pool, screen=None)
+    stream(
+        spec,
+        '{"action": "TYPE", "target_description": "搜索框", "parameters": {"text": "天气", "click_first": false}}',
+    )
+    assert pool.calls == []
+
+    spec = SpeculativeLocator(pool, screen=None)
+    stream(
+        spec,
+        '{"action": "TYPE", "target_description": "搜索框", "parameters": {"text": "天气", "click_first": true}}',
+    )
+    assert pool.calls == [("搜索框", None)]
+
+
+def test_other_actions_never_speculate(pool):
+    spec = SpeculativeLocator(pool, screen=None)
+    stream(spec, '{"action": "SCROLL", "target_description": "列表", "parameters": {"direction": "down"}}')
+    assert pool.calls == []
@@ -0,0 +1,82 @@
+from PIL import Image
+
+from screen_encoding import EncodeOptions, Frame, encode_frame
+
+
+def gradient(size):
+    return Image.linear_gradient("L").resize(size).convert("RGB")
+
+
+def test_retina_full_screen_maps_pixels_to_points():
+    # 2880x1800 像素的 Retina 全屏截图，屏幕是 1440x900 point
+    frame = Frame(gradient((2880, 1800)), None, screen_size=(1440, 900))
+    screen = encode_frame(frame, EncodeOptions(max_long_edge=1600, image_format="jpeg"))
+    assert (screen.width, screen.height) == (1600, 1000)
+    assert screen.to_screen(0, 0) == (0, 0)
+    assert screen.to_screen(800, 500) == (720, 450)
+    assert screen.to_screen(1600, 1000) == (1440, 900)
+
+
+def test_full_screen_without_point_size_uses_pixels():
+    frame = Frame(gradient((1280, 800)))
+    screen = encode_frame(frame, EncodeOptions(max_long_edge=640, image_format="png"))
+    assert screen.to_screen(320, 200) == (640, 400)
+
+
+def test_window_capture_maps_into_window_bounds():
+    # 窗口 (100, 50)-(1100, 550)，Retina 下截到 2000x1000 像素
+    frame = Frame(gradient((2000, 1000)), bounds=(100, 50, 1100, 550))
+    screen = encode_frame(frame, EncodeOptions(max_long_edge=1000, image_format="webp"))
+    assert (screen.width, screen.height) == (1000, 500)
+    assert screen.to_screen(0, 0) == (100, 50)
+    assert screen.to_screen(500, 250) == (600, 300)
+    assert screen.data_url.startswith("data:image/webp;base64,")
+
+
+def test_no_upscaling_and_payload_accounting():
+    frame = Frame(gradient((400, 300)))
+    screen = encode_frame(frame, EncodeOptions(max_long_edge=1600, image_format="jpeg", quality=50))
+    assert (screen.width, screen.height) == (400, 300)
+    assert screen.raw_bytes == 400 * 300 * 3
+    assert screen.payload_bytes == len(screen.data_url)
+
+
+def test_crop_maps_back_to_screen():
+    from screen_encoding import crop_image
+
+    frame = Frame(gradient((2000, 1000)), bounds=(100, 50, 1100, 550))
+    screen = encode_frame(frame, EncodeOptions(max_long_edge=1000, image_format="png"))
+    crop = crop_image(screen, (200, 100, 400, 300), EncodeOptions(max_long_edge=0, image_format="png"))
+    # 裁剪图保留原始分辨率：200x200 的图片区域对应 400x400 像素
+    assert (crop.width, crop.height) == (400, 400)
+    assert crop.to_screen(0, 0) == screen.to_screen(200, 100)
+    assert crop.to_screen(400, 400) == screen.to_screen(400, 300)
+    assert crop.region == (200, 100, 400, 300)
+
+
+def test_region_around_stays_inside_frame():
+    from screen_encoding import region_around
+
+    screen = encode_frame(Frame(gradient((1000, 500))), EncodeOptions(max_long_edge=0))
+    assert region_around(screen, 500, 250, 0.4) == (300, 150, 700, 350)
+    assert region_around(screen, 10, 490, 0.4) == (0, 300, 400, 500)
+
+
+def test_area_region():
+    from screen_encoding import area_region
+
+    screen = encode_frame(Frame(gradient((1000, 500))), EncodeOptions(max_long_edge=0))
+    assert area_region(screen, "top-right") == (500, 0, 1000, 250)
+    assert area_region(screen, "Middle Center") == (250, 125, 750, 375)
+    assert area_region(screen, "bottom") == (0, 250, 1000, 500)
+    assert area_region(screen, "somewhere") is None
+
+
+def test_frame_memoizes_derived_forms():
+    frame = Frame(gradient((640, 400)))
+    options = EncodeOptions(max_long_edge=320, image_format="jpeg")
+    assert frame.encoded(options) is frame.encoded(EncodeOptions(max_long_edge=320, image_format="JPEG"))
+    assert frame.encoded(options) is not frame.encoded(EncodeOptions(max_long_edge=160))
+    assert frame.thumbnail is frame.thumbnail
+    assert frame.digest == Frame(frame.image.copy()).digest
+    assert frame.digest != Frame(gradient((640, 401))).digest
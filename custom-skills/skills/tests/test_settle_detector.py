@@ -0,0 +1,80 @@
+import pytest
+from PIL import Image
+
+import gui_backend
+import settle_detector
+from gui_backend import SimulatedDesktop, set_backend
+from settle_detector import SettleDetector, frame_diff, make_thumbnail
+
+
+class CountingDesktop(SimulatedDesktop):
+    def __init__(self, cheap: bool):
+        super().__init__(size=(320, 200))
+        self.cheap_grab = cheap
+        self.grabs = 0
+
+    def grab(self, bounds=None):
+        self.grabs += 1
+        return super().grab(bounds)
+
+
+@pytest.fixture
+def backend(request, monkeypatch):
+    previous = gui_backend._backend
+    desktop = CountingDesktop(cheap=request.param)
+    set_backend(desktop)
+    monkeypatch.setattr(settle_detector.time, "sleep", lambda s: None)
+    yield desktop
+    set_backend(previous)
+
+
+def test_frame_diff():
+    black = make_thumbnail(Image.new("RGB", (640, 400), "black"))
+    white = make_thumbnail(Image.new("RGB", (640, 400), "white"))
+    assert frame_diff(black, black) == 0
+    assert frame_diff(black, white) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("backend", [True], indirect=True)
+def test_polls_until_stable(backend):
+    detector = SettleDetector(max_wait=1.0, stable_frames=2)
+    detector.wait("CLICK")
+    assert backend.grabs == 3
+    assert detector.last_frame is not None and detector.last_image is not None
+
+
+@pytest.mark.parametrize("backend", [True], indirect=True)
+def test_unchanged_reference_waits_for_change_timeout(backend, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(settle_detector.time, "monotonic", lambda: next(clock) * 0.1)
+    reference = make_thumbnail(backend.render())
+    detector = SettleDetector(max_wait=5.0, change_timeout=0.5, stable_frames=2)
+    detector.wait("CLICK", reference=reference)
+    # 画面一直没有变化：先等到 change_timeout，再确认两帧稳定
+    assert backend.grabs == 1 + 4 + 2
+
+
+@pytest.mark.parametrize("backend", [False], indirect=True)
+def test_expensive_grab_uses_fixed_wait(backend):
+    detector = SettleDetector()
+    detector.wait("CLICK")
+    assert backend.grabs == 1
+    assert detector.last_frame is not None
+
+    detector.wait("ACTIVATE")
+    assert backend.grabs == 1
+    assert detector.last_frame is None
+    assert set(detector.waits) == {"CLICK", "ACTIVATE"}
+
+
+@pytest.mark.parametrize("backend", [True], indirect=True)
+def test_last_frame_is_refreshed_when_capture_fails(backend, monkeypatch):
+    failures = [None]
+    grab = backend.grab
+    monkeypatch.setattr(backend, "grab", lambda bounds=None: failures.pop() if failures else grab(bounds))
+    detector = SettleDetector(max_wait=0.0)
+    detector.last_frame = make_thumbnail(Image.new("RGB", (320, 200), "black"))
+    detector.wait("CLICK")
+    # 第一次截图失败：固定等待后再截一次，不沿用上一次等待的帧
+    assert backend.grabs == 1
+    assert frame_diff(detector.last_frame, make_thumbnail(backend.render())) == 0
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from step_tracer import StepTracer, percentile
+
+
+@pytest.mark.parametrize(
+    "values, pct, expected",
+    [
+        (range(1, 11), 50, 5),
+        (range(1, 11), 95, 10),
+        (range(1, 21), 95, 19),
+        (range(1, 21), 50, 10),
+        (range(1, 101), 95, 95),
+        ([3.0], 50, 3.0),
+        ([5, 1, 4, 2, 3], 0, 1),
+        ([5, 1, 4, 2, 3], 100, 5),
+    ],
+)
+def test_percentile_nearest_rank(values, pct, expected):
+    assert percentile(list(values), pct) == expected
+
+
+def test_spans_nest_and_are_written(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = StepTracer(str(path))
+    tracer.begin_step(1)
+    with tracer.span("brain", action="CLICK"):
+        with tracer.span("locator"):
+            tracer.annotate(prompt_tokens=10)
+        tracer.annotate(completion_tokens=3)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["stage"] for r in records] == ["locator", "brain"]
+    assert records[0]["prompt_tokens"] == 10
+    assert records[1]["completion_tokens"] == 3
+    assert all(r["step"] == 1 and r["duration"] >= 0 for r in records)
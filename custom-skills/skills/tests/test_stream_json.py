@@ -0,0 +1,72 @@
+import pytest
+
+from stream_json import IncrementalJSONParser, MalformedOutput, stream_json_object
+
+
+def feed_in_chunks(parser: IncrementalJSONParser, text: str, size: int = 3) -> None:
+    for end in range(size, len(text) + size, size):
+        parser.update(text[:end])
+
+
+def test_fields_complete_one_by_one():
+    parser = IncrementalJSONParser()
+    parser.update('{"action": "CLICK", "parameters": {"x"')
+    assert parser.fields == {"action": "CLICK"}
+    parser.update('{"action": "CLICK", "parameters": {"x": 1}, "thought": "hi"}')
+    assert parser.done
+    assert parser.fields == {"action": "CLICK", "parameters": {"x": 1}, "thought": "hi"}
+
+
+def test_code_fence_prefix_and_nested_strings():
+    text = '```json\n{"a": "x}\\"y", "b": [1, {"c": "]"}], "n": -1.5, "t": true}\n```'
+    parser = IncrementalJSONParser()
+    feed_in_chunks(parser, text)
+    assert parser.result() == {"a": 'x}"y', "b": [1, {"c": "]"}], "n": -1.5, "t": True}
+
+
+def test_long_prefix_is_malformed():
+    parser = IncrementalJSONParser(max_prefix=8)
+    with pytest.raises(MalformedOutput):
+        parser.update("Sure, here is the JSON you asked for: {")
+
+
+def test_bad_structure_is_malformed():
+    with pytest.raises(MalformedOutput):
+        IncrementalJSONParser().update('{"a" 1}')
+
+
+def test_restarted_stream_resets_state():
+    """网关重试时累积文本从头开始，解析也要从头开始"""
+    parser = IncrementalJSONParser()
+    parser.update('{"action": "CLICK", "param')
+    parser.update('{"act')
+    parser.update('{"action": "TYPE", "parameters": {}}')
+    assert parser.done
+    assert parser.fields == {"action": "TYPE", "parameters": {}}
+
+
+def test_stream_json_object_stops_when_ready():
+    full = '{"action": "SCROLL", "parameters": {"direction": "down"}, "thought": "long..."}'
+    delivered = []
+
+    def stream(on_text, **kwargs):
+        for end in range(1, len(full) + 1):
+            delivered.append(end)
+            if on_text(full[:end]):
+                return full[:end]
+        return full
+
+    result = stream_json_object(stream, lambda f: "parameters" in f)
+    assert result == {"action": "SCROLL", "parameters": {"direction": "down"}}
+    assert delivered[-1] < len(full)
+
+
+def test_stream_json_object_retries_malformed_output():
+    replies = iter(["I cannot help with that" * 10, '{"found": false}'])
+
+    def stream(on_text, **kwargs):
+        text = next(replies)
+        on_text(text)
+        return text
+
+    assert stream_json_object(stream, lambda f: False, retries=1) == {"found": False}
@@ -0,0 +1,60 @@
+import types
+
+import pytest
+
+from model_gateway import ModelGateway
+from trajectory import ReplayState, TrajectoryRecorder, start_replay_server
+
+RESPONSE = '{"action": "CLICK", "target_description": "登录", "parameters": {}, "thought": "' + "很长的思考" * 40 + '"}'
+
+
+@pytest.fixture
+def server():
+    calls = [
+        {
+            "model": "qwen3-max",
+            "request": "",
+            "response": RESPONSE,
+            "latency": 0.3,
+            "first_token": 0.05,
+            "prompt_tokens": 10,
+            "completion_tokens": 50,
+        }
+    ]
+    server, state = start_replay_server(types.SimpleNamespace(calls=calls))
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", state
+    server.shutdown()
+
+
+def test_early_stop_still_records_full_response(server):
+    base_url, _ = server
+    gateway = ModelGateway(api_key="test", base_url=base_url)
+    recorder = TrajectoryRecorder("unused.zip")
+    recorder.attach(gateway)
+
+    text = gateway.chat_stream(
+        "qwen3-max", [{"role": "user", "content": "hi"}], on_text=lambda t: '"parameters"' in t
+    )
+    assert len(text) < len(RESPONSE)
+
+    gateway.wait_observers(timeout=5)
+    (call,) = recorder.calls
+    assert call["response"] == RESPONSE
+    assert call["latency"] >= 0.3 * 0.9
+    assert call["completion_tokens"] == 50
+    # 调用方自己的记录仍是提前结束时的耗时
+    assert gateway.records[-1].latency < call["latency"]
+    gateway.close()
+
+
+def test_replay_prefers_identical_request_text():
+    trajectory = types.SimpleNamespace(
+        calls=[
+            {"model": "gui-plus", "request": "a", "response": "1"},
+            {"model": "gui-plus", "request": "b", "response": "2"},
+        ]
+    )
+    state = ReplayState(trajectory)
+    assert state.take("gui-plus", "b")["response"] == "2"
+    assert state.take("gui-plus", "zzz")["response"] == "1"
+    assert state.take("gui-plus", "a") is None
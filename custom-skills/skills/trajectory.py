@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+trajectory.py - GUI 代理轨迹的录制与回放
+
+录制：smart_execute 每一步的画面、大脑提示词与回复、定位回复、执行的动作和耗时，
+打包成一个 zip 轨迹包。提前结束读取的流式调用也录制完整回复和端到端耗时（网关在后台读完），
+回放时替身服务按真实模型的输出速度返回，不同配置的耗时可以直接对比：
+- meta.json      任务目标、录制时间
+- steps.jsonl    每一步的决策、执行结果与耗时
+- calls.jsonl    每一次模型调用（请求文本、回复文本、耗时、token）
+- frames/NNN.jpg 每一步发给模型的画面
+
+回放：在本地启动一个 OpenAI 兼容的替身服务，按录制顺序（优先匹配相同请求文本）返回
+录制的回复，并按原始或缩放后的耗时延迟；画面由 ReplayBackend 按步骤提供录制帧。
+这样就能离线、可复现地对比编码 / 缓存 / 流水线等改动。
+回放时关闭轨迹宏、分层路由、请求对冲，以及定位缓存（不读写持久化文件）和本地 OCR，
+定位都交给录制的 GUI-plus 回复，同一轨迹每次回放走同样的路径。
+
+环境变量：
+- TRAJECTORY_RECORD: 设置后 smart_execute 把轨迹录制到该 zip 文件
+
+使用方法:
+  python3 trajectory.py replay 轨迹.zip [延迟倍率] [最大步骤]
+  python3 trajectory.py serve 轨迹.zip [端口] [延迟倍率]
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from gui_backend import Bounds, GuiBackend
+
+TRAJECTORY_RECORD = os.getenv("TRAJECTORY_RECORD", "")
+
+BRAIN_MODEL = "qwen3-max"
+
+
+def request_text(messages: list[dict]) -> str:
+    """提取请求中的文本部分（图片只记数量）"""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(f"[{message.get('role')}] {content}")
+            continue
+        for item in content or []:
+            if item.get("type") == "text":
+                parts.append(f"[{message.get('role')}] {item['text']}")
+            else:
+                parts.append(f"[{message.get('role')}] <{item.get('type')}>")
+    return "\n".join(parts)
+
+
+class TrajectoryRecorder:
+    """把一次运行录制成 zip 轨迹包"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.meta: dict = {"created": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self.steps: list[dict] = []
+        self.calls: list[dict] = []
+        self.frames: dict[str, bytes] = {}
+        self._step: dict | None = None
+        self._gateway = None
+
+    def attach(self, gateway) -> None:
+        """订阅模型网关的每次调用"""
+        self._gateway = gateway
+        gateway.observers.append(self.on_call)
+
+    def on_call(self, record, messages: list[dict], text: str) -> None:
+        # 提前结束读取的调用在后台读完后才通知，按发起时间记录顺序
+        started = time.time() - record.latency
+        self.calls.append(
+            {
+                "step": self._step["step"] if self._step else None,
+                "started": started,
+                "model": record.model,
+                "request": request_text(messages),
+                "response": text,
+                "latency": record.latency,
+                "first_token": record.first_token,
+                "prompt_tokens": record.prompt_tokens,
+                "completion_tokens": record.completion_tokens,
+            }
+        )
+
+    def begin_step(self, step_num: int, screen) -> None:
+        frame_name = f"frames/{step_num:03d}.jpg"
+        header, _, data = screen.data_url.partition(",")
+        raw = base64.b64decode(data)
+        if "image/jpeg" not in header:
+            # 统一存成 JPEG，保持轨迹包紧凑
+            buf = io.BytesIO()
+            Image.open(io.BytesIO(raw)).convert("RGB").save(buf, format="JPEG", quality=85)
+            raw = buf.getvalue()
+        self.frames[frame_name] = raw
+        self._step = {"step": step_num, "frame": frame_name, "started": time.time()}
+
+    def end_step(self, decision: dict | None, descriptions: list[str], timings: dict) -> None:
+        if self._step is None:
+            return
+        self._step.update(
+            {"decision": decision, "descriptions": descriptions, "timings": timings}
+        )
+        self.steps.append(self._step)
+        self._step = None
+
+    def save(self, goal: str) -> None:
+        if self._gateway is not None:
+            self._gateway.wait_observers(timeout=30)
+        self.calls.sort(key=lambda c: c["started"])
+        for call in self.calls:
+            # 后台通知时可能已进入下一步，按发起时间归到所在的步骤
+            steps = [s["step"] for s in self.steps if s["started"] <= call["started"]]
+            if steps:
+                call["step"] = steps[-1]
+        self.meta["goal"] = goal
+        with zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("meta.json", json.dumps(self.meta, ensure_ascii=False, indent=2))
+            zf.writestr(
+                "steps.jsonl",
+                "\n".join(json.dumps(s, ensure_ascii=False) for s in self.steps),
+            )
+            zf.writestr(
+                "calls.jsonl",
+                "\n".join(json.dumps(c, ensure_ascii=False) for c in self.calls),
+            )
+            for name, data in self.frames.items():
+                zf.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+        print(f"\n💾 轨迹已保存: {self.path}（{len(self.steps)} 步，{len(self.calls)} 次模型调用）")
+
+
+class Trajectory:
+    """读取轨迹包"""
+
+    def __init__(self, path: str) -> None:
+        with zipfile.ZipFile(path) as zf:
+            self.meta = json.loads(zf.read("meta.json"))
+            self.steps = [json.loads(line) for line in zf.read("steps.jsonl").decode().splitlines() if line]
+            self.calls = [json.loads(line) for line in zf.read("calls.jsonl").decode().splitlines() if line]
+            self.frames = [zf.read(step["frame"]) for step in self.steps]
+
+
+class ReplayState:
+    """回放服务的共享状态：剩余的录制回复与已回放的大脑调用数"""
+
+    def __init__(self, trajectory: Trajectory, latency_scale: float = 1.0) -> None:
+        self.latency_scale = latency_scale
+        self.pending: dict[str, deque] = {}
+        for call in trajectory.calls:
+            self.pending.setdefault(call["model"], deque()).append(call)
+        self.brain_served = 0
+        self.lock = threading.Lock()
+
+    def take(self, model: str, text: str) -> dict | None:
+        """优先返回请求文本完全相同的录制，否则按录制顺序返回"""
+        with self.lock:
+            queue = self.pending.get(model)
+            if not queue:
+                return None
+            match = next((c for c in queue if c["request"] == text), queue[0])
+            queue.remove(match)
+            if model == BRAIN_MODEL:
+                self.brain_served += 1
+            return match
+
+
+def make_handler(state: ReplayState) -> type[BaseHTTPRequestHandler]:
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+        def _send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):  # noqa: N802
+            if self.path.endswith("/models"):
+                self._send_json(200, {"object": "list", "data": []})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):  # noqa: N802
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            model = body.get("model", "")
+            call = state.take(model, request_text(body.get("messages", [])))
+            if call is None:
+                self._send_json(404, {"error": {"message": f"轨迹中没有更多 {model} 的回复"}})
+                return
+
+            usage = {
+                "prompt_tokens": call["prompt_tokens"],
+                "completion_tokens": call["completion_tokens"],
+                "total_tokens": call["prompt_tokens"] + call["completion_tokens"],
+            }
+            latency = call["latency"] * state.latency_scale
+
+            if not body.get("stream"):
+                time.sleep(latency)
+                self._send_json(
+                    200,
+                    {
+                        "id": "replay",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": call["response"]},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": usage,
+                    },
+                )
+                return
+
+            # 流式：先等首 token，再把剩余耗时平摊到各个分片上
+            first = call["first_token"] * state.latency_scale if call.get("first_token") else latency
+            first = min(first, latency)
+            text = call["response"]
+            pieces = [text[i : i + 16] for i in range(0, len(text), 16)] or [""]
+            gap = (latency - first) / len(pieces)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            time.sleep(first)
+            try:
+                for piece in pieces:
+                    self._send_event(model, {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+                    time.sleep(gap)
+                self._send_event(model, {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                self._send_event(model, {"choices": [], "usage": usage})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端拿到所需字段后提前断开
+                pass
+
+        def _send_event(self, model: str, chunk: dict) -> None:
+            chunk.update(
+                {"id": "replay", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+            )
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return ReplayHandler
+
+
+def start_replay_server(
+    trajectory: Trajectory, port: int = 0, latency_scale: float = 1.0
+) -> tuple[ThreadingHTTPServer, ReplayState]:
+    """在后台线程启动回放服务，返回 (服务, 共享状态)"""
+    state = ReplayState(trajectory, latency_scale)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+class ReplayBackend(GuiBackend):
+    """回放用的画面后端：第 N 次大脑调用之前，截图返回第 N 步的录制画面"""
+
+    name = "replay"
+
+    def __init__(self, trajectory: Trajectory, state: ReplayState) -> None:
+        super().__init__()
+        self.frames = [Image.open(io.BytesIO(data)).convert("RGB") for data in trajectory.frames]
+        self.state = state
+        self.events: list[dict] = []
+
+    def activate_browser(self) -> None:
+        pass
+
+    def window_bounds(self) -> Bounds | None:
+        return None
+
+    def grab(self, bounds: Bounds | None = None) -> Image.Image | None:
+        if not self.frames:
+            return None
+        index = min(self.state.brain_served, len(self.frames) - 1)
+        img = self.frames[index]
+        return img.crop(bounds) if bounds else img.copy()
+
+    def move(self, x: int, y: int) -> None:
+        self.events.append({"event": "move", "x": x, "y": y})
+
+    def click(self, x: int, y: int) -> None:
+        self.events.append({"event": "click", "x": x, "y": y})
+
+    def type_text(self, text: str) -> None:
+        self.events.append({"event": "type", "text": text})
+
+    def key_press(self, key: str) -> None:
+        self.events.append({"event": "key", "key": key})
+
+    def scroll(self, amount: int) -> None:
+        self.events.append({"event": "scroll", "amount": amount})
+
+    def open_url(self, url: str) -> None:
+        self.events.append({"event": "open_url", "url": url})
+
+
+def replay(path: str, latency_scale: float = 1.0, max_steps: int | None = None) -> None:
+    """离线回放一条轨迹：替身模型服务 + 录制画面，跑一遍当前的 smart_execute"""
+    trajectory = Trajectory(path)
+    server, state = start_replay_server(trajectory, latency_scale=latency_scale)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # 回放时不再录制；网关指向本地替身服务
+    os.environ.pop("TRAJECTORY_RECORD", None)
+    # 轨迹宏会跳过录制的大脑回复，回放时关闭
+    os.environ["MACRO_CACHE"] = "0"
+    # 分层路由会请求录制里没有的小模型、规则层会改变动作序列，回放时关闭
+    os.environ["CASCADE"] = "0"
+    import model_gateway
+    from gui_backend import set_backend
+
+    model_gateway._gateway = model_gateway.ModelGateway(base_url=base_url)
+    # 对冲会多取一条录制的回复，回放时关闭
+    model_gateway._gateway.hedge = False
+    set_backend(ReplayBackend(trajectory, state))
+
+    import allops_smart_v3
+    from location_cache import LocationCache
+
+    # 定位缓存（含持久化文件里别的运行留下的条目）和本地 OCR 会绕过录制的 GUI-plus 回复，
+    # 回放结果取决于机器上的缓存状态，回放时关闭：缓存容量为 0、不读写文件，OCR 不启用
+    allops_smart_v3.location_cache = LocationCache(capacity=0, path="")
+    allops_smart_v3.ocr_locator = None
+
+    print(f"🎞️  回放轨迹: {path}（{len(trajectory.steps)} 步，延迟倍率 {latency_scale}）")
+    start = time.monotonic()
+    allops_smart_v3.smart_execute(
+        trajectory.meta.get("goal", ""), max_steps or len(trajectory.steps) + 1
+    )
+    print(f"\n⏱️  回放总耗时: {time.monotonic() - start:.2f}秒")
+    server.shutdown()
+
+
+def main() -> None:
+    if len(sys.argv) < 3 or sys.argv[1] not in ("replay", "serve"):
+        print("使用方法:")
+        print("  python3 trajectory.py replay 轨迹.zip [延迟倍率] [最大步骤]")
+        print("  python3 trajectory.py serve 轨迹.zip [端口] [延迟倍率]")
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "replay":
+        scale = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+        max_steps = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        replay(path, scale, max_steps)
+        return
+
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+    scale = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    server, _ = start_replay_server(Trajectory(path), port, scale)
+    print(f"🎞️  回放服务已启动: http://127.0.0.1:{port}/v1（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
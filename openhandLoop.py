@@ -9,13 +9,46 @@
 
 工作流程将持续进行，直到重构达到质量阈值。
 
+默认每个 COBOL 文件使用一个独立的重构对话，在线程池中并发执行（数量受 REFACTOR_WORKERS 限制），
+每个对话只写入自己的 Java 目标目录（java/<程序名小写>/），全部完成后再进入评审阶段，
+一次迭代的耗时取决于最大的文件，而不是所有文件之和。设置 PARALLEL_REFACTOR=0 恢复为单个对话依次转换。
+
+评审报告按文件解析得分与问题列表。之后的迭代只重构、重评低于 QUALITY_THRESHOLD 的文件
+（并把该文件的问题直接放进它的重构提示词），已达标的文件冻结，每轮报告节省了多少次转换。
+
+默认以流水线方式运行（PIPELINE=1，需要按文件并发重构）：重构池与评审池（CRITIQUE_WORKERS）同时工作，
+某个文件的 Java 一写完就交给评审，单文件评审报告写入 critiques/<程序名小写>_critique.md，
+得分低于阈值的文件带着它的问题直接回到重构队列（每个文件最多 MAX_ITERATIONS 次尝试），
+不再等待所有文件重构完再统一评审，两类代理都不会空闲地等待对方的阶段结束。
+
+评审代理之前先做本地静态检查（PRECHECK=1，需要按文件并发重构）：每个程序的目标目录里要有 Java 类、
+Java 能解析（需要 pip install javalang；没有安装时只检查括号配对，缺少分号等语法错误发现不了，
+运行开始时会提示）、有 @source 可追溯性标记，
+且 PROCEDURE DIVISION 中被 @source 行号范围覆盖的段落比例不低于 PRECHECK_MIN_COVERAGE。
+结构上不合格的输出直接得到一份自动生成的评审（0 分，写入同样格式的报告），不再花一次评审对话；
+通过检查但仍有未映射段落等问题时，这些问题会并入评审代理给出的问题列表。
+
+转换结果按内容寻址缓存在 CONVERSION_CACHE_DIR（默认 ~/.cache/cobol2java）：
+键为 COBOL 源码、提示词模板版本、模型与驱动这次尝试的评审问题的哈希，保存生成的 Java 和得分。
+重新运行时已达标的转换直接复用，由相同评审问题驱动、且当时已达标的尝试也不会重复转换和评审；
+未达标的尝试只作记录，不会被重放（否则一次失败的运行会让之后每次运行都重放同样的失败）；
+只改动一个程序后重跑 CardDemo 时，只有这个程序需要重新转换。缓存只在按文件并发重构时启用。
+
 源 COBOL 文件可从以下位置获取：
 https://github.com/aws-samples/aws-mainframe-modernization-carddemo/tree/main/app/cbl
 """
 
+import hashlib
+import importlib.util
+import json
 import os
 import re
+import shutil
 import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from pydantic import SecretStr
@@ -26,6 +59,44 @@ from openhands.tools.preset.default import get_default_agent
 
 QUALITY_THRESHOLD = float(os.getenv("QUALITY_THRESHOLD", "90.0"))
 MAX_ITERATIONS = int(os.getenv("MAX_ITERATIONS", "5"))
+PARALLEL_REFACTOR = os.getenv("PARALLEL_REFACTOR", "1") == "1"
+REFACTOR_WORKERS = int(os.getenv("REFACTOR_WORKERS", "4"))
+PIPELINE = os.getenv("PIPELINE", "1") == "1"
+CRITIQUE_WORKERS = int(os.getenv("CRITIQUE_WORKERS", "2"))
+PRECHECK = os.getenv("PRECHECK", "1") == "1"
+PRECHECK_MIN_COVERAGE = float(os.getenv("PRECHECK_MIN_COVERAGE", "0.5"))
+CONVERSION_CACHE_DIR = os.getenv(
+    "CONVERSION_CACHE_DIR", str(Path.home() / ".cache" / "cobol2java")
+)
+
+# 重构 / 评审提示词模板的版本；修改提示词后递增，旧的缓存随之失效
+PROMPT_VERSION = "2"
+
+
+@dataclass
+class FileCritique:
+    """评审报告中单个文件的得分与问题。"""
+
+    cobol_file: str
+    score: float
+    issues: list[str] = field(default_factory=list)
+
+
+@dataclass
+class PrecheckResult:
+    """本地静态检查的结果：errors 直接判定不通过，warnings 交给评审代理参考。"""
+
+    cobol_file: str
+    errors: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+    coverage: float = 0.0
+
+    @property
+    def passed(self) -> bool:
+        return not self.errors
+
+    def to_critique(self) -> FileCritique:
+        return FileCritique(self.cobol_file, 0.0, self.errors + self.warnings)
 
 
 def setup_workspace() -> tuple[Path, Path, Path]:
@@ -280,13 +351,117 @@ Java 目标目录：{java_dir}
     return base_prompt
 
 
+def java_target_dir(java_dir: Path, cobol_file: str) -> Path:
+    """单个 COBOL 文件的 Java 目标目录（同时作为 Java 包名）。"""
+    return java_dir / Path(cobol_file).stem.lower()
+
+
+def refactor_file(
+    llm: LLM,
+    workspace_dir: Path,
+    cobol_dir: Path,
+    java_dir: Path,
+    cobol_file: str,
+    critique_file: Path | None = None,
+    issues: list[str] | None = None,
+) -> float:
+    """用一个独立的重构对话转换单个 COBOL 文件，返回耗时（秒）。"""
+    start = time.monotonic()
+    target_dir = java_target_dir(java_dir, cobol_file)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    agent = get_default_agent(llm=llm, cli_mode=True)
+    conversation = Conversation(agent=agent, workspace=str(workspace_dir))
+
+    prompt = get_refactoring_prompt(cobol_dir, target_dir, [cobol_file], critique_file)
+    prompt += f"""
+只转换 {cobol_file}。Java 文件只写入 {target_dir}（包名 {target_dir.name}），
+不要读取或修改其他程序的 Java 文件，它们由其他代理同时处理。
+"""
+    if issues:
+        issue_list = "\n".join(f"  - {issue}" for issue in issues)
+        prompt += f"""
+上一轮评审指出 {cobol_file} 的问题：
+{issue_list}
+"""
+    conversation.send_message(prompt)
+    conversation.run()
+    return time.monotonic() - start
+
+
+def run_refactoring_phase(
+    llm: LLM,
+    workspace_dir: Path,
+    cobol_dir: Path,
+    java_dir: Path,
+    cobol_files: list[str],
+    critique_file: Path | None = None,
+    file_critiques: dict[str, FileCritique] | None = None,
+) -> None:
+    """重构阶段：每个文件一个对话并发执行，全部完成后返回。"""
+    if not PARALLEL_REFACTOR:
+        refactoring_agent = get_default_agent(llm=llm, cli_mode=True)
+        refactoring_conversation = Conversation(
+            agent=refactoring_agent,
+            workspace=str(workspace_dir),
+        )
+        refactoring_prompt = get_refactoring_prompt(
+            cobol_dir, java_dir, cobol_files, critique_file
+        )
+        refactoring_conversation.send_message(refactoring_prompt)
+        refactoring_conversation.run()
+        return
+
+    # 对话主要在等待模型响应，线程即可并发；LLM 对象也无法跨进程传递
+    workers = max(1, min(REFACTOR_WORKERS, len(cobol_files)))
+    print(f"并发重构 {len(cobol_files)} 个文件（{workers} 个并发对话）")
+    start = time.monotonic()
+    durations: dict[str, float] = {}
+    failures: dict[str, Exception] = {}
+
+    file_critiques = file_critiques or {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refactor") as pool:
+        futures = {
+            pool.submit(
+                refactor_file,
+                llm,
+                workspace_dir,
+                cobol_dir,
+                java_dir,
+                cobol_file,
+                critique_file,
+                file_critiques[cobol_file].issues if cobol_file in file_critiques else None,
+            ): cobol_file
+            for cobol_file in cobol_files
+        }
+        for future in as_completed(futures):
+            cobol_file = futures[future]
+            try:
+                durations[cobol_file] = future.result()
+                print(f"  ✓ {cobol_file} 转换完成（{durations[cobol_file]:.0f} 秒）")
+            except Exception as e:  # noqa: BLE001
+                failures[cobol_file] = e
+                print(f"  ✗ {cobol_file} 转换失败：{e}")
+
+    elapsed = time.monotonic() - start
+    if durations:
+        print(
+            f"重构耗时 {elapsed:.0f} 秒（最慢的文件 {max(durations.values()):.0f} 秒，"
+            f"各文件合计 {sum(durations.values()):.0f} 秒）"
+        )
+    if failures:
+        print(f"有 {len(failures)} 个文件转换失败，评审时将视为未找到：{', '.join(failures)}")
+
+
 def get_critique_prompt(
     cobol_dir: Path,
     java_dir: Path,
     cobol_files: list[str],
+    report_file: Path | None = None,
 ) -> str:
     """生成评审代理的提示词。"""
     files_list = "\n".join(f"  - {f}" for f in cobol_files)
+    report_file = report_file or java_dir.parent / "critiques" / "critique_report.md"
 
     return f"""评估 COBOL 到 Java 重构的质量。
 
@@ -296,7 +471,8 @@ Java 目标目录：{java_dir}
 原始 COBOL 文件：
 {files_list}
 
-请根据原始 COBOL 源代码评估每个转换后的 Java 文件。
+请根据原始 COBOL 源代码评估每个转换后的 Java 文件
+（Java 文件可能位于 Java 目标目录下以程序名小写命名的子目录中，例如 cbact01c/）。
 
 对于每个文件，评估：
 1. 正确性：Java 代码是否保留了原始业务逻辑？（0-25 分）
@@ -336,7 +512,7 @@ Java 目标目录：{java_dir}
 2. [第二优先级]
 3. [第三优先级]
 
-将此报告保存到：{java_dir.parent}/critiques/critique_report.md
+将此报告保存到：{report_file}
 """
 
 
@@ -364,6 +540,455 @@ def parse_critique_score(critique_file: Path) -> float:
     return 0.0
 
 
+class ConversionCache:
+    """按内容寻址的转换缓存：每次尝试一个目录（java/ + meta.json），另记每个源码的最佳达标尝试。"""
+
+    def __init__(self, root: Path, model: str, threshold: float = QUALITY_THRESHOLD) -> None:
+        self.root = root
+        self.model = model
+        self.threshold = threshold
+        self.hits = 0
+        self.stores = 0
+        (root / "attempts").mkdir(parents=True, exist_ok=True)
+        (root / "accepted").mkdir(parents=True, exist_ok=True)
+
+    def _hash(self, *parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in (PROMPT_VERSION, self.model, *parts):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def source_key(self, source: str) -> str:
+        return self._hash(source)
+
+    def attempt_key(self, source: str, issues: list[str]) -> str:
+        return self._hash(source, "\n".join(issues))
+
+    def _load(self, key: str) -> dict | None:
+        meta_file = self.root / "attempts" / key / "meta.json"
+        if not meta_file.exists():
+            return None
+        try:
+            meta = json.loads(meta_file.read_text())
+        except (OSError, ValueError) as e:
+            print(f"转换缓存条目损坏，忽略：{meta_file}（{e}）")
+            return None
+        meta["dir"] = meta_file.parent
+        return meta
+
+    def lookup(self, source: str, issues: list[str]) -> dict | None:
+        """同一源码、同一评审问题驱动过的达标尝试；未达标的尝试视为未命中，需要重新转换"""
+        entry = self._load(self.attempt_key(source, issues))
+        if entry is None or entry["score"] < self.threshold:
+            return None
+        return entry
+
+    def accepted(self, source: str) -> dict | None:
+        """该源码得分最高的达标尝试"""
+        pointer = self.root / "accepted" / self.source_key(source)
+        if not pointer.exists():
+            return None
+        return self._load(pointer.read_text().strip())
+
+    def restore(self, entry: dict, target_dir: Path) -> FileCritique:
+        """把缓存的 Java 文件放回目标目录，返回当时的评审结果"""
+        if target_dir.exists():
+            shutil.rmtree(target_dir)
+        shutil.copytree(entry["dir"] / "java", target_dir)
+        self.hits += 1
+        return FileCritique(entry["cobol_file"], entry["score"], entry["issues"])
+
+    def store(self, source: str, issues: list[str], target_dir: Path, critique: FileCritique) -> None:
+        key = self.attempt_key(source, issues)
+        attempt_dir = self.root / "attempts" / key
+        tmp_dir = attempt_dir.with_name(key + ".tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        shutil.copytree(target_dir, tmp_dir / "java")
+        meta = {
+            "cobol_file": critique.cobol_file,
+            "score": critique.score,
+            "issues": critique.issues,
+            "driven_by": issues,
+            "model": self.model,
+            "prompt_version": PROMPT_VERSION,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        (tmp_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+        if attempt_dir.exists():
+            shutil.rmtree(attempt_dir)
+        tmp_dir.rename(attempt_dir)
+        self.stores += 1
+
+        if critique.score >= self.threshold:
+            best = self.accepted(source)
+            if best is None or critique.score >= best["score"]:
+                (self.root / "accepted" / self.source_key(source)).write_text(key)
+
+
+def parse_file_critiques(critique_file: Path, cobol_files: list[str]) -> dict[str, FileCritique]:
+    """从评审报告中解析每个文件的得分与需要解决的问题（报告里没有的文件不返回）。"""
+    if not critique_file.exists():
+        return {}
+
+    content = critique_file.read_text()
+    sections = re.split(r"^###\s+", content, flags=re.MULTILINE)[1:]
+    results: dict[str, FileCritique] = {}
+
+    for section in sections:
+        heading, _, body = section.partition("\n")
+        stems = [f for f in cobol_files if Path(f).stem.lower() in heading.lower()]
+        if not stems:
+            continue
+        score_match = re.search(
+            r"(?:文件得分|File Score)\**[：:]\s*(\d+(?:\.\d+)?)", body, re.IGNORECASE
+        )
+        if not score_match:
+            continue
+
+        issues: list[str] = []
+        in_issues = False
+        for line in body.splitlines():
+            if re.search(r"需要解决的问题|Issues to Address", line, re.IGNORECASE):
+                in_issues = True
+                continue
+            if not in_issues:
+                continue
+            item = re.match(r"^\s+[-*]\s+(.+)", line)
+            if item:
+                issues.append(item.group(1).strip())
+            elif line.strip():
+                # 下一个字段或小节开始
+                break
+
+        results[stems[0]] = FileCritique(stems[0], float(score_match.group(1)), issues)
+
+    return results
+
+
+# 固定格式 COBOL：第 7 列为指示区，段落 / 节名从 A 区（第 8 列）开始，第 73 列之后是标识区
+_PARAGRAPH_RE = re.compile(r"^.{6} ([A-Z0-9][A-Z0-9-]*)(?:\s+SECTION)?\.\s*$", re.IGNORECASE)
+_SOURCE_TAG_RE = re.compile(
+    r"@source\s+([\w$#-]+?)(?:\.(?:cbl|cob|cpy))?\s*:\s*(\d+)(?:\s*-\s*(\d+))?", re.IGNORECASE
+)
+_JAVA_TYPE_RE = re.compile(r"\b(?:class|interface|enum|record)\s+[A-Za-z_$][\w$]*")
+_JAVA_NOISE_RE = re.compile(
+    r'"""[\s\S]*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*[\s\S]*?\*/'
+)
+
+
+def cobol_paragraphs(source: str) -> list[tuple[str, int, int]]:
+    """PROCEDURE DIVISION 中的段落 / 节：[(名称, 起始行, 结束行)]，行号从 1 开始。"""
+    lines = source.splitlines()
+    starts: list[tuple[str, int]] = []
+    in_procedure = False
+    for number, line in enumerate(lines, 1):
+        text = line[:72]
+        if "PROCEDURE DIVISION" in text.upper():
+            in_procedure = True
+            continue
+        match = _PARAGRAPH_RE.match(text) if in_procedure else None
+        if match:
+            starts.append((match.group(1).upper(), number))
+    return [
+        (name, start, (starts[i + 1][1] - 1) if i + 1 < len(starts) else len(lines))
+        for i, (name, start) in enumerate(starts)
+    ]
+
+
+def javalang_available() -> bool:
+    return importlib.util.find_spec("javalang") is not None
+
+
+def java_syntax_errors(code: str) -> list[str]:
+    """Java 语法问题；没有安装 javalang 时只检查括号配对。"""
+    try:
+        import javalang
+    except ImportError:
+        javalang = None
+
+    if javalang is not None:
+        try:
+            tree = javalang.parse.parse(code)
+        except (javalang.parser.JavaSyntaxError, javalang.tokenizer.LexerError) as e:
+            position = getattr(e, "at", None) or getattr(e, "description", "")
+            return [f"无法解析为 Java：{type(e).__name__} {position}".strip()]
+        return [] if tree.types else ["没有声明任何类型"]
+
+    stripped = _JAVA_NOISE_RE.sub('""', code)
+    stack: list[str] = []
+    pairs = {")": "(", "]": "[", "}": "{"}
+    for char in stripped:
+        if char in "([{":
+            stack.append(char)
+        elif char in pairs:
+            if not stack or stack.pop() != pairs[char]:
+                return [f"括号不配对：多余的 '{char}'"]
+    if stack:
+        return [f"括号不配对：缺少与 '{stack[-1]}' 对应的闭合括号"]
+    return [] if _JAVA_TYPE_RE.search(stripped) else ["没有声明任何类型"]
+
+
+def precheck_file(cobol_dir: Path, java_dir: Path, cobol_file: str) -> PrecheckResult:
+    """评审代理之前的本地检查：Java 类是否存在、能否解析、@source 标记对段落的覆盖。"""
+    result = PrecheckResult(cobol_file)
+    target_dir = java_target_dir(java_dir, cobol_file)
+    java_files = sorted(target_dir.rglob("*.java")) if target_dir.exists() else []
+    if not java_files:
+        result.errors.append(f"{target_dir.relative_to(java_dir.parent)} 中没有 Java 文件")
+        return result
+
+    program = Path(cobol_file).stem.upper()
+    source_lines = len((cobol_dir / cobol_file).read_text().splitlines())
+    ranges: list[tuple[int, int]] = []
+    foreign_tags = 0
+    out_of_range = 0
+    for java_file in java_files:
+        code = java_file.read_text(errors="replace")
+        for error in java_syntax_errors(code):
+            result.errors.append(f"{java_file.name}：{error}")
+        for match in _SOURCE_TAG_RE.finditer(code):
+            if match.group(1).upper() != program:
+                foreign_tags += 1
+                continue
+            start = int(match.group(2))
+            end = int(match.group(3) or start)
+            if not 1 <= start <= end <= source_lines:
+                out_of_range += 1
+                continue
+            ranges.append((start, end))
+
+    if not ranges:
+        result.errors.append(f"缺少指向 {cobol_file} 的 @source <程序名>:<行号> 可追溯性标记")
+        return result
+    if foreign_tags:
+        result.warnings.append(f"有 {foreign_tags} 个 @source 标记指向其他程序")
+    if out_of_range:
+        result.warnings.append(f"有 {out_of_range} 个 @source 标记的行号超出 {cobol_file} 的范围（共 {source_lines} 行）")
+
+    paragraphs = cobol_paragraphs((cobol_dir / cobol_file).read_text())
+    if not paragraphs:
+        result.coverage = 1.0
+        return result
+    unmapped = [
+        name
+        for name, start, end in paragraphs
+        if not any(tag_start <= end and tag_end >= start for tag_start, tag_end in ranges)
+    ]
+    result.coverage = 1 - len(unmapped) / len(paragraphs)
+    if unmapped:
+        message = (
+            f"{len(unmapped)}/{len(paragraphs)} 个 COBOL 段落没有被 @source 标记覆盖：{', '.join(unmapped)}"
+        )
+        if result.coverage < PRECHECK_MIN_COVERAGE:
+            result.errors.append(message)
+        else:
+            result.warnings.append(message)
+    return result
+
+
+def write_precheck_report(result: PrecheckResult, report_file: Path) -> None:
+    """按评审报告的格式写入自动生成的评审，parse_file_critiques 和重构代理都能直接读取。"""
+    issues = "\n".join(f"  - {issue}" for issue in result.errors + result.warnings)
+    report_file.write_text(
+        f"""# COBOL 到 Java 重构评审报告（本地静态检查）
+
+## 总结
+本地静态检查未通过，未进行评审代理评估。
+
+## 文件评估
+
+### {result.cobol_file}
+- **段落覆盖率**：{result.coverage:.0%}
+- **文件得分**：0/100
+- **需要解决的问题**：
+{issues}
+"""
+    )
+
+
+def run_precheck(
+    cobol_dir: Path, java_dir: Path, cobol_files: list[str]
+) -> tuple[list[str], dict[str, PrecheckResult]]:
+    """检查一批文件，返回（交给评审代理的文件，各文件检查结果）。"""
+    results = {f: precheck_file(cobol_dir, java_dir, f) for f in cobol_files}
+    for cobol_file, result in results.items():
+        if not result.passed:
+            print(f"  ✗ {cobol_file} 未通过本地检查，跳过评审代理：{'；'.join(result.errors)}")
+    return [f for f in cobol_files if results[f].passed], results
+
+
+def merge_precheck(critique: FileCritique, result: PrecheckResult | None) -> FileCritique:
+    """把本地检查的提示并入评审代理给出的问题列表。"""
+    if result and result.warnings:
+        critique.issues = critique.issues + [w for w in result.warnings if w not in critique.issues]
+    return critique
+
+
+def critique_file_report(critique_dir: Path, cobol_file: str) -> Path:
+    """流水线中单个文件的评审报告路径。"""
+    return critique_dir / f"{Path(cobol_file).stem.lower()}_critique.md"
+
+
+def critique_single_file(
+    llm: LLM,
+    workspace_dir: Path,
+    cobol_dir: Path,
+    java_dir: Path,
+    cobol_file: str,
+    report_file: Path,
+) -> tuple[FileCritique | None, float]:
+    """用一个独立的评审对话评估单个文件，返回（评审结果，耗时秒数）；报告中没有得分时结果为 None。"""
+    start = time.monotonic()
+    if report_file.exists():
+        report_file.unlink()
+
+    agent = get_default_agent(llm=llm, cli_mode=True)
+    conversation = Conversation(agent=agent, workspace=str(workspace_dir))
+    conversation.send_message(get_critique_prompt(cobol_dir, java_dir, [cobol_file], report_file))
+    conversation.run()
+
+    critique = parse_file_critiques(report_file, [cobol_file]).get(cobol_file)
+    return critique, time.monotonic() - start
+
+
+def run_pipeline(
+    llm: LLM,
+    workspace_dir: Path,
+    cobol_dir: Path,
+    java_dir: Path,
+    critique_dir: Path,
+    cobol_files: list[str],
+    file_critiques: dict[str, FileCritique],
+    cache: ConversionCache | None = None,
+    sources: dict[str, str] | None = None,
+) -> dict[str, int]:
+    """重构 → 评审流水线：文件重构完立即评审，未达标的文件带着问题回到重构队列。
+
+    评审结果写入 file_critiques，返回每个文件的尝试次数。
+    """
+    refactor_pool = ThreadPoolExecutor(max_workers=max(1, REFACTOR_WORKERS), thread_name_prefix="refactor")
+    critique_pool = ThreadPoolExecutor(max_workers=max(1, CRITIQUE_WORKERS), thread_name_prefix="critique")
+    print(
+        f"流水线处理 {len(cobol_files)} 个文件"
+        f"（{REFACTOR_WORKERS} 个重构对话，{CRITIQUE_WORKERS} 个评审对话）"
+    )
+
+    queue = deque(cobol_files)
+    attempts = {f: 0 for f in cobol_files}
+    driving_issues: dict[str, list[str]] = {}
+    running: dict[Future, tuple[str, str]] = {}
+    prechecks: dict[str, PrecheckResult] = {}
+    busy = {"refactor": 0.0, "critique": 0.0}
+    skipped_critiques = 0
+    start = time.monotonic()
+
+    def settle(cobol_file: str, critique: FileCritique | None) -> None:
+        """记录一次尝试的评审结果，未达标且还有尝试次数时重新排队"""
+        if critique:
+            file_critiques[cobol_file] = critique
+            print(f"  {cobol_file} 第 {attempts[cobol_file]} 次尝试：{critique.score:.0f}/100")
+        else:
+            print(f"  {cobol_file} 第 {attempts[cobol_file]} 次尝试：评审报告中没有找到得分")
+        if critique and critique.score >= QUALITY_THRESHOLD:
+            print(f"  ✓ {cobol_file} 达到质量阈值")
+        elif attempts[cobol_file] < MAX_ITERATIONS:
+            queue.append(cobol_file)
+        else:
+            print(f"  ✗ {cobol_file} 已用完 {MAX_ITERATIONS} 次尝试")
+
+    def record(cobol_file: str, critique: FileCritique | None) -> None:
+        """写入转换缓存后再 settle"""
+        target_dir = java_target_dir(java_dir, cobol_file)
+        if cache and critique and target_dir.exists():
+            cache.store(sources[cobol_file], driving_issues[cobol_file], target_dir, critique)
+        settle(cobol_file, critique)
+
+    try:
+        while queue or running:
+            while queue:
+                cobol_file = queue.popleft()
+                attempts[cobol_file] += 1
+                issues = file_critiques[cobol_file].issues if cobol_file in file_critiques else []
+                driving_issues[cobol_file] = issues
+
+                entry = cache.lookup(sources[cobol_file], issues) if cache else None
+                if entry:
+                    print(f"命中转换缓存：{cobol_file}（{entry['score']:.0f}/100），跳过转换和评审")
+                    settle(cobol_file, cache.restore(entry, java_target_dir(java_dir, cobol_file)))
+                    continue
+
+                report_file = critique_file_report(critique_dir, cobol_file)
+                future = refactor_pool.submit(
+                    refactor_file,
+                    llm,
+                    workspace_dir,
+                    cobol_dir,
+                    java_dir,
+                    cobol_file,
+                    report_file if attempts[cobol_file] > 1 else None,
+                    issues or None,
+                )
+                running[future] = ("refactor", cobol_file)
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, cobol_file = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # noqa: BLE001
+                    print(f"  ✗ {cobol_file} {'转换' if stage == 'refactor' else '评审'}失败：{e}")
+                    settle(cobol_file, None)
+                    continue
+
+                if stage == "refactor":
+                    busy["refactor"] += result
+                    print(f"  ✓ {cobol_file} 转换完成（{result:.0f} 秒）")
+                    if PRECHECK:
+                        check = prechecks[cobol_file] = precheck_file(cobol_dir, java_dir, cobol_file)
+                        if not check.passed:
+                            skipped_critiques += 1
+                            print(f"  ✗ {cobol_file} 未通过本地检查，跳过评审代理：{'；'.join(check.errors)}")
+                            write_precheck_report(check, critique_file_report(critique_dir, cobol_file))
+                            record(cobol_file, check.to_critique())
+                            continue
+                    future = critique_pool.submit(
+                        critique_single_file,
+                        llm,
+                        workspace_dir,
+                        cobol_dir,
+                        java_dir,
+                        cobol_file,
+                        critique_file_report(critique_dir, cobol_file),
+                    )
+                    running[future] = ("critique", cobol_file)
+                    continue
+
+                critique, duration = result
+                busy["critique"] += duration
+                if critique:
+                    critique = merge_precheck(critique, prechecks.get(cobol_file))
+                record(cobol_file, critique)
+    finally:
+        refactor_pool.shutdown(wait=True)
+        critique_pool.shutdown(wait=True)
+
+    elapsed = time.monotonic() - start
+    if elapsed > 0:
+        print(
+            f"流水线耗时 {elapsed:.0f} 秒；重构对话忙碌 {busy['refactor']:.0f} 秒"
+            f"（利用率 {busy['refactor'] / (elapsed * REFACTOR_WORKERS):.0%}），"
+            f"评审对话忙碌 {busy['critique']:.0f} 秒"
+            f"（利用率 {busy['critique'] / (elapsed * CRITIQUE_WORKERS):.0%}）"
+        )
+    if skipped_critiques:
+        print(f"本地检查拦下 {skipped_critiques} 次不合格的输出，节省相同次数的评审对话")
+    return attempts
+
+
 def run_iterative_refinement() -> None:
     """运行迭代优化工作流程。"""
     # 设置
@@ -397,45 +1022,158 @@ def run_iterative_refinement() -> None:
     critique_file = critique_dir / "critique_report.md"
     current_score = 0.0
     iteration = 0
+    file_critiques: dict[str, FileCritique] = {}
+    pending_files = list(cobol_files)
+    total_saved = 0
+    total_precheck_skipped = 0
+
+    # 转换缓存：先复用已达标的转换，这些文件不再进入重构与评审
+    cache: ConversionCache | None = None
+    sources = {f: (cobol_dir / f).read_text() for f in cobol_files}
+    if PARALLEL_REFACTOR and CONVERSION_CACHE_DIR:
+        cache = ConversionCache(Path(CONVERSION_CACHE_DIR).expanduser(), model)
+        for cobol_file in cobol_files:
+            entry = cache.accepted(sources[cobol_file])
+            if entry:
+                file_critiques[cobol_file] = cache.restore(
+                    entry, java_target_dir(java_dir, cobol_file)
+                )
+                print(f"复用已达标的缓存转换：{cobol_file}（{entry['score']:.0f}/100）")
+        pending_files = [f for f in cobol_files if f not in file_critiques]
+        if not pending_files:
+            current_score = sum(c.score for c in file_critiques.values()) / len(cobol_files)
+            print("所有文件都已有达标的缓存转换，无需重构。")
+
+    if PRECHECK and PARALLEL_REFACTOR and pending_files and not javalang_available():
+        print(
+            "⚠️  未安装 javalang，本地静态检查只检查括号配对：缺少分号、方法声明错误等语法问题"
+            "不会被发现（pip install javalang）"
+        )
 
-    while current_score < QUALITY_THRESHOLD and iteration < MAX_ITERATIONS:
+    use_pipeline = PIPELINE and PARALLEL_REFACTOR
+    if use_pipeline and pending_files:
+        attempts = run_pipeline(
+            llm,
+            workspace_dir,
+            cobol_dir,
+            java_dir,
+            critique_dir,
+            pending_files,
+            file_critiques,
+            cache,
+            sources,
+        )
+        iteration = max(attempts.values())
+        # 与逐轮迭代相比，已达标的文件不再随其他文件一起重做
+        total_saved = iteration * len(pending_files) - sum(attempts.values())
+        current_score = sum(c.score for c in file_critiques.values()) / len(cobol_files)
+        for cobol_file in cobol_files:
+            critique = file_critiques.get(cobol_file)
+            print(f"  {cobol_file}：{critique.score:.0f}/100" if critique else f"  {cobol_file}：无得分")
+        print(f"\n当前得分：{current_score:.1f}%")
+
+    while not use_pipeline and current_score < QUALITY_THRESHOLD and iteration < MAX_ITERATIONS:
         iteration += 1
         print("=" * 80)
         print(f"迭代 {iteration}")
         print("=" * 80)
 
-        # 阶段 1：重构
-        print("\n--- 阶段 1：重构代理 ---")
-        refactoring_agent = get_default_agent(llm=llm, cli_mode=True)
-        refactoring_conversation = Conversation(
-            agent=refactoring_agent,
-            workspace=str(workspace_dir),
-        )
-
-        previous_critique = critique_file if iteration > 1 else None
-        refactoring_prompt = get_refactoring_prompt(
-            cobol_dir, java_dir, cobol_files, previous_critique
-        )
-
-        refactoring_conversation.send_message(refactoring_prompt)
-        refactoring_conversation.run()
-        print("重构阶段完成。")
-
-        # 阶段 2：评审
-        print("\n--- 阶段 2：评审代理 ---")
-        critique_agent = get_default_agent(llm=llm, cli_mode=True)
-        critique_conversation = Conversation(
-            agent=critique_agent,
-            workspace=str(workspace_dir),
-        )
-
-        critique_prompt = get_critique_prompt(cobol_dir, java_dir, cobol_files)
-        critique_conversation.send_message(critique_prompt)
-        critique_conversation.run()
-        print("评审阶段完成。")
+        saved = len(cobol_files) - len(pending_files)
+        total_saved += saved
+        if saved:
+            frozen = [f for f in cobol_files if f not in pending_files]
+            print(
+                f"冻结 {saved} 个已达标文件（{', '.join(frozen)}），"
+                f"本轮节省 {saved} 次转换和评审"
+            )
 
-        # 解析得分
-        current_score = parse_critique_score(critique_file)
+        # 驱动本轮尝试的评审问题（首轮为空），同时作为缓存键的一部分
+        driving_issues = {
+            f: file_critiques[f].issues if f in file_critiques else [] for f in pending_files
+        }
+        convert_files = list(pending_files)
+        if cache:
+            for cobol_file in pending_files:
+                entry = cache.lookup(sources[cobol_file], driving_issues[cobol_file])
+                if entry:
+                    file_critiques[cobol_file] = cache.restore(
+                        entry, java_target_dir(java_dir, cobol_file)
+                    )
+                    convert_files.remove(cobol_file)
+                    print(f"命中转换缓存：{cobol_file}（{entry['score']:.0f}/100），跳过转换和评审")
+
+        parsed: dict[str, FileCritique] = {}
+        if convert_files:
+            # 阶段 1：重构
+            print("\n--- 阶段 1：重构代理 ---")
+            previous_critique = critique_file if iteration > 1 else None
+            run_refactoring_phase(
+                llm,
+                workspace_dir,
+                cobol_dir,
+                java_dir,
+                convert_files,
+                previous_critique,
+                file_critiques,
+            )
+            print("重构阶段完成。")
+
+            # 本地静态检查：结构上不合格的文件直接得到自动生成的评审
+            critique_files = convert_files
+            prechecks: dict[str, PrecheckResult] = {}
+            if PRECHECK and PARALLEL_REFACTOR:
+                print("\n--- 本地静态检查 ---")
+                critique_files, prechecks = run_precheck(cobol_dir, java_dir, convert_files)
+                skipped = len(convert_files) - len(critique_files)
+                total_precheck_skipped += skipped
+                print(f"{len(critique_files)} 个文件通过，{skipped} 个文件无需评审代理")
+
+            # 阶段 2：评审
+            if critique_files:
+                print("\n--- 阶段 2：评审代理 ---")
+                critique_agent = get_default_agent(llm=llm, cli_mode=True)
+                critique_conversation = Conversation(
+                    agent=critique_agent,
+                    workspace=str(workspace_dir),
+                )
+
+                critique_prompt = get_critique_prompt(cobol_dir, java_dir, critique_files)
+                critique_conversation.send_message(critique_prompt)
+                critique_conversation.run()
+                print("评审阶段完成。")
+
+                # 解析得分：本轮评审的文件更新得分，冻结的文件沿用之前的得分
+                parsed = parse_file_critiques(critique_file, critique_files)
+            for cobol_file, check in prechecks.items():
+                if not check.passed:
+                    parsed[cobol_file] = check.to_critique()
+                elif cobol_file in parsed:
+                    merge_precheck(parsed[cobol_file], check)
+            file_critiques.update(parsed)
+            if cache:
+                for cobol_file, critique in parsed.items():
+                    target_dir = java_target_dir(java_dir, cobol_file)
+                    if target_dir.exists():
+                        cache.store(
+                            sources[cobol_file], driving_issues[cobol_file], target_dir, critique
+                        )
+        if len(file_critiques) == len(cobol_files):
+            current_score = sum(c.score for c in file_critiques.values()) / len(cobol_files)
+            for cobol_file in cobol_files:
+                print(f"  {cobol_file}：{file_critiques[cobol_file].score:.0f}/100")
+            pending_files = [
+                f for f in cobol_files if file_critiques[f].score < QUALITY_THRESHOLD
+            ]
+        else:
+            # 报告没有按文件给出得分时，退回平均分并在下一轮处理全部未达标的文件
+            missing = [f for f in convert_files if f not in parsed]
+            print(f"评审报告中没有找到这些文件的得分：{', '.join(missing)}")
+            current_score = parse_critique_score(critique_file)
+            pending_files = [
+                f
+                for f in cobol_files
+                if f not in file_critiques or file_critiques[f].score < QUALITY_THRESHOLD
+            ]
         print(f"\n当前得分：{current_score:.1f}%")
 
         if current_score >= QUALITY_THRESHOLD:
@@ -452,16 +1190,26 @@ def run_iterative_refinement() -> None:
     print("=" * 80)
     print(f"总迭代次数：{iteration}")
     print(f"最终得分：{current_score:.1f}%")
+    print(f"冻结已达标文件共节省 {total_saved} 次转换")
+    if total_precheck_skipped:
+        print(f"本地检查共拦下 {total_precheck_skipped} 个不合格的文件，未交给评审代理")
+    if cache:
+        print(
+            f"转换缓存：命中 {cache.hits} 次（节省相同次数的转换），"
+            f"新增 {cache.stores} 条（{cache.root}）"
+        )
     print(f"工作空间：{workspace_dir}")
 
     # 列出创建的 Java 文件
     print("\n已创建的 Java 文件：")
-    for java_file in java_dir.glob("*.java"):
-        print(f"  - {java_file.name}")
+    for java_file in sorted(java_dir.rglob("*.java")):
+        print(f"  - {java_file.relative_to(java_dir)}")
 
     # 显示评审文件位置
     if critique_file.exists():
         print(f"\n最终评审报告：{critique_file}")
+    elif use_pipeline:
+        print(f"\n单文件评审报告：{critique_dir}")
 
     # 报告成本
     cost = llm.metrics.accumulated_cost
@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture
+def write_java():
+    """在目录里写一个 Java 文件，返回该目录"""
+
+    def write(directory, name="A.java", body="class A {}"):
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / name).write_text(body)
+        return directory
+
+    return write
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("openhands")
+
+import openhandLoop  # noqa: E402
+from openhandLoop import ConversionCache, FileCritique  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ConversionCache(tmp_path / "cache", "model-a", threshold=90.0)
+
+
+def test_keys_depend_on_source_model_prompt_and_issues(cache, tmp_path, monkeypatch):
+    key = cache.attempt_key("SRC", [])
+    assert cache.attempt_key("SRC", ["fix x"]) != key
+    assert cache.attempt_key("SRC2", []) != key
+    assert ConversionCache(tmp_path / "other", "model-b").attempt_key("SRC", []) != key
+    monkeypatch.setattr(openhandLoop, "PROMPT_VERSION", "999")
+    assert cache.attempt_key("SRC", []) != key
+
+
+def test_accepted_attempt_is_restored(cache, tmp_path, write_java):
+    java = write_java(tmp_path / "java" / "a")
+    cache.store("SRC", [], java, FileCritique("A.cbl", 95, ["nit"]))
+
+    target = tmp_path / "restored"
+    entry = cache.accepted("SRC")
+    assert cache.restore(entry, target) == FileCritique("A.cbl", 95, ["nit"])
+    assert (target / "A.java").read_text() == "class A {}"
+    assert cache.lookup("SRC", []) is not None
+    assert (cache.hits, cache.stores) == (1, 1)
+
+
+def test_below_threshold_attempts_are_never_replayed(cache, tmp_path, write_java):
+    java = write_java(tmp_path / "java" / "a")
+    cache.store("SRC", [], java, FileCritique("A.cbl", 40, ["broken"]))
+    cache.store("SRC", ["broken"], java, FileCritique("A.cbl", 0, ["still broken"]))
+    assert cache.lookup("SRC", []) is None
+    assert cache.lookup("SRC", ["broken"]) is None
+    assert cache.accepted("SRC") is None
+
+
+def test_accepted_pointer_keeps_best_score(cache, tmp_path, write_java):
+    java = write_java(tmp_path / "java" / "a")
+    cache.store("SRC", [], java, FileCritique("A.cbl", 97, []))
+    cache.store("SRC", ["x"], java, FileCritique("A.cbl", 92, []))
+    assert cache.accepted("SRC")["score"] == 97
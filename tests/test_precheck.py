@@ -0,0 +1,113 @@
+import sys
+
+import pytest
+
+pytest.importorskip("openhands")
+
+import openhandLoop  # noqa: E402
+from openhandLoop import (  # noqa: E402
+    cobol_paragraphs,
+    create_sample_cobol_files,
+    java_syntax_errors,
+    java_target_dir,
+    parse_file_critiques,
+    precheck_file,
+    write_precheck_report,
+)
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    cobol_dir = tmp_path / "cobol"
+    java_dir = tmp_path / "java"
+    cobol_dir.mkdir()
+    java_dir.mkdir()
+    return cobol_dir, java_dir, create_sample_cobol_files(cobol_dir)[0]
+
+
+def tagged_java(cobol_dir, cobol_file, paragraphs):
+    program = cobol_file.split(".")[0]
+    methods = " ".join(
+        f"/** @source {cobol_file}:{start}-{end} */ void p{i}() {{}}"
+        for i, (_, start, end) in enumerate(paragraphs)
+    )
+    return f"package {program.lower()}; public class {program.title()} {{ {methods} }}"
+
+
+def test_cobol_paragraphs_cover_procedure_division(workspace):
+    cobol_dir, _, cobol_file = workspace
+    paragraphs = cobol_paragraphs((cobol_dir / cobol_file).read_text())
+    names = [name for name, _, _ in paragraphs]
+    assert names == ["1000-INIT", "2000-PROCESS", "3000-TERMINATE"]
+    assert all(start <= end for _, start, end in paragraphs)
+    assert all(a[2] < b[1] for a, b in zip(paragraphs, paragraphs[1:]))
+
+
+def test_java_syntax_fallback_checks_delimiters(monkeypatch):
+    monkeypatch.setitem(sys.modules, "javalang", None)
+    assert java_syntax_errors('class A { String s = "}"; /* { */ }') == []
+    assert java_syntax_errors("class A { void f() { }")
+    assert java_syntax_errors("int x = 1;")
+
+
+def test_missing_javalang_is_reported(monkeypatch):
+    monkeypatch.setattr(openhandLoop.importlib.util, "find_spec", lambda name: None)
+    assert not openhandLoop.javalang_available()
+
+
+def test_missing_java_fails(workspace):
+    cobol_dir, java_dir, cobol_file = workspace
+    result = precheck_file(cobol_dir, java_dir, cobol_file)
+    assert not result.passed
+    assert result.to_critique().score == 0
+
+
+def test_missing_tags_fail(workspace, write_java):
+    cobol_dir, java_dir, cobol_file = workspace
+    write_java(java_target_dir(java_dir, cobol_file), body="public class A {}")
+    result = precheck_file(cobol_dir, java_dir, cobol_file)
+    assert any("@source" in error for error in result.errors)
+
+
+def test_full_coverage_passes(workspace, write_java):
+    cobol_dir, java_dir, cobol_file = workspace
+    paragraphs = cobol_paragraphs((cobol_dir / cobol_file).read_text())
+    write_java(java_target_dir(java_dir, cobol_file), body=tagged_java(cobol_dir, cobol_file, paragraphs))
+    result = precheck_file(cobol_dir, java_dir, cobol_file)
+    assert result.passed and not result.warnings
+    assert result.coverage == 1.0
+
+
+def test_partial_coverage_warns_or_fails(workspace, monkeypatch, write_java):
+    cobol_dir, java_dir, cobol_file = workspace
+    paragraphs = cobol_paragraphs((cobol_dir / cobol_file).read_text())
+    write_java(java_target_dir(java_dir, cobol_file), body=tagged_java(cobol_dir, cobol_file, paragraphs[:2]))
+
+    result = precheck_file(cobol_dir, java_dir, cobol_file)
+    assert result.passed
+    assert "3000-TERMINATE" in result.warnings[0]
+
+    monkeypatch.setattr(openhandLoop, "PRECHECK_MIN_COVERAGE", 0.9)
+    assert not precheck_file(cobol_dir, java_dir, cobol_file).passed
+
+
+def test_out_of_range_and_foreign_tags_warn(workspace, write_java):
+    cobol_dir, java_dir, cobol_file = workspace
+    paragraphs = cobol_paragraphs((cobol_dir / cobol_file).read_text())
+    body = tagged_java(cobol_dir, cobol_file, paragraphs).replace(
+        "public class", "/** @source OTHER.cbl:1 @source " + cobol_file + ":9999 */ public class"
+    )
+    write_java(java_target_dir(java_dir, cobol_file), body=body)
+    warnings = precheck_file(cobol_dir, java_dir, cobol_file).warnings
+    assert any("其他程序" in w for w in warnings)
+    assert any("超出" in w for w in warnings)
+
+
+def test_precheck_report_round_trips_through_parser(workspace, tmp_path):
+    cobol_dir, java_dir, cobol_file = workspace
+    result = precheck_file(cobol_dir, java_dir, cobol_file)
+    report = tmp_path / "report.md"
+    write_precheck_report(result, report)
+    parsed = parse_file_critiques(report, [cobol_file])[cobol_file]
+    assert parsed.score == 0
+    assert parsed.issues == result.errors + result.warnings
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+pytest.importorskip("openhands")
+
+import openhandLoop  # noqa: E402
+from openhandLoop import (  # noqa: E402
+    FileCritique,
+    java_target_dir,
+    parse_file_critiques,
+    run_pipeline,
+    run_refactoring_phase,
+)
+
+
+def test_java_target_dir_is_one_package_per_program(tmp_path):
+    assert java_target_dir(tmp_path, "CUSTPROC.cbl") == tmp_path / "custproc"
+
+
+def test_parallel_refactoring_isolates_failures(tmp_path, monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_refactor(llm, workspace_dir, cobol_dir, java_dir, cobol_file, *args):
+        with lock:
+            calls.append(cobol_file)
+        if cobol_file == "B.cbl":
+            raise RuntimeError("boom")
+        return 1.0
+
+    monkeypatch.setattr(openhandLoop, "PARALLEL_REFACTOR", True)
+    monkeypatch.setattr(openhandLoop, "refactor_file", fake_refactor)
+    run_refactoring_phase(None, tmp_path, tmp_path, tmp_path, ["A.cbl", "B.cbl", "C.cbl"])
+    assert sorted(calls) == ["A.cbl", "B.cbl", "C.cbl"]
+
+
+REPORT = """# COBOL 到 Java 重构评审报告
+
+## 文件评估
+
+### CUSTPROC.cbl
+- **Java 文件**：CustomerProcessor.java
+- **文件得分**：95/100
+- **需要解决的问题**：
+  - 无
+
+### ACCTMGR.cbl
+- **Java 文件**：AccountManager.java
+- **文件得分**：72.5/100
+- **需要解决的问题**：
+  - 缺少 @source 标注
+  * 余额用了 double
+- **建议**：需要改进
+
+## 总体得分
+- **平均得分**：83.75
+"""
+
+
+def test_parse_file_critiques(tmp_path):
+    report = tmp_path / "critique.md"
+    report.write_text(REPORT)
+    parsed = parse_file_critiques(report, ["CUSTPROC.cbl", "ACCTMGR.cbl", "MISSING.cbl"])
+    assert set(parsed) == {"CUSTPROC.cbl", "ACCTMGR.cbl"}
+    assert parsed["CUSTPROC.cbl"] == FileCritique("CUSTPROC.cbl", 95.0, ["无"])
+    assert parsed["ACCTMGR.cbl"] == FileCritique(
+        "ACCTMGR.cbl", 72.5, ["缺少 @source 标注", "余额用了 double"]
+    )
+    assert parse_file_critiques(tmp_path / "absent.md", ["CUSTPROC.cbl"]) == {}
+
+
+def test_refactoring_passes_each_file_its_own_issues(tmp_path, monkeypatch):
+    issues = {}
+
+    def fake_refactor(llm, workspace_dir, cobol_dir, java_dir, cobol_file, critique_file, file_issues):
+        issues[cobol_file] = file_issues
+        return 1.0
+
+    monkeypatch.setattr(openhandLoop, "PARALLEL_REFACTOR", True)
+    monkeypatch.setattr(openhandLoop, "refactor_file", fake_refactor)
+    run_refactoring_phase(
+        None,
+        tmp_path,
+        tmp_path,
+        tmp_path,
+        ["A.cbl", "B.cbl"],
+        file_critiques={"A.cbl": FileCritique("A.cbl", 60, ["fix x"])},
+    )
+    assert issues == {"A.cbl": ["fix x"], "B.cbl": None}
+
+
+def test_pipeline_requeues_low_scores_with_their_issues(tmp_path, monkeypatch):
+    scores = {"A.cbl": [95], "B.cbl": [60, 80, 70]}
+    refactored = []
+
+    def fake_refactor(llm, workspace_dir, cobol_dir, java_dir, cobol_file, critique_file, file_issues):
+        refactored.append((cobol_file, file_issues))
+        return 0.0
+
+    def fake_critique(llm, workspace_dir, cobol_dir, java_dir, cobol_file, report_file):
+        score = scores[cobol_file].pop(0)
+        return FileCritique(cobol_file, score, [f"{cobol_file} {score}"]), 0.0
+
+    monkeypatch.setattr(openhandLoop, "PRECHECK", False, raising=False)
+    monkeypatch.setattr(openhandLoop, "MAX_ITERATIONS", 3)
+    monkeypatch.setattr(openhandLoop, "QUALITY_THRESHOLD", 90.0)
+    monkeypatch.setattr(openhandLoop, "refactor_file", fake_refactor)
+    monkeypatch.setattr(openhandLoop, "critique_single_file", fake_critique)
+
+    file_critiques = {}
+    attempts = run_pipeline(
+        None, tmp_path, tmp_path, tmp_path, tmp_path, ["A.cbl", "B.cbl"], file_critiques
+    )
+    assert attempts == {"A.cbl": 1, "B.cbl": 3}
+    assert [issues for name, issues in refactored if name == "B.cbl"] == [
+        None,
+        ["B.cbl 60"],
+        ["B.cbl 80"],
+    ]
+    assert file_critiques["B.cbl"].score == 70